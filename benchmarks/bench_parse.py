@@ -0,0 +1,47 @@
+#
+# Python library for Janssen MCM controller
+# Benchmark: reply parsing throughput
+#
+#   python benchmarks/bench_parse.py [n]
+#
+
+import sys
+import timeit
+
+import pyjanssen.response
+
+# captured replies
+REPLIES = [
+    ('POS','POS : 15423\nRVL : 1032411'),
+    ('STS','FAILSAFE STATE : 0x0\nSTATUS : 0x0'),
+    ('MOV','STATUS : 0x0'),
+    ('FBST','STATUS : 0x0\nENABLED : 1\nBUSY : 1\nPOS1 : 1200\nPOS2 : -340\nPOS3 : 0\nERR1 : 12\nERR2 : -3\nERR3 : 0'),
+    ]
+
+
+def legacy_break_up(stdout,conversions={}):
+    # the parser before per-command schemas
+    data = {}
+    for row in stdout.split('\n'):
+        items = row.split(':')
+        data[items[0].strip()] = items[1].strip() if items[0].strip() not in conversions else conversions[items[0].strip()](items[1].strip())
+    return data
+
+LEGACY_CONVERSIONS = {
+    'POS':{'POS':int,'RVL':int},
+    'FBST':{'ENABLED':int,'BUSY':int,'POS1':int,'POS2':int,'POS3':int,'ERR1':int,'ERR2':int,'ERR3':int},
+    }
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for command,stdout in REPLIES:
+        conversions = LEGACY_CONVERSIONS.get(command,{})
+        # best of several runs, as single runs are noisy at this scale
+        legacy = min(timeit.repeat(lambda: legacy_break_up(stdout,conversions),number=n,repeat=5))
+        schema = min(timeit.repeat(lambda: pyjanssen.response.parse(command,stdout),number=n,repeat=5))
+        print('{:5s} legacy {:9.0f}/s   schema {:9.0f}/s   {:5.2f}x'.format(command,n / legacy,n / schema,legacy / schema))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#
+# Python library for Janssen MCM controller
+# Benchmark suite against the emulated cacli
+#
+#   python benchmarks/bench_suite.py [--latency seconds] [--n count]
+#
+# latency:     per-command round trip for each command type
+# concurrency: commands per second with several threads sharing one
+#              dispatcher, and with one controller per thread
+# jitter:      deviation of deadline-scheduled POS polling from its period
+#
+
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+
+from pyjanssen import MCM
+from pyjanssen.emulator import make_fake_cacli
+
+COMMANDS = {
+    'POS':lambda m: m.get_position(1),
+    'STS':lambda m: m.get_status(1),
+    'MOV':lambda m: m.move(1,1,steps=1),
+    'INFO':lambda m: m.get_information(1),
+    }
+
+
+def percentile(values,p):
+    values = sorted(values)
+    return values[min(len(values) - 1,int(p / 100 * len(values)))]
+
+
+def bench_latency(exe,n):
+    print('latency (ms)    mean     p50     p99')
+    with MCM(exe=exe) as m:
+        for name,command in COMMANDS.items():
+            command(m)
+            times = []
+            for i in range(n):
+                start = time.perf_counter()
+                command(m)
+                times.append((time.perf_counter() - start) * 1000)
+            print('{:5s}        {:7.3f} {:7.3f} {:7.3f}'.format(name,
+                statistics.mean(times),percentile(times,50),percentile(times,99)))
+
+
+def run_threads(targets,n):
+    # targets: one callable per thread
+    threads = [threading.Thread(target=lambda f=f: [f() for i in range(n)]) for f in targets]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(targets) * n / (time.perf_counter() - start)
+
+
+def bench_concurrency(exe,n,threads=4):
+    print('throughput (commands/s, {} threads)'.format(threads))
+    with MCM(exe=exe,dispatcher=True) as m:
+        rate = run_threads([lambda: m.get_position(1)] * threads,n)
+    print('shared dispatcher   {:9.0f}'.format(rate))
+    instances = [MCM(device=i,exe=exe) for i in range(threads)]
+    rate = run_threads([lambda m=m: m.get_position(1) for m in instances],n)
+    for m in instances:
+        m.close()
+    print('one controller each {:9.0f}'.format(rate))
+
+
+def bench_jitter(exe,n,rate=100):
+    print('polling jitter at {} Hz (ms)  mean |error|   p99 |error|   missed'.format(rate))
+    period = 1 / rate
+    with MCM(exe=exe) as m:
+        m.get_position(1)
+        errors = []
+        missed = 0
+        start = time.perf_counter()
+        tick = 0
+        while tick < n:
+            deadline = start + tick * period
+            now = time.perf_counter()
+            if now < deadline:
+                time.sleep(deadline - now)
+            errors.append(abs(time.perf_counter() - deadline) * 1000)
+            m.get_position(1)
+            tick += 1
+            late = int((time.perf_counter() - start) / period) - tick + 1
+            if late > 0:
+                missed += late
+                tick += late
+    print('                             {:10.3f}   {:11.3f}   {:6d}'.format(
+        statistics.mean(errors),percentile(errors,99),missed))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency',type=float,default=0.0,help='emulated controller latency (s)')
+    parser.add_argument('--n',type=int,default=100,help='commands per measurement')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        exe = make_fake_cacli(directory,latency=args.latency)
+        bench_latency(exe,args.n)
+        bench_concurrency(exe,args.n)
+        bench_jitter(exe,args.n)
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,4 @@
 from pyjanssen.janssen_mcm import MCM, FORWARD, BACKWARD
+from pyjanssen.async_mcm import AsyncMCM
+from pyjanssen.batch import run_many
+from pyjanssen.fleet import Fleet
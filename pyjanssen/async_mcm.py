@@ -0,0 +1,349 @@
+#
+# Python library for Janssen MCM controller
+# asyncio client
+#
+
+import asyncio
+import contextvars
+import time
+
+import pyjanssen.errors
+import pyjanssen.settle
+import pyjanssen.transport
+from pyjanssen.janssen_mcm import MCM, _move_to_result, _servo_distance, _step_period, _stop_check
+
+
+class AsyncMCM(MCM):
+    '''
+    asyncio version of MCM: every method that talks to cacli is a coroutine
+
+    kwargs as MCM; transport is 'spawn' (asyncio.create_subprocess_exec per
+    command) or an object with a coroutine run(target,command_list). settings accessors (set_frequency,
+    steps, ...) are inherited unchanged.
+
+    use asyncio.wait_for for timeouts; a cancelled command kills its child
+
+    dispatcher and coalesce are not supported (CacliError): commands already
+    share one event loop, and batch() and discover() raise CacliError as
+    they run on threads; use run_many() or asyncio.gather instead
+    '''
+    def __init__(self,device=None,**kwargs):
+        transport = kwargs.pop('transport','spawn')
+        for option in ('dispatcher','coalesce'):
+            if kwargs.pop(option,False) not in (False,None):
+                raise pyjanssen.errors.CacliError('AsyncMCM does not support {}'.format(option))
+        super().__init__(device,**kwargs)
+        self.__transport = pyjanssen.transport.make_async_transport(transport,kwargs.get('exe','cacli.exe'))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self,*exc):
+        await self.close()
+
+    async def close(self):
+        '''
+        closes the transport
+        '''
+        close = getattr(self.__transport,'close',None)
+        if close is not None:
+            await close()
+        super().close()
+
+    async def _run(self,*command_list):
+        '''
+        arguments: *command_list
+        returns: parsed reply from cacli
+
+        timeouts, deadline() and retries behave as in MCM._run
+        '''
+        expires,retries = self._retry_policy(command_list)
+        attempt = 0
+        while True:
+            try:
+                return await self.__attempt(command_list,self._attempt_expiry(command_list,expires))
+            except pyjanssen.errors.CacliError as e:
+                attempt += 1
+                delay = self._retry_delay(e,attempt,retries,expires)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    async def __attempt(self,command_list,expires):
+        target,entry = self._begin(command_list)
+        start = time.perf_counter()
+        try:
+            if expires is None:
+                response = await self.__transport.run(target,command_list)
+            else:
+                response = await self.__transport.run(target,command_list,timeout=max(0.0,expires - time.monotonic()))
+        except BaseException as e:
+            if isinstance(e,pyjanssen.errors.CacliError):
+                self.invalidate_metadata()
+            self._fail(entry,e,start)
+            raise
+        return self._finish(response,entry)
+
+    async def _cached(self,key,*command_list):
+        cache = self._metadata()
+        if cache is None:
+            return await self._run(*command_list)
+        reply = cache.get(key)
+        if reply is None:
+            reply = await self._run(*command_list)
+            cache.put(key,reply)
+        return reply
+
+    async def submit(self,*command_list):
+        '''
+        arguments: *command_list
+        returns: parsed reply for a raw cacli command
+        '''
+        return await self._run(*command_list)
+
+    def batch(self,max_workers=None):
+        '''
+        not available on AsyncMCM (raises CacliError): use run_many or asyncio.gather
+        '''
+        raise pyjanssen.errors.CacliError('AsyncMCM has no batch(); use run_many() or asyncio.gather')
+
+    def discover(self,*args,**kwargs):
+        '''
+        not available on AsyncMCM (raises CacliError): use MCM.discover
+        '''
+        raise pyjanssen.errors.CacliError('AsyncMCM has no discover(); use MCM.discover')
+
+    async def run_many(self,command_lists,return_exceptions=False):
+        '''
+        arguments: command_lists, *return_exceptions (default False)
+        returns: list of parsed replies in submission order
+
+        runs raw commands such as [('POS','1','1'),('STS','2')] in order; as
+        with MCM.run_many the first error is raised once every command has
+        run, unless return_exceptions
+        '''
+        results = []
+        for command_list in command_lists:
+            try:
+                results.append(await self._run(*command_list))
+            except Exception as e:
+                results.append(e)
+        for result in results:
+            if isinstance(result,Exception) and not return_exceptions:
+                raise result
+        return results
+
+    async def move(self,address,direction,channel=1,**kwargs):
+        '''
+        arguments: address, direction, *channel (default 1), **kwargs
+        returns: dictionary of STATUS
+
+        kwargs: frequency, step_size, temperature, steps, profile
+        '''
+        self._parse_settings_kwargs(address,kwargs)
+        return await self._move(address,channel,direction,kwargs)
+
+    async def _move(self,address,channel,direction,kwargs):
+        self._is_servodrive(False,kwargs) #servodrive must be disabled
+        return await self._run(*self._move_command(address,channel,direction))
+
+    async def move_to(self,address,target,tolerance,channel=1,max_iterations=20,position=None,**kwargs):
+        '''
+        awaitable MCM.move_to
+        returns: dictionary of POS, ERROR, CONVERGED, ITERATIONS, STEPS, TIME, ABORTED
+        '''
+        start = time.perf_counter()
+        self._parse_settings_kwargs(address,kwargs)
+        self._is_servodrive(False,kwargs) #servodrive must be disabled
+        if position is None:
+            position = await self.get_position(address,channel,**kwargs)
+        iterations = 0
+        total_steps = 0
+        last = None
+        aborted = None
+        while abs(target - position) > tolerance and iterations < max_iterations and aborted is None:
+            direction,steps,rate = self._burst(address,channel,target - position,last)
+            await self._run(*self._move_command(address,channel,direction,steps))
+            new_position = await self.get_position(address,channel,**kwargs)
+            iterations += 1
+            total_steps += steps
+            aborted = self._burst_observed(direction,rate,new_position - position,target - position,last)
+            last = (steps,new_position - position,target - position)
+            position = new_position
+        return _move_to_result(target,position,tolerance,iterations,total_steps,start,aborted)
+
+    async def get_position(self,address,channel=1,tolerance=None,**kwargs):
+        '''
+        arguments: address, *channel (default 1), *tolerance
+        returns: position (integer)
+        '''
+        self._is_servodrive(False,kwargs) #servodrive must be disabled
+        if tolerance is not None and self.estimator is not None:
+            position = self.estimator.within((str(address),str(channel)),tolerance)
+            if position is not None:
+                return position
+        return (await self._run('POS',str(address),str(channel)))['POS']
+
+    async def get_position_raw(self,address,channel=1,**kwargs):
+        '''
+        arguments: address, *channel (default 1)
+        returns: raw encoder value (integer)
+        '''
+        self._is_servodrive(False,kwargs) #servodrive must be disabled
+        return (await self._run('POS',str(address),str(channel)))['RVL']
+
+    async def get_status(self,address,**kwargs):
+        '''
+        arguments: address
+        returns: dictionary of FAILSAFE STATE and STATUS
+        '''
+        self._is_servodrive(False,kwargs) #servodrive must be disabled
+        return await self._run('STS',str(address))
+
+    async def get_description(self,address,**kwargs):
+        '''
+        arguments: address
+        returns: dictionary of Version and Available Channels
+        '''
+        self._is_servodrive(False,kwargs) #servodrive must be disabled
+        return await self._cached(('DESC',str(address)),'DESC',str(address))
+
+    async def get_information(self,address,channel='1',**kwargs):
+        '''
+        arguments: address, *channel (default 1)
+        returns: dictionary of TYPE and TAG
+        '''
+        self._is_servodrive(False,kwargs) #servodrive must be disabled
+        return await self._cached(('INFO',str(address),str(channel)),'INFO',str(address),str(channel))
+
+    async def stop(self,address,**kwargs):
+        '''
+        arguments: address
+        returns: dictionary of STATUS
+        '''
+        self._is_servodrive(False,kwargs) #servodrive must be disabled
+        return await self._run('STP',str(address))
+
+    async def select_analogue_input(self,address,direction,channel=1,**kwargs):
+        '''
+        arguments: address, direction, *channel (default 1), **kwargs
+        returns: dictionary of STATUS
+        '''
+        self._parse_settings_kwargs(address,kwargs)
+        return await self._run(*self._analogue_command(address,channel,direction))
+
+    async def reset_position(self,address,channel=1,**kwargs):
+        '''
+        arguments: address, *channel (default 1)
+        returns: string
+        '''
+        self._is_servodrive(False,kwargs) #servodrive must be disabled
+        return await self._run('RST',str(address),str(channel))
+
+    async def autocalibrate(self,address,channel,progress=None,prompts=None,timeout=600,**kwargs):
+        '''
+        awaitable MCM.autocalibrate; the dialogue runs on a worker thread and
+        progress is called from there. an enclosing deadline() applies
+        '''
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(None,context.run,
+                lambda: MCM.autocalibrate(self,address,channel,progress,prompts,timeout,**kwargs))
+
+    async def autocalibrate_all(self,axes,progress=None,return_exceptions=False,**kwargs):
+        '''
+        awaitable MCM.autocalibrate_all; the axes are calibrated one after another
+        returns: dictionary of (address, channel): autocalibrate reply
+        '''
+        results = {}
+        for axis in axes:
+            axis = tuple(axis)
+            try:
+                results[axis] = await self.autocalibrate(axis[0],axis[1],progress,**kwargs)
+            except Exception as e:
+                results[axis] = e
+        for reply in results.values():
+            if isinstance(reply,Exception) and not return_exceptions:
+                raise reply
+        return results
+
+    async def enable_servodrive(self,pgain=300,**kwargs):
+        '''
+        arguments: *pgain (default 300)
+        returns: dictionary of STATUS
+        '''
+        return await self._run(*self._enable_servodrive_command(pgain,kwargs))
+
+    async def disable_servodrive(self):
+        '''
+        returns: dictionary of STATUS
+        '''
+        self._set_servodrive(False)
+        return await self._run('FBXT')
+
+    async def servodrive_go_to(self,pos1=0,pos2=0,pos3=0,**kwargs):
+        '''
+        arguments: *pos1, *pos2, *pos3 (set 0 if not connected)
+        returns: dictionary of STATUS
+        '''
+        self._is_servodrive(True,kwargs)
+        return await self._run('FBCS',str(pos1),str(pos2),str(pos3))
+
+    async def servodrive_emergency_stop(self,**kwargs):
+        '''
+        returns: dictionary of STATUS
+        '''
+        self._is_servodrive(True,kwargs)
+        return await self._run('FBES')
+
+    async def servodrive_find_end_stops(self,direction,filter,zero,**kwargs):
+        '''
+        arguments: direction, filter, zero
+        returns: dictionary of STATUS
+        '''
+        self._is_servodrive(True,kwargs)
+        return await self._run('FBFE',str(direction),str(filter),str(int(zero)))
+
+    async def servodrive_status_position(self,**kwargs):
+        '''
+        returns: dictionary of STATUS, ENABLED, BUSY, POS1, POS2, POS3, ERR1, ERR2, ERR3
+        '''
+        self._is_servodrive(True,kwargs)
+        return await self._run('FBST')
+
+    async def wait_until_settled(self,tolerance=0,timeout=30,expected=None,min_interval=0.005,max_interval=0.25,**kwargs):
+        '''
+        awaitable MCM.wait_until_settled
+        returns: dictionary of SETTLED, TIME, POLLS and STATUS (last FBST reply)
+        '''
+        self._is_servodrive(True,kwargs)
+        poller = pyjanssen.settle.AdaptivePoller(min_interval,max_interval,expected)
+        start = time.perf_counter()
+        polls = 0
+        while True:
+            status = await self._run('FBST')
+            polls += 1
+            elapsed = time.perf_counter() - start
+            distance = _servo_distance(status,tolerance)
+            if distance == 0 or elapsed >= timeout:
+                return {'SETTLED':distance == 0,'TIME':elapsed,'POLLS':polls,'STATUS':status}
+            await asyncio.sleep(min(poller.next(distance,elapsed),timeout - elapsed))
+
+    async def wait_until_stopped(self,address,channel=1,tolerance=0,timeout=30,min_interval=0.005,max_interval=0.25,**kwargs):
+        '''
+        awaitable MCM.wait_until_stopped
+        returns: dictionary of STOPPED, TIME, POLLS and POS
+        '''
+        self._is_servodrive(False,kwargs) #servodrive must be disabled
+        poller = pyjanssen.settle.AdaptivePoller(min_interval,max_interval)
+        period = _step_period(self.frequency(address))
+        start = time.perf_counter()
+        previous = None
+        polls = 0
+        while True:
+            position = (await self._run('POS',str(address),str(channel)))['POS']
+            polls += 1
+            elapsed = time.perf_counter() - start
+            delay,previous,stopped = _stop_check(poller,previous,position,elapsed,tolerance,period,min_interval)
+            if stopped or elapsed >= timeout:
+                return {'STOPPED':stopped,'TIME':elapsed,'POLLS':polls,'POS':position}
+            await asyncio.sleep(min(delay,timeout - elapsed))
@@ -0,0 +1,139 @@
+#
+# Python library for Janssen MCM controller
+# Batched commands across one or more controllers
+#
+
+import concurrent.futures
+
+
+class Batch:
+    '''
+    collects commands for one or more MCM instances and runs them as one unit
+
+    commands for the same target (device/@SERV argument) run in submission
+    order on one thread; different targets run concurrently. every add()
+    returns a Future that is completed by run(); run() returns the results
+    in submission order. used as a context manager, the batch runs on exit.
+    '''
+    def __init__(self,mcm=None,max_workers=None):
+        self.mcm = mcm
+        self.max_workers = max_workers
+        self.__requests = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,*exc):
+        if exc_type is None:
+            self.run()
+
+    def __len__(self):
+        return len(self.__requests)
+
+    def add(self,*command_list,mcm=None,key=None):
+        '''
+        arguments: *command_list, *mcm, *key
+        returns: Future of the parsed reply
+
+        mcm defaults to the instance the batch was created for; key selects
+        one field of the parsed reply (e.g. 'POS')
+        '''
+        mcm = mcm or self.mcm
+        assert mcm is not None
+        future = concurrent.futures.Future()
+        self.__requests.append((mcm,tuple(command_list),key,future))
+        return future
+
+    def move(self,address,direction,channel=1,mcm=None,**kwargs):
+        '''
+        arguments: address, direction, *channel (default 1), *mcm, **kwargs
+        returns: Future of dictionary of STATUS
+
+        kwargs: frequency, step_size, temperature, steps, profile, force
+        (settings are applied when the move is added)
+        '''
+        mcm = mcm or self.mcm
+        mcm._parse_settings_kwargs(address,kwargs)
+        mcm._is_servodrive(False,kwargs)
+        return self.add(*mcm._move_command(address,channel,direction),mcm=mcm)
+
+    def get_position(self,address,channel=1,mcm=None,**kwargs):
+        '''
+        returns: Future of position (integer)
+        '''
+        (mcm or self.mcm)._is_servodrive(False,kwargs)
+        return self.add('POS',str(address),str(channel),mcm=mcm,key='POS')
+
+    def get_position_raw(self,address,channel=1,mcm=None,**kwargs):
+        '''
+        returns: Future of raw encoder value (integer)
+        '''
+        (mcm or self.mcm)._is_servodrive(False,kwargs)
+        return self.add('POS',str(address),str(channel),mcm=mcm,key='RVL')
+
+    def get_status(self,address,mcm=None,**kwargs):
+        '''
+        returns: Future of dictionary of FAILSAFE STATE and STATUS
+        '''
+        (mcm or self.mcm)._is_servodrive(False,kwargs)
+        return self.add('STS',str(address),mcm=mcm)
+
+    def get_information(self,address,channel='1',mcm=None,**kwargs):
+        '''
+        returns: Future of dictionary of TYPE and TAG
+        '''
+        (mcm or self.mcm)._is_servodrive(False,kwargs)
+        return self.add('INFO',str(address),str(channel),mcm=mcm)
+
+    def run(self,return_exceptions=False):
+        '''
+        arguments: *return_exceptions (default False)
+        returns: list of results in submission order
+
+        if return_exceptions is False the first error (in submission order)
+        is raised once every command has finished; otherwise exceptions are
+        returned in place of results
+        '''
+        requests,self.__requests = self.__requests,[]
+        groups = {}
+        for request in requests:
+            groups.setdefault(tuple(request[0]._target()),[]).append(request)
+        if len(groups) == 1:
+            for group in groups.values():
+                _run_group(group)
+        elif len(groups) > 1:
+            with concurrent.futures.ThreadPoolExecutor(self.max_workers or len(groups)) as pool:
+                list(pool.map(_run_group,groups.values()))
+        results = []
+        for mcm,command_list,key,future in requests:
+            error = future.exception()
+            if error is not None and not return_exceptions:
+                raise error
+            results.append(error if error is not None else future.result())
+        return results
+
+
+def _run_group(group):
+    # commands for one target, strictly in order
+    for mcm,command_list,key,future in group:
+        if not future.set_running_or_notify_cancel():
+            continue
+        try:
+            reply = mcm._run(*command_list)
+            future.set_result(reply if key is None else reply[key])
+        except Exception as e:
+            future.set_exception(e)
+
+
+def run_many(requests,return_exceptions=False,max_workers=None):
+    '''
+    arguments: requests, *return_exceptions, *max_workers
+    returns: list of parsed replies in submission order
+
+    requests is a sequence of (mcm, *command_list) tuples, e.g.
+    [(m1,'POS','1','1'), (m2,'POS','1','1')]
+    '''
+    batch = Batch(max_workers=max_workers)
+    for request in requests:
+        batch.add(*request[1:],mcm=request[0])
+    return batch.run(return_exceptions)
@@ -0,0 +1,382 @@
+#
+# Python library for Janssen MCM controller
+# Broker daemon sharing one controller between processes
+#
+# the broker owns the cacli transport and serves clients over a Unix domain
+# socket; clients use BrokerMCM exactly like MCM:
+#
+#   python -m pyjanssen.broker --exe cacli.exe --socket /tmp/pyjanssen.sock
+#   m = BrokerMCM(socket_path='/tmp/pyjanssen.sock')
+#
+# frames are a 4-byte big-endian length followed by a JSON array:
+#   request:  [id, target, command_list, timeout]
+#   reply:    [id, returncode, stdout, stderr, spawn_time, wait_time]
+#   failure:  [id, None, message, 'error' or 'timeout']
+# replies are raw cacli output; clients parse them with pyjanssen.response
+#
+
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+import pyjanssen.dispatcher
+import pyjanssen.singleflight
+import pyjanssen.transport
+from pyjanssen.errors import CacliError, CacliTimeout
+from pyjanssen.janssen_mcm import MCM
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(),'pyjanssen-broker.sock')
+
+_HEADER = struct.Struct('>I')
+
+
+def _send_frame(sock,message):
+    payload = json.dumps(message,separators=(',',':')).encode()
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _read_exactly(stream,size):
+    data = stream.read(size)
+    if len(data) < size:
+        raise EOFError
+    return data
+
+
+def _read_frame(stream):
+    size, = _HEADER.unpack(_read_exactly(stream,_HEADER.size))
+    return json.loads(_read_exactly(stream,size).decode())
+
+
+class Broker:
+    '''
+    serves cacli commands from many client processes through one transport
+
+    arguments: *exe, *socket_path, **kwargs
+
+    kwargs:
+        transport: 'spawn' (default) or a transport object
+        mode: permissions of the socket file (default 0o600: only the
+            user running the broker may connect and move the stages)
+        freshness: seconds a read-only reply is shared with later clients
+            (default 0: only identical reads in flight at the same time share)
+        poll_interval: minimum spacing of POS/FBST/STS per target (default 0)
+        max_requests: requests handled concurrently (default 32)
+
+    commands from all clients go through one priority Dispatcher, so STP,
+    FBES and FBXT overtake queued reads (they skip the max_requests pool
+    too); identical read-only commands are coalesced across clients
+
+    raises CacliError if another broker is serving socket_path; a socket
+    file left behind by a broker that died is replaced
+    '''
+    def __init__(self,exe='cacli.exe',socket_path=DEFAULT_SOCKET,**kwargs):
+        _claim_socket(socket_path)
+        self.exe = exe
+        self.socket_path = socket_path
+        self.__transport = pyjanssen.transport.make_transport(kwargs.get('transport','spawn'),exe)
+        self.__dispatcher = pyjanssen.dispatcher.Dispatcher('pyjanssen-broker',
+                poll_interval=kwargs.get('poll_interval',0.0))
+        self.__singleflight = pyjanssen.singleflight.SingleFlight(kwargs.get('freshness',0.0))
+        self.__pool = concurrent.futures.ThreadPoolExecutor(kwargs.get('max_requests',32),
+                thread_name_prefix='pyjanssen-broker')
+        self.__thread = None
+        self.__lock = threading.Lock()
+        self.clients = 0
+        self.requests = 0
+        broker = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                broker._serve(self.connection,self.rfile)
+
+        mode = kwargs.get('mode',0o600)
+        # no wider than mode from the moment it exists, then exactly mode
+        umask = os.umask(0o777 & ~mode)
+        try:
+            self.server = socketserver.ThreadingUnixStreamServer(socket_path,Handler)
+        finally:
+            os.umask(umask)
+        os.chmod(socket_path,mode)
+        self.server.daemon_threads = True
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def start(self):
+        '''
+        returns: self, serving on a background thread
+        '''
+        self.__thread = threading.Thread(target=self.server.serve_forever,name='pyjanssen-broker-server',daemon=True)
+        self.__thread.start()
+        return self
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def close(self):
+        '''
+        stops serving, finishes queued commands and closes the transport
+        '''
+        if self.__thread is not None:
+            self.server.shutdown()
+        self.server.server_close()
+        self.__pool.shutdown()
+        self.__dispatcher.close()
+        close = getattr(self.__transport,'close',None)
+        if close is not None:
+            close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def stats(self):
+        '''
+        returns: dictionary of clients, requests, coalescing (executed,
+        coalesced, reused) and scheduler (depth, wait, cancelled)
+        '''
+        return {'clients':self.clients,
+            'requests':self.requests,
+            'coalescing':self.__singleflight.stats(),
+            'scheduler':self.__dispatcher.stats()}
+
+    def _serve(self,connection,stream):
+        # one client connection: requests may be pipelined, replies carry their id
+        lock = threading.Lock()
+        with self.__lock:
+            self.clients += 1
+        try:
+            while True:
+                try:
+                    request = _read_frame(stream)
+                except (EOFError,OSError,ValueError):
+                    return
+                with self.__lock:
+                    self.requests += 1
+                args = (connection,lock,request,time.monotonic())
+                if _priority(request) == pyjanssen.dispatcher.SAFETY:
+                    # a stop must not wait for a pool thread behind queued reads
+                    threading.Thread(target=self._answer,args=args,name='pyjanssen-broker-stop',daemon=True).start()
+                else:
+                    self.__pool.submit(self._answer,*args)
+        finally:
+            with self.__lock:
+                self.clients -= 1
+
+    def _answer(self,connection,lock,request,received):
+        id,target,command_list,timeout = request
+        try:
+            response = self._execute(target,command_list,None if timeout is None else received + timeout)
+            reply = [id,response.returncode,response.stdout,response.stderr,response.spawn_time,response.wait_time]
+        except CacliTimeout as e:
+            reply = [id,None,str(e.error),'timeout']
+        except BaseException as e:
+            reply = [id,None,str(getattr(e,'error',e)),'error']
+        try:
+            with lock:
+                _send_frame(connection,reply)
+        except OSError:
+            pass # client went away
+
+    def _execute(self,target,command_list,expires):
+        # read-only commands share one execution; anything else invalidates.
+        # expires (time.monotonic()) covers the time spent queued here too
+        key = (tuple(target),tuple(command_list))
+        run = lambda: self.__dispatcher.schedule(self.__run,(target,command_list,expires),
+                priority=pyjanssen.dispatcher.command_priority(command_list),
+                controller=tuple(target)).result()
+        if command_list and command_list[0] in pyjanssen.singleflight.READ_ONLY:
+            response = self.__singleflight.do(key,run,None if expires is None else max(0.0,expires - time.monotonic()))
+            if response.returncode != 0:
+                # an error is not worth reusing
+                self.__singleflight.invalidate()
+            return response
+        self.__singleflight.invalidate()
+        try:
+            return run()
+        finally:
+            self.__singleflight.invalidate()
+
+    def __run(self,target,command_list,expires):
+        if expires is None:
+            return self.__transport.run(target,command_list)
+        timeout = expires - time.monotonic()
+        if timeout <= 0:
+            raise CacliTimeout('deadline expired while {} was queued in the broker'.format(' '.join(command_list)))
+        return self.__transport.run(target,command_list,timeout=timeout)
+
+
+def _claim_socket(socket_path):
+    # removes a socket file nobody is listening on; refuses a live broker's
+    # socket and anything that is not a socket
+    try:
+        mode = os.stat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise CacliError('{} exists and is not a socket'.format(socket_path))
+    sock = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        os.unlink(socket_path) # left by a broker that died
+        return
+    finally:
+        sock.close()
+    raise CacliError('a broker is already serving {}'.format(socket_path))
+
+def _priority(request):
+    # dispatcher priority of a request frame (malformed ones fail in _answer)
+    try:
+        return pyjanssen.dispatcher.command_priority(request[2])
+    except (IndexError,TypeError):
+        return pyjanssen.dispatcher.NORMAL
+
+
+class BrokerTransport:
+    '''
+    client transport sending commands to a Broker; thread-safe and
+    pipelined over a single connection, reconnecting after a failure
+    '''
+    def __init__(self,socket_path=DEFAULT_SOCKET,exe='cacli.exe'):
+        self.socket_path = socket_path
+        self.exe = exe
+        self.__ids = itertools.count()
+        self.__lock = threading.Lock()
+        self.__socket = None
+        self.__pending = {}
+
+    def __connect(self):
+        # with the lock held
+        if self.__socket is None:
+            sock = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+            try:
+                sock.connect(self.socket_path)
+            except OSError as e:
+                sock.close()
+                raise CacliError('cannot reach broker at {} ({})'.format(self.socket_path,e))
+            self.__socket = sock
+            threading.Thread(target=self.__read,args=(sock,),name='pyjanssen-broker-client',daemon=True).start()
+        return self.__socket
+
+    def __read(self,sock):
+        stream = sock.makefile('rb')
+        try:
+            while True:
+                reply = _read_frame(stream)
+                with self.__lock:
+                    future,_ = self.__pending.pop(reply[0],(None,None))
+                if future is not None:
+                    future.set_result(reply)
+        except (EOFError,OSError,ValueError):
+            pass
+        with self.__lock:
+            if self.__socket is sock:
+                self.__socket = None
+            lost = [id for id,(future,owner) in self.__pending.items() if owner is sock]
+            pending = [self.__pending.pop(id)[0] for id in lost]
+        for future in pending:
+            future.set_exception(CacliError('connection to broker at {} lost'.format(self.socket_path)))
+        sock.close()
+
+    def run(self,target,command_list,timeout=None):
+        '''
+        arguments: target, command_list, *timeout
+        returns: Reply
+        '''
+        future = concurrent.futures.Future()
+        with self.__lock:
+            sock = self.__connect()
+            id = next(self.__ids)
+            self.__pending[id] = (future,sock)
+            try:
+                _send_frame(sock,[id,list(target),list(command_list),timeout])
+            except OSError as e:
+                del self.__pending[id]
+                raise CacliError('connection to broker at {} lost ({})'.format(self.socket_path,e))
+        try:
+            # also covers time spent queued in the broker
+            reply = future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            with self.__lock:
+                self.__pending.pop(id,None)
+            raise CacliTimeout('{} got no reply from the broker within {:.3g} s'.format(' '.join(command_list),timeout))
+        if reply[1] is None:
+            if reply[3] == 'timeout':
+                raise CacliTimeout(reply[2])
+            raise CacliError(reply[2])
+        return pyjanssen.transport.Reply([self.exe] + list(target) + list(command_list),*reply[1:])
+
+    def close(self):
+        with self.__lock:
+            sock,self.__socket = self.__socket,None
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+            sock.close()
+
+
+class BrokerMCM(MCM):
+    '''
+    drop-in replacement for MCM that sends commands to a Broker instead of
+    running cacli itself
+
+    arguments: *device, *socket_path, **kwargs (as MCM except transport)
+
+    the broker shares read-only replies between clients, so coalesce and
+    metadata_cache are rarely needed here
+    '''
+    def __init__(self,device=None,socket_path=DEFAULT_SOCKET,**kwargs):
+        kwargs['transport'] = BrokerTransport(socket_path,kwargs.get('exe','cacli.exe'))
+        super().__init__(device,**kwargs)
+
+    def _check_cacli(self):
+        '''
+        cacli runs on the broker's side: nothing to check
+        '''
+        pass
+
+    def autocalibrate(self,address,channel,*args,**kwargs):
+        '''
+        not available: OEMC is an interactive dialogue with a cacli process
+        of its own, which the broker does not relay. stop the broker and run
+        it with MCM on the broker's machine
+        '''
+        raise CacliError('OEMC {} {} cannot run through the broker'.format(address,channel))
+
+
+def main(argv=None):
+    '''
+    command line entry point: python -m pyjanssen.broker --exe cacli.exe
+    '''
+    parser = argparse.ArgumentParser(prog='python -m pyjanssen.broker',description='share one MCM controller between processes')
+    parser.add_argument('--exe',default='cacli.exe',help='path to cacli.exe')
+    parser.add_argument('--socket',default=DEFAULT_SOCKET,help='Unix socket path (default %(default)s)')
+    parser.add_argument('--freshness',type=float,default=0.0,help='seconds read replies are shared')
+    parser.add_argument('--poll-interval',type=float,default=0.0,help='minimum spacing of polls per target')
+    parser.add_argument('--mode',type=lambda text: int(text,8),default=0o600,
+            help='octal permissions of the socket file (default 600: only this user)')
+    args = parser.parse_args(argv)
+    broker = Broker(args.exe,args.socket,
+            freshness=args.freshness,poll_interval=args.poll_interval,mode=args.mode)
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
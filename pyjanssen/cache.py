@@ -0,0 +1,70 @@
+#
+# Python library for Janssen MCM controller
+# TTL cache for static module metadata
+#
+
+import threading
+import time
+
+
+class TTLCache:
+    '''
+    thread-safe cache with a time-to-live per entry and hit/miss counters
+
+    ttl: default lifetime in seconds; None keeps entries until invalidated
+    '''
+    def __init__(self,ttl=None,clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.__entries = {}
+        self.__lock = threading.Lock()
+
+    def get(self,key,default=None):
+        '''
+        arguments: key, *default
+        returns: cached value, or default if missing or expired
+        '''
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                value,expires = entry
+                if expires is None or expires > self.clock():
+                    self.hits += 1
+                    return value
+                del self.__entries[key]
+            self.misses += 1
+            return default
+
+    def put(self,key,value,ttl=None):
+        '''
+        arguments: key, value, *ttl (default: the cache ttl)
+        '''
+        ttl = self.ttl if ttl is None else ttl
+        with self.__lock:
+            self.__entries[key] = (value,None if ttl is None else self.clock() + ttl)
+
+    def invalidate(self,match=None):
+        '''
+        arguments: *match
+
+        removes entries whose key starts with the tuple match, or everything
+        if match is None
+        '''
+        with self.__lock:
+            if match is None:
+                self.__entries.clear()
+                return
+            match = tuple(match)
+            for key in [key for key in self.__entries if key[:len(match)] == match]:
+                del self.__entries[key]
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def stats(self):
+        '''
+        returns: dictionary of hits, misses and entries
+        '''
+        return {'hits':self.hits,'misses':self.misses,'entries':len(self)}
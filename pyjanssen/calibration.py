@@ -0,0 +1,205 @@
+#
+# Python library for Janssen MCM controller
+# Persistent per-axis step-response calibration
+#
+
+import sqlite3
+import threading
+import time
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS observations (
+    device TEXT, address TEXT, channel TEXT, direction INTEGER,
+    profile TEXT, temperature REAL, frequency REAL, step_size REAL,
+    steps INTEGER, displacement REAL, time REAL);
+CREATE TABLE IF NOT EXISTS models (
+    device TEXT, address TEXT, channel TEXT, direction INTEGER,
+    profile TEXT, temperature REAL, frequency REAL, step_size REAL,
+    n INTEGER, sxx REAL, sxy REAL, syy REAL,
+    PRIMARY KEY (device, address, channel, direction, profile, temperature, frequency, step_size));
+'''
+
+
+class CalibrationStore:
+    '''
+    records observed encoder displacement per MOV command, keyed by axis
+    (device, address, channel), direction and the move settings (profile,
+    temperature, frequency, step_size), and fits encoder counts per step
+
+    arguments: *path (default ':memory:'), path of the SQLite file
+
+    for each key the model is a least-squares fit of displacement = k * steps;
+    at a temperature with no observations k is interpolated linearly between
+    the nearest calibrated temperatures with the same profile, frequency and
+    step_size (the step size changes strongly during cooldown)
+
+    MCM reports every MOV (moved) and POS reply (observed) to its store and
+    sizes move_to bursts and position estimates from the fits, so there is
+    one model of counts per step per MCM
+    '''
+    def __init__(self,path=':memory:'):
+        self.path = path
+        self.__pending = {}
+        self.__lock = threading.Lock()
+        self.__db = sqlite3.connect(path,check_same_thread=False)
+        with self.__lock,self.__db:
+            self.__db.executescript(_SCHEMA)
+
+    def close(self):
+        with self.__lock:
+            self.__db.close()
+
+    def _key(self,axis,settings,direction):
+        device,address,channel = axis
+        return ('' if device is None else str(device),str(address),str(channel),int(direction),
+            str(settings['profile']),float(settings['temperature']),
+            float(settings['frequency']),float(settings['step_size']))
+
+    def record(self,axis,settings,direction,steps,displacement):
+        '''
+        arguments: axis, settings, direction, steps, displacement
+
+        axis is (device, address, channel); settings is a dictionary with
+        profile, temperature, frequency and step_size; displacement is the
+        signed change in encoder position caused by steps
+        '''
+        if steps <= 0:
+            return
+        key = self._key(axis,settings,direction)
+        x,y = float(steps),float(displacement)
+        with self.__lock,self.__db:
+            self.__db.execute('INSERT INTO observations VALUES (?,?,?,?,?,?,?,?,?,?,?)',
+                key + (int(steps),y,time.time()))
+            self.__db.execute('''INSERT INTO models VALUES (?,?,?,?,?,?,?,?,1,?,?,?)
+                ON CONFLICT (device, address, channel, direction, profile, temperature, frequency, step_size)
+                DO UPDATE SET n = n + 1, sxx = sxx + excluded.sxx, sxy = sxy + excluded.sxy, syy = syy + excluded.syy''',
+                key + (x * x,x * y,y * y))
+
+    def moved(self,axis,settings,direction,steps):
+        '''
+        arguments: axis, settings, direction, steps
+
+        notes a MOV of axis; its displacement is recorded at the next reading
+        (observed) if every move since the previous reading used the same
+        settings and direction
+        '''
+        key = self._key(axis,settings,direction)
+        with self.__lock:
+            pending = self.__pending.get(tuple(axis))
+            if pending is not None:
+                pending['moves'].append((key,settings,int(direction),int(steps)))
+
+    def observed(self,axis,position):
+        '''
+        arguments: axis, position
+
+        takes an encoder reading (POS) of axis and records the displacement
+        since the previous reading against the moves made in between
+        '''
+        with self.__lock:
+            pending = self.__pending.get(tuple(axis))
+            self.__pending[tuple(axis)] = {'position':position,'moves':[]}
+        if pending is None or not pending['moves'] or len({move[0] for move in pending['moves']}) != 1:
+            return
+        key,settings,direction,steps = pending['moves'][0]
+        steps = sum(move[3] for move in pending['moves'])
+        displacement = position - pending['position']
+        if displacement * (1 if direction else -1) <= 0:
+            # too small to register, or not motion caused by the moves
+            return
+        self.record(axis,settings,direction,steps,displacement)
+
+    def interrupted(self,axis=None,position=None):
+        '''
+        arguments: *axis, *position
+
+        drops the moves since the last reading of axis (or of every axis)
+        without learning from them, e.g. after STP or motion the store cannot
+        attribute to MOV steps; position is the new reading if it is known
+        (0 after RST)
+        '''
+        with self.__lock:
+            if axis is None:
+                self.__pending.clear()
+            elif position is None:
+                self.__pending.pop(tuple(axis),None)
+            else:
+                self.__pending[tuple(axis)] = {'position':position,'moves':[]}
+
+    def model(self,axis,settings,direction):
+        '''
+        arguments: axis, settings, direction
+        returns: dictionary of COUNTS_PER_STEP, N, RESIDUAL, INTERPOLATED, or None if uncalibrated
+
+        RESIDUAL is the rms deviation from the fit in counts per step
+        '''
+        key = self._key(axis,settings,direction)
+        with self.__lock:
+            row = self.__db.execute('''SELECT n, sxx, sxy, syy FROM models WHERE device=? AND address=?
+                AND channel=? AND direction=? AND profile=? AND temperature=? AND frequency=? AND step_size=?''',
+                key).fetchone()
+            if row is not None:
+                return _fit(*row)
+            rows = self.__db.execute('''SELECT temperature, n, sxx, sxy, syy FROM models WHERE device=?
+                AND address=? AND channel=? AND direction=? AND profile=? AND frequency=? AND step_size=?
+                ORDER BY temperature''',key[:5] + key[6:]).fetchall()
+        if not rows:
+            return None
+        temperature = key[5]
+        below = [row for row in rows if row[0] < temperature]
+        above = [row for row in rows if row[0] > temperature]
+        if not below or not above:
+            # outside the calibrated range: use the nearest temperature
+            model = _fit(*(above[0] if not below else below[-1])[1:])
+        else:
+            low,high = below[-1],above[0]
+            low_fit,high_fit = _fit(*low[1:]),_fit(*high[1:])
+            weight = (temperature - low[0]) / (high[0] - low[0])
+            model = {'COUNTS_PER_STEP':low_fit['COUNTS_PER_STEP'] + weight * (high_fit['COUNTS_PER_STEP'] - low_fit['COUNTS_PER_STEP']),
+                'N':low_fit['N'] + high_fit['N'],
+                'RESIDUAL':max(low_fit['RESIDUAL'],high_fit['RESIDUAL'])}
+        model['INTERPOLATED'] = True
+        return model
+
+    def predict_displacement(self,axis,settings,direction,steps):
+        '''
+        arguments: axis, settings, direction, steps
+        returns: predicted signed displacement, or None if uncalibrated
+        '''
+        model = self.model(axis,settings,direction)
+        if model is None:
+            return None
+        return model['COUNTS_PER_STEP'] * steps
+
+    def predict_steps(self,axis,settings,direction,displacement):
+        '''
+        arguments: axis, settings, direction, displacement
+        returns: number of steps expected to move by displacement, or None if uncalibrated
+        '''
+        model = self.model(axis,settings,direction)
+        if model is None or model['COUNTS_PER_STEP'] == 0:
+            return None
+        return max(0,int(round(abs(displacement / model['COUNTS_PER_STEP']))))
+
+    def forget(self,axis=None):
+        '''
+        arguments: *axis
+
+        deletes observations and models for axis, or everything
+        '''
+        with self.__lock,self.__db:
+            if axis is None:
+                self.__db.execute('DELETE FROM observations')
+                self.__db.execute('DELETE FROM models')
+                return
+            device,address,channel = axis
+            params = ('' if device is None else str(device),str(address),str(channel))
+            self.__db.execute('DELETE FROM observations WHERE device=? AND address=? AND channel=?',params)
+            self.__db.execute('DELETE FROM models WHERE device=? AND address=? AND channel=?',params)
+
+
+def _fit(n,sxx,sxy,syy):
+    # least squares through the origin: k = sxy / sxx
+    k = sxy / sxx
+    residual = max(0.0,(syy - 2 * k * sxy + k * k * sxx) / n) ** 0.5
+    return {'COUNTS_PER_STEP':k,'N':n,'RESIDUAL':residual / (sxx / n) ** 0.5,'INTERPOLATED':False}
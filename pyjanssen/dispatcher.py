@@ -0,0 +1,211 @@
+#
+# Python library for Janssen MCM controller
+# Serialized command dispatcher
+#
+
+import heapq
+import itertools
+import threading
+import time
+import concurrent.futures
+
+from pyjanssen.errors import CacliCancelled
+from pyjanssen.journal import LatencyHistogram
+
+# priorities, lowest value runs first
+SAFETY = 0
+NORMAL = 1
+POLL = 2
+PRIORITY_NAMES = {SAFETY:'safety',NORMAL:'normal',POLL:'poll'}
+
+# commands that stop motion and jump the queue
+SAFETY_COMMANDS = frozenset(('STP','FBES','FBXT'))
+# routine status/position reads
+POLL_COMMANDS = frozenset(('POS','FBST','STS'))
+
+
+def command_priority(command_list):
+    '''
+    arguments: command_list
+    returns: SAFETY, NORMAL or POLL
+    '''
+    command = command_list[0] if command_list else None
+    if command in SAFETY_COMMANDS:
+        return SAFETY
+    if command in POLL_COMMANDS:
+        return POLL
+    return NORMAL
+
+
+def _describe(item):
+    # the command of a queued MCM._execute call, for messages
+    if item.args and all(isinstance(arg,str) for arg in item.args):
+        return ' '.join(item.args)
+    return 'queued read'
+
+
+class _Item:
+    __slots__ = ('future','fn','args','kwargs','priority','controller','queued')
+
+    def __init__(self,future,fn,args,kwargs,priority,controller):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.controller = controller
+        self.queued = time.perf_counter()
+
+
+class Dispatcher:
+    '''
+    runs submitted work one item at a time on a single worker thread, so
+    any number of threads can share one controller; each caller receives a
+    concurrent.futures.Future and blocks only on its own result
+
+    work is ordered by priority (SAFETY, NORMAL, POLL) and then by arrival.
+    a SAFETY item cancels the POLL items still queued for its controller
+    (their futures raise CacliCancelled) unless cancel_polls is False.
+    POLL items for one controller start at most once per poll_interval
+    seconds, so a polling loop cannot hog the queue; other work is not
+    delayed by the limit
+    '''
+    def __init__(self,name='pyjanssen-dispatcher',poll_interval=0.0,cancel_polls=True):
+        self.poll_interval = poll_interval
+        self.cancel_polls = cancel_polls
+        self.__heap = []
+        self.__sequence = itertools.count()
+        self.__condition = threading.Condition()
+        self.__last_poll = {}
+        self.__waits = {priority:LatencyHistogram() for priority in PRIORITY_NAMES}
+        self.__cancelled = 0
+        self.__closed = False
+        self.__thread = threading.Thread(target=self.__work,name=name,daemon=True)
+        self.__thread.start()
+
+    def in_worker(self):
+        '''
+        returns: True if called from the dispatcher's worker thread
+        '''
+        return threading.current_thread() is self.__thread
+
+    def submit(self,fn,*args,**kwargs):
+        '''
+        arguments: fn, *args, **kwargs
+        returns: Future for fn(*args,**kwargs), queued at NORMAL priority
+        '''
+        return self.schedule(fn,args,kwargs)
+
+    def schedule(self,fn,args=(),kwargs=None,priority=NORMAL,controller=None):
+        '''
+        arguments: fn, *args, *kwargs, *priority (default NORMAL), *controller
+        returns: Future for fn(*args,**kwargs)
+
+        controller is any hashable naming the controller the work talks to;
+        it scopes poll rate limiting and cancellation by SAFETY items
+        '''
+        future = concurrent.futures.Future()
+        if self.__closed:
+            raise RuntimeError('dispatcher is closed')
+        if self.in_worker():
+            # called from queued work: run inline rather than deadlock
+            self.__call(future,fn,args,kwargs or {})
+            return future
+        item = _Item(future,fn,args,kwargs or {},priority,controller)
+        with self.__condition:
+            if priority == SAFETY and self.cancel_polls:
+                self.__cancel_polls(controller)
+            heapq.heappush(self.__heap,(priority,next(self.__sequence),item))
+            self.__condition.notify()
+        return future
+
+    def __cancel_polls(self,controller):
+        # with the condition held
+        keep = []
+        for entry in self.__heap:
+            item = entry[2]
+            if item.priority == POLL and item.controller == controller:
+                # already cancelled by its caller, or failed with CacliCancelled
+                if item.future.set_running_or_notify_cancel():
+                    item.future.set_exception(CacliCancelled('{} cancelled by a stop command'.format(_describe(item))))
+                    self.__cancelled += 1
+            else:
+                keep.append(entry)
+        if len(keep) != len(self.__heap):
+            heapq.heapify(keep)
+            self.__heap = keep
+
+    def pending(self):
+        '''
+        returns: number of items waiting in the queue
+        '''
+        with self.__condition:
+            return len(self.__heap)
+
+    def stats(self):
+        '''
+        returns: dictionary of depth (queued items per priority), wait
+        (histogram summary of queueing time per priority, seconds) and
+        cancelled (POLL items dropped for SAFETY items)
+        '''
+        with self.__condition:
+            depth = {name:0 for name in PRIORITY_NAMES.values()}
+            for entry in self.__heap:
+                depth[PRIORITY_NAMES[entry[0]]] += 1
+            return {'depth':depth,
+                'wait':{PRIORITY_NAMES[priority]:histogram.summary() for priority,histogram in self.__waits.items()},
+                'cancelled':self.__cancelled}
+
+    def close(self):
+        '''
+        finishes queued work and stops the worker thread
+        '''
+        with self.__condition:
+            if self.__closed:
+                return
+            self.__closed = True
+            self.__condition.notify()
+        if not self.in_worker():
+            self.__thread.join()
+
+    def __call(self,future,fn,args,kwargs):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args,**kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    def __next(self):
+        # with the condition held: next runnable item, or seconds to wait
+        # until a rate-limited poll may start
+        if self.__heap[0][0] != POLL or self.poll_interval <= 0:
+            return heapq.heappop(self.__heap)[2],None
+        # only polls are queued: take the oldest one whose controller is due
+        now = time.perf_counter()
+        delay = None
+        for entry in sorted(self.__heap):
+            due = self.__last_poll.get(entry[2].controller,now - self.poll_interval) + self.poll_interval
+            if due <= now:
+                self.__heap.remove(entry)
+                heapq.heapify(self.__heap)
+                self.__last_poll[entry[2].controller] = now
+                return entry[2],None
+            delay = due - now if delay is None else min(delay,due - now)
+        return None,delay
+
+    def __work(self):
+        while True:
+            with self.__condition:
+                while True:
+                    if self.__heap:
+                        item,delay = self.__next()
+                        if item is not None:
+                            break
+                        self.__condition.wait(delay)
+                    elif self.__closed:
+                        return
+                    else:
+                        self.__condition.wait()
+                self.__waits[item.priority].add(time.perf_counter() - item.queued)
+            self.__call(item.future,item.fn,item.args,item.kwargs)
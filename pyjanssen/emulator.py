@@ -0,0 +1,379 @@
+#
+# Python library for Janssen MCM controller
+# Stateful cacli emulator for running without hardware (Linux)
+#
+# make_fake_cacli() writes an executable stand-in for cacli.exe that accepts
+# the same arguments and prints replies in the format response.py parses:
+#
+#   exe = make_fake_cacli('/tmp/rig', latency=0.005, error_rate=0.01)
+#   m = MCM(exe=exe)
+#
+# simulated state (axis positions, servodrive) is kept in a JSON file next
+# to the executable so it persists across spawns
+#
+
+import contextlib
+import fcntl
+import json
+import os
+import random
+import stat
+import sys
+import time
+
+DEFAULT_CONFIG = {
+    'devices':None,             # list of device ids that exist; None accepts any
+    'modules':{'1':3,'2':3,'3':3}, # address: number of channels
+    'latency':0.0,              # seconds added to every command
+    'jitter':0.0,               # extra uniformly random seconds per command
+    'error_rate':0.0,           # probability of ERROR: DEVICE NOT FOUND
+    'fail':{},                  # command: reply forced for that command
+    'counts_per_step':10.0,     # encoder counts per step at 293 K and 100 % step size
+    'noise':0.0,                # relative random error on every move
+    'settle_time':0.5,          # seconds for servodrive to reach a setpoint
+    'calibration_time':0.5,     # seconds an OEMC calibration takes
+    'type':'CLA2201',           # positioner TYPE reported by INFO
+    'version':'MCM v1.0 (emulated)',
+    'exclusive':False,          # one process per controller at a time, like cacli over USB
+    }
+
+
+def make_fake_cacli(directory,name='cacli',**config):
+    '''
+    arguments: directory, *name, **config
+    returns: path to the executable
+
+    writes an executable fake cacli plus its config and state files into
+    directory; config keys as DEFAULT_CONFIG
+    '''
+    os.makedirs(directory,exist_ok=True)
+    path = os.path.join(directory,name)
+    config_path = path + '.json'
+    unknown = set(config) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError('unknown emulator settings {}'.format(sorted(unknown)))
+    with open(config_path,'w') as f:
+        json.dump(dict(DEFAULT_CONFIG,**config),f,indent=1)
+    with open(path,'w') as f:
+        f.write('#!{} -S\n'.format(sys.executable))
+        f.write('import sys\nimport importlib.util\n')
+        f.write('spec = importlib.util.spec_from_file_location("emulator",{!r})\n'.format(os.path.abspath(__file__)))
+        f.write('emulator = importlib.util.module_from_spec(spec)\nspec.loader.exec_module(emulator)\n')
+        f.write('sys.exit(emulator.main([{!r}] + sys.argv[1:]))\n'.format('--config=' + config_path))
+    os.chmod(path,os.stat(path).st_mode | stat.S_IEXEC | stat.S_IXGRP | stat.S_IXOTH)
+    reset(path)
+    return path
+
+
+def reset(exe):
+    '''
+    arguments: exe
+
+    clears the simulated state of the fake cacli at exe
+    '''
+    with open(exe + '.state','w') as f:
+        json.dump({},f)
+    if os.path.exists(exe + '.collisions'):
+        os.unlink(exe + '.collisions')
+
+
+def collisions(exe):
+    '''
+    arguments: exe
+    returns: number of commands the fake cacli at exe refused because
+    another process held the controller (exclusive mode)
+    '''
+    try:
+        return os.path.getsize(exe + '.collisions')
+    except OSError:
+        return 0
+
+
+class _NotPresent(Exception):
+    pass
+
+
+class Emulator:
+    '''
+    simulated MCM controllers; handle() takes one cacli argument list and
+    returns (stdout, returncode)
+
+    in exclusive mode a command holds its controller for its whole run
+    (latency included) and a command for a controller that another process
+    holds fails with ERROR: DEVICE NOT FOUND, as cacli does over USB
+    '''
+    def __init__(self,config,state_path):
+        self.config = config
+        self.state_path = state_path
+
+    @contextlib.contextmanager
+    def _claim(self,target):
+        # yields False if another process holds the controller
+        if not self.config['exclusive']:
+            yield True
+            return
+        with open('{}.{}.lock'.format(self.state_path,_device(target) or 'usb'),'w') as f:
+            try:
+                fcntl.flock(f,fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                with open(self.state_path[:-len('.state')] + '.collisions','a') as log:
+                    log.write('x')
+                yield False
+                return
+            yield True
+
+    def handle(self,target,command_list):
+        '''
+        arguments: target, command_list
+        returns: stdout, returncode
+        '''
+        with self._claim(target) as claimed:
+            if not claimed:
+                return 'ERROR: DEVICE NOT FOUND',1
+            return self._handle(target,command_list)
+
+    def _handle(self,target,command_list):
+        config = self.config
+        delay = config['latency'] + random.uniform(0,config['jitter'])
+        if delay > 0:
+            time.sleep(delay)
+        device = _device(target)
+        if config['devices'] is not None and device not in [str(d) for d in config['devices']]:
+            return 'ERROR: DEVICE NOT FOUND',1
+        if config['error_rate'] and random.random() < config['error_rate']:
+            return 'ERROR: DEVICE NOT FOUND',1
+        if not command_list:
+            return 'ERROR: NO COMMAND',1
+        command = command_list[0]
+        if command in config['fail']:
+            return config['fail'][command],1
+        handler = getattr(self,'_' + command.lower(),None)
+        if handler is None:
+            return 'ERROR: UNKNOWN COMMAND {}'.format(command),1
+        with open(self.state_path,'r+') as f:
+            fcntl.flock(f,fcntl.LOCK_EX)
+            try:
+                state = json.load(f)
+            except ValueError:
+                state = {}
+            controller = state.setdefault(device or '',{'axes':{},'servo':None})
+            try:
+                reply = handler(controller,command_list[1:])
+            except _NotPresent as e:
+                reply = 'ERROR: {}'.format(e),1
+            except (IndexError,ValueError,KeyError) as e:
+                reply = 'ERROR: INVALID ARGUMENTS ({})'.format(e),1
+            f.seek(0)
+            f.truncate()
+            json.dump(state,f)
+        return reply
+
+    def calibrate(self,target,args,stdin,stdout):
+        '''
+        arguments: target, args, stdin, stdout
+        returns: returncode
+
+        scripted OEMC dialogue: a prompt to start, PROGRESS lines, then a
+        prompt to store the result
+        '''
+        with self._claim(target) as claimed:
+            if not claimed:
+                stdout.write('ERROR: DEVICE NOT FOUND\n')
+                stdout.flush()
+                return 1
+            return self._calibrate(target,args,stdin,stdout)
+
+    def _calibrate(self,target,args,stdin,stdout):
+        def say(text):
+            stdout.write(text)
+            stdout.flush()
+        device = _device(target)
+        if self.config['devices'] is not None and device not in [str(d) for d in self.config['devices']]:
+            say('ERROR: DEVICE NOT FOUND\n')
+            return 1
+        try:
+            self._check_module(args[0],args[1])
+        except _NotPresent as e:
+            say('ERROR: {}\n'.format(e))
+            return 1
+        except IndexError:
+            say('ERROR: INVALID ARGUMENTS\n')
+            return 1
+        say('OEMC ENCODER CALIBRATION ADDRESS {} CHANNEL {}\n'.format(args[0],args[1]))
+        say('Move the positioner away from its end stops and press ENTER to start ')
+        if not stdin.readline():
+            return 1
+        parts = 5
+        for part in range(parts + 1):
+            say('PROGRESS : {}\n'.format(100 * part // parts))
+            if part < parts:
+                time.sleep(self.config['calibration_time'] / parts)
+        say('Store calibration (y/n)? ')
+        if stdin.readline().strip().lower() != 'y':
+            say('STATUS : ABORTED\n')
+            return 1
+        say('MIN : {}\nMAX : {}\nSTATUS : OK\n'.format(-1000,1000))
+        return 0
+
+    def _check_module(self,address,channel=None):
+        channels = self.config['modules'].get(str(address))
+        if channels is None:
+            raise _NotPresent('NO MODULE AT ADDRESS {}'.format(address))
+        if channel is not None and not 1 <= int(channel) <= channels:
+            raise _NotPresent('NO CHANNEL {} AT ADDRESS {}'.format(channel,address))
+
+    def _axis(self,controller,address,channel):
+        self._check_module(address,channel)
+        return controller['axes'].setdefault('{}.{}'.format(address,channel),{'POS':0,'RVL':0})
+
+    def _counts(self,temperature,step_size,steps):
+        # displacement shrinks as the positioner cools
+        per_step = self.config['counts_per_step'] * (0.2 + 0.8 * min(float(temperature),293) / 293)
+        counts = per_step * float(step_size) / 100 * int(steps)
+        if self.config['noise']:
+            counts *= 1 + random.gauss(0,self.config['noise'])
+        return int(round(counts))
+
+    def _mov(self,controller,args):
+        address,channel,profile,temperature,direction,frequency,step_size,steps = args
+        if controller['servo'] is not None:
+            return 'Unable to comply',1
+        axis = self._axis(controller,address,channel)
+        counts = self._counts(temperature,step_size,steps)
+        axis['POS'] += counts if int(direction) == 1 else -counts
+        axis['RVL'] += counts if int(direction) == 1 else -counts
+        return 'STATUS : OK',0
+
+    def _ext(self,controller,args):
+        self._check_module(args[0],args[1])
+        return 'STATUS : OK',0
+
+    def _stp(self,controller,args):
+        self._check_module(args[0])
+        return 'STATUS : OK',0
+
+    def _sts(self,controller,args):
+        self._check_module(args[0])
+        return 'FAILSAFE STATE : 0x0\nSTATUS : OK',0
+
+    def _info(self,controller,args):
+        self._check_module(args[0],args[1])
+        return 'TYPE : {}\nTAG : A{}C{}'.format(self.config['type'],args[0],args[1]),0
+
+    def _pos(self,controller,args):
+        axis = self._axis(controller,args[0],args[1])
+        return 'POS : {}\nRVL : {}'.format(axis['POS'],axis['RVL']),0
+
+    def _rst(self,controller,args):
+        axis = self._axis(controller,args[0],args[1])
+        axis['POS'] = 0
+        return 'OK',0
+
+    def _desc(self,controller,args):
+        self._check_module(args[0])
+        channels = self.config['modules'][str(args[0])]
+        return 'Version : {}\nAvailable Channels : {}'.format(self.config['version'],
+            ','.join(str(c) for c in range(1,channels + 1))),0
+
+    def _servo_positions(self,servo):
+        # positions move linearly from start to setpoint over settle_time
+        fraction = 1.0
+        if self.config['settle_time'] > 0:
+            fraction = min(1.0,(time.time() - servo['since']) / self.config['settle_time'])
+        return [int(round(a + (b - a) * fraction)) for a,b in zip(servo['start'],servo['setpoint'])]
+
+    def _fben(self,controller,args):
+        int(args[0])
+        positions = [controller['axes'].get('1.{}'.format(c),{'POS':0})['POS'] for c in (1,2,3)]
+        controller['servo'] = {'start':positions,'setpoint':positions,'since':time.time(),'enabled':1}
+        return 'STATUS : OK',0
+
+    def _fbxt(self,controller,args):
+        servo = controller['servo']
+        if servo is not None:
+            for c,position in enumerate(self._servo_positions(servo),1):
+                controller['axes'].setdefault('1.{}'.format(c),{'POS':0,'RVL':0})['POS'] = position
+        controller['servo'] = None
+        return 'STATUS : OK',0
+
+    def _fbcs(self,controller,args):
+        servo = controller['servo']
+        if servo is None:
+            return 'Unable to comply',1
+        servo['start'] = self._servo_positions(servo)
+        servo['setpoint'] = [int(a) for a in args[:3]]
+        servo['since'] = time.time()
+        servo['enabled'] = 1
+        return 'STATUS : OK',0
+
+    def _fbes(self,controller,args):
+        servo = controller['servo']
+        if servo is None:
+            return 'Unable to comply',1
+        servo['start'] = servo['setpoint'] = self._servo_positions(servo)
+        servo['since'] = time.time()
+        return 'STATUS : OK',0
+
+    def _fbfe(self,controller,args):
+        direction,filter,zero = int(args[0]),int(args[1]),int(args[2])
+        servo = controller['servo']
+        if servo is None:
+            return 'Unable to comply',1
+        end = 0 if zero else (1000000 if direction == 1 else -1000000)
+        servo['start'] = [end] * 3 if zero else self._servo_positions(servo)
+        servo['setpoint'] = [end] * 3
+        servo['since'] = time.time()
+        return 'STATUS : OK',0
+
+    def _fbst(self,controller,args):
+        servo = controller['servo']
+        if servo is None:
+            return 'STATUS : OK\nENABLED : 0\nBUSY : 0\nPOS1 : 0\nPOS2 : 0\nPOS3 : 0\nERR1 : 0\nERR2 : 0\nERR3 : 0',0
+        positions = self._servo_positions(servo)
+        errors = [p - s for p,s in zip(positions,servo['setpoint'])]
+        busy = int(any(errors))
+        return ('STATUS : OK\nENABLED : {}\nBUSY : {}\n'.format(servo['enabled'],busy) +
+            '\n'.join('POS{} : {}'.format(c,p) for c,p in enumerate(positions,1)) + '\n' +
+            '\n'.join('ERR{} : {}'.format(c,e) for c,e in enumerate(errors,1))),0
+
+
+def _device(target):
+    # '@1' -> '1', '@SERV:1' -> '1', '@SERV' or nothing -> None
+    for arg in target:
+        value = arg[1:]
+        if value.startswith('SERV'):
+            value = value[5:]
+        return value or None
+    return None
+
+
+def main(argv):
+    '''
+    entry point of the fake cacli: [--config=path] [@target] command args...
+    '''
+    config_path = None
+    if argv and argv[0].startswith('--config='):
+        config_path = argv[0][len('--config='):]
+        argv = argv[1:]
+    config = dict(DEFAULT_CONFIG)
+    if config_path is not None:
+        with open(config_path) as f:
+            config.update(json.load(f))
+        state_path = config_path[:-len('.json')] + '.state'
+    else:
+        state_path = os.path.join(os.getcwd(),'cacli.state')
+    if not os.path.exists(state_path):
+        with open(state_path,'w') as f:
+            json.dump({},f)
+    target = [arg for arg in argv if arg.startswith('@')]
+    command_list = [arg for arg in argv if not arg.startswith('@')]
+    emulator = Emulator(config,state_path)
+    if command_list[:1] == ['OEMC']:
+        return emulator.calibrate(target,command_list[1:],sys.stdin,sys.stdout)
+    stdout,returncode = emulator.handle(target,command_list)
+    print(stdout)
+    return returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,23 @@
+#
+# Python library for Janssen MCM controller
+# Exceptions
+#
+
+
+class CacliError(Exception):
+    # Exception when returncode != 0
+    def __init__(self,error):
+        self.error = error
+        
+    def __str__(self):
+        return repr(self.error)
+
+
+class CacliTimeout(CacliError):
+    # Exception when a command exceeds its deadline; the cacli process is killed
+    pass
+
+
+class CacliCancelled(CacliError):
+    # Exception when a queued read is dropped because a stop command overtook it
+    pass
@@ -0,0 +1,145 @@
+#
+# Python library for Janssen MCM controller
+# Dead-reckoning position estimates between POS reads
+#
+
+import math
+import threading
+import time
+
+
+class PositionEstimator:
+    '''
+    per-axis position estimate: advanced by every MOV from the counts per
+    step fitted for its axis, direction and settings (the calibration
+    store's model), and reset by every POS reply
+
+    arguments: *min_relative_error, *drift
+
+    min_relative_error: floor on the uncertainty of counts per step, as a
+        fraction of it (default 0.05)
+    drift: growth of the standard deviation without a read, as a random
+        walk in counts per square root second, e.g. thermal drift or
+        vibration (default 1): an estimate is never exact for long
+
+    the uncertainty is one standard deviation in encoder counts; it is 0
+    right after a read and infinite while the axis has an unlearned
+    setting or was moved by something the estimator cannot predict
+    '''
+    def __init__(self,min_relative_error=0.05,drift=1.0,clock=time.monotonic):
+        self.min_relative_error = min_relative_error
+        self.drift = drift
+        self.clock = clock
+        self.reads = 0
+        self.avoided = 0
+        self.predictions = 0
+        self.__axes = {}
+        self.__errors = []
+        self.__lock = threading.Lock()
+
+    def moved(self,axis,direction,steps,model):
+        '''
+        arguments: axis, direction, steps, model
+
+        advances the estimate of axis by a MOV; model is the fit of counts
+        per step for its settings (CalibrationStore.model), None if there is
+        none yet
+        '''
+        with self.__lock:
+            state = self.__axes.get(axis)
+            if state is None:
+                return
+            state['moved'] = True
+            if model is None or state['variance'] is None:
+                state['variance'] = None
+                return
+            rate = abs(model['COUNTS_PER_STEP'])
+            if model['N'] < 2:
+                # one observation: be unsure until more arrive
+                sigma = 0.25 * rate
+            else:
+                sigma = max(model['RESIDUAL'],self.min_relative_error * rate)
+            state['position'] += (1 if int(direction) else -1) * rate * int(steps)
+            state['variance'] += (sigma * int(steps)) ** 2
+
+    def observed(self,axis,position):
+        '''
+        arguments: axis, position
+
+        corrects the estimate of axis with a POS reading, checking the
+        prediction if the axis moved since the previous reading
+        '''
+        now = self.clock()
+        with self.__lock:
+            self.reads += 1
+            state = self.__axes.get(axis)
+            if state is not None and state['moved'] and state['variance'] is not None:
+                self.predictions += 1
+                self.__errors.append(abs(state['position'] - position))
+                del self.__errors[:-1000]
+            self.__axes[axis] = {'position':float(position),'variance':0.0,'since':now,'moved':False}
+
+    def reset(self,axis,position=0):
+        '''
+        arguments: axis, *position (default 0)
+
+        sets the estimate of axis after its counter was reset (RST), without
+        checking it against the prediction
+        '''
+        now = self.clock()
+        with self.__lock:
+            self.__axes[axis] = {'position':float(position),'variance':0.0,'since':now,'moved':False}
+
+    def forget(self,axis=None):
+        '''
+        arguments: *axis
+
+        drops the estimate of axis (or of every axis), e.g. after motion
+        the estimator cannot follow
+        '''
+        with self.__lock:
+            if axis is None:
+                self.__axes.clear()
+            else:
+                self.__axes.pop(axis,None)
+
+    def estimate(self,axis):
+        '''
+        arguments: axis
+        returns: (position, uncertainty) or None if the axis was never read
+        '''
+        now = self.clock()
+        with self.__lock:
+            state = self.__axes.get(axis)
+            if state is None:
+                return None
+            if state['variance'] is None:
+                return state['position'],math.inf
+            variance = state['variance'] + (self.drift ** 2) * (now - state['since'])
+            return state['position'],math.sqrt(variance)
+
+    def within(self,axis,tolerance):
+        '''
+        arguments: axis, tolerance
+        returns: estimated position (integer) if its uncertainty is within
+        tolerance, otherwise None; counts the read avoided
+        '''
+        estimate = self.estimate(axis)
+        if estimate is None or estimate[1] > tolerance:
+            return None
+        with self.__lock:
+            self.avoided += 1
+        return int(round(estimate[0]))
+
+    def stats(self):
+        '''
+        returns: dictionary of reads (POS replies seen), avoided (reads
+        answered from the estimate), predictions (estimates checked
+        against a read) and mean_error (counts, over the last 1000 checks)
+        '''
+        with self.__lock:
+            errors = list(self.__errors)
+        return {'reads':self.reads,
+            'avoided':self.avoided,
+            'predictions':self.predictions,
+            'mean_error':sum(errors) / len(errors) if errors else None}
@@ -0,0 +1,273 @@
+#
+# Python library for Janssen MCM controller
+# Multi-controller fleet with parallel dispatch
+#
+
+import collections
+import concurrent.futures
+import threading
+
+from pyjanssen.janssen_mcm import MCM
+
+
+class Fleet:
+    '''
+    a set of MCM controllers addressed by device, with work for different
+    controllers run concurrently on a bounded worker pool
+
+    each controller has its own queue of work; a pool thread takes one item
+    from a controller's queue at a time and then goes to the back of the
+    pool, so threads never wait on a busy controller and a controller with
+    a long queue cannot starve the others
+
+    every controller is built with its own priority dispatcher (unless
+    kwargs or the options say otherwise), so its commands run one at a
+    time whoever sends them, and stop_all() puts its stops at the front of
+    that queue instead of waiting behind the fleet work
+
+    arguments: devices, *max_workers, **kwargs
+
+    devices is an iterable of device ids (each becomes MCM(device=id,
+    **kwargs)) or a dictionary of name: MCM kwargs for mixed targets, e.g.
+    {'cryostat1':{'device':1}, 'remote':{'server':True,'device':4}}.
+    commands for one controller never overlap; axes are (device, address, channel)
+    '''
+    def __init__(self,devices,max_workers=None,axes=None,**kwargs):
+        kwargs.setdefault('dispatcher',True)
+        if isinstance(devices,dict):
+            self.controllers = {name:MCM(**dict(kwargs,**options)) for name,options in devices.items()}
+        else:
+            self.controllers = {device:MCM(device=device,**kwargs) for device in devices}
+        self.axes = list(axes or [])
+        self.__queues = {device:collections.deque() for device in self.controllers}
+        self.__active = set()
+        self.__lock = threading.Lock()
+        self.__pool = concurrent.futures.ThreadPoolExecutor(max_workers or min(32,len(self.controllers) or 1),
+                thread_name_prefix='pyjanssen-fleet')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def __getitem__(self,device):
+        return self.controllers[device]
+
+    def __iter__(self):
+        return iter(self.controllers)
+
+    def __len__(self):
+        return len(self.controllers)
+
+    def close(self):
+        '''
+        stops the worker pool and closes every controller
+        '''
+        self.__pool.shutdown()
+        for mcm in self.controllers.values():
+            mcm.close()
+
+    def _enqueue(self,device,fn):
+        '''
+        arguments: device, fn
+        returns: Future of fn(controller), run after the work already queued
+        for device
+        '''
+        future = concurrent.futures.Future()
+        with self.__lock:
+            self.__queues[device].append((future,fn))
+            if device in self.__active:
+                return future
+            self.__active.add(device)
+        self.__pool.submit(self.__drain,device)
+        return future
+
+    def __drain(self,device):
+        # one queued item for device, then back to the end of the pool's queue
+        while True:
+            with self.__lock:
+                future,fn = self.__queues[device].popleft()
+            _complete(future,fn,self.controllers[device])
+            with self.__lock:
+                if not self.__queues[device]:
+                    self.__active.discard(device)
+                    return
+            try:
+                self.__pool.submit(self.__drain,device)
+                return
+            except RuntimeError:
+                pass # pool shutting down: finish the queue here
+
+    def submit(self,device,method,*args,**kwargs):
+        '''
+        arguments: device, method, *args, **kwargs
+        returns: Future of getattr(controller, method)(*args, **kwargs)
+
+        e.g. fleet.submit(1,'move',2,FORWARD,steps=10)
+        '''
+        return self._enqueue(device,lambda mcm: getattr(mcm,method)(*args,**kwargs))
+
+    def map(self,fn,devices=None,return_exceptions=False):
+        '''
+        arguments: fn, *devices (default all), *return_exceptions (default False)
+        returns: dictionary of device: fn(controller)
+
+        runs fn once per controller, concurrently
+        '''
+        devices = list(self.controllers) if devices is None else list(devices)
+        futures = {device:self._enqueue(device,fn) for device in devices}
+        return _gather(futures,return_exceptions)
+
+    def move(self,axis,direction,**kwargs):
+        '''
+        arguments: axis, direction, **kwargs
+        returns: dictionary of STATUS
+        '''
+        device,address,channel = axis
+        return self.submit(device,'move',address,direction,channel,**kwargs).result()
+
+    def get_position(self,axis,**kwargs):
+        '''
+        arguments: axis
+        returns: position (integer)
+        '''
+        device,address,channel = axis
+        return self.submit(device,'get_position',address,channel,**kwargs).result()
+
+    def get_positions(self,axes=None,return_exceptions=False):
+        '''
+        arguments: *axes (default fleet axes), *return_exceptions (default False)
+        returns: dictionary of axis: position
+
+        reads every axis; axes on different controllers are read concurrently
+        so the wall time is close to one controller's share of the reads
+        '''
+        axes = self.axes if axes is None else list(axes)
+        by_device = {}
+        for axis in axes:
+            by_device.setdefault(axis[0],[]).append(axis)
+        def read(device):
+            def fn(mcm):
+                positions = {}
+                for axis in by_device[device]:
+                    try:
+                        positions[axis] = mcm.get_position(axis[1],axis[2])
+                    except Exception as e:
+                        if not return_exceptions:
+                            raise
+                        positions[axis] = e
+                return positions
+            return fn
+        futures = {device:self._enqueue(device,read(device)) for device in by_device}
+        positions = {}
+        for device,result in _gather(futures,return_exceptions).items():
+            if isinstance(result,Exception):
+                positions.update({axis:result for axis in by_device[device]})
+            else:
+                positions.update(result)
+        return {axis:positions[axis] for axis in axes}
+
+    def read_all_positions(self,return_exceptions=False):
+        '''
+        returns: dictionary of axis: position for the fleet axes
+        '''
+        return self.get_positions(None,return_exceptions)
+
+    def autocalibrate_all(self,axes=None,progress=None,return_exceptions=False,**kwargs):
+        '''
+        arguments: *axes (default fleet axes), *progress, *return_exceptions (default False), **kwargs
+        returns: dictionary of axis: autocalibrate reply
+
+        runs the OEMC calibration of every axis; controllers are calibrated
+        concurrently, the axes of one controller one after another
+        (MCM.autocalibrate_all). progress is called as progress(axis, percent);
+        kwargs as MCM.autocalibrate
+        '''
+        axes = self.axes if axes is None else [tuple(axis) for axis in axes]
+        by_device = {}
+        for axis in axes:
+            by_device.setdefault(axis[0],[]).append(axis)
+        def calibrate(device):
+            def report(address,channel,percent):
+                progress((device,address,channel),percent)
+            return lambda mcm: mcm.autocalibrate_all([axis[1:] for axis in by_device[device]],
+                    None if progress is None else report,True,**kwargs)
+        futures = {device:self._enqueue(device,calibrate(device)) for device in by_device}
+        results = {}
+        for device,replies in _gather(futures,return_exceptions).items():
+            if isinstance(replies,Exception):
+                results.update({axis:replies for axis in by_device[device]})
+            else:
+                results.update({(device,) + axis:reply for axis,reply in replies.items()})
+        results = {axis:results[axis] for axis in axes}
+        for reply in results.values():
+            if isinstance(reply,Exception) and not return_exceptions:
+                raise reply
+        return results
+
+    def stop_all(self,addresses=None,return_exceptions=False):
+        '''
+        arguments: *addresses, *return_exceptions (default False)
+        returns: dictionary of device: list of replies
+
+        sends STP to the given module addresses (default: every address in
+        the fleet axes) of every controller at once; controllers in
+        servodrive mode get FBES instead. each controller's stops are sent
+        from a dedicated thread, bypassing the fleet queue, and go to the
+        front of the controller's dispatcher: they run as soon as the
+        command in progress on that controller finishes. stops are retried
+        like reads, and every address is tried even if one fails; the first
+        failure is then raised unless return_exceptions
+        '''
+        if addresses is None:
+            by_device = {}
+            for device,address,channel in self.axes:
+                by_device.setdefault(device,[])
+                if address not in by_device[device]:
+                    by_device[device].append(address)
+        else:
+            by_device = {device:list(addresses) for device in self.controllers}
+        def stop(mcm,device):
+            if mcm.servodrive_enabled():
+                stops = [mcm.servodrive_emergency_stop]
+            else:
+                stops = [lambda address=address: mcm.stop(address) for address in by_device[device]]
+            replies = []
+            with mcm.deadline(retry_writes=True):
+                for fn in stops:
+                    try:
+                        replies.append(fn())
+                    except Exception as e:
+                        replies.append(e)
+            for reply in replies:
+                if isinstance(reply,Exception) and not return_exceptions:
+                    raise reply
+            return replies
+        futures = {}
+        for device in by_device:
+            futures[device] = concurrent.futures.Future()
+            threading.Thread(target=_complete,args=(futures[device],stop,self.controllers[device],device),
+                    name='pyjanssen-fleet-stop',daemon=True).start()
+        return _gather(futures,return_exceptions)
+
+
+def _complete(future,fn,*args):
+    # runs fn(*args) into future unless it was cancelled
+    if not future.set_running_or_notify_cancel():
+        return
+    try:
+        future.set_result(fn(*args))
+    except BaseException as e:
+        future.set_exception(e)
+
+
+def _gather(futures,return_exceptions):
+    # results of a dictionary of futures, raising the first error unless return_exceptions
+    results = {}
+    for key,future in futures.items():
+        error = future.exception()
+        if error is not None and not return_exceptions:
+            raise error
+        results[key] = error if error is not None else future.result()
+    return results
@@ -0,0 +1,168 @@
+#
+# Python library for Janssen MCM controller
+# Interactive cacli sessions (prompt/response commands such as OEMC)
+#
+
+import queue
+import re
+import subprocess
+import threading
+import time
+
+from pyjanssen.errors import CacliError, CacliTimeout
+
+# pattern matching the end of the output in InteractiveSession.expect
+EOF = object()
+
+
+class InteractiveSession:
+    '''
+    one cacli process driven through its prompts
+
+    arguments: argv
+
+    stdout is read in whatever pieces the process writes (prompts need not
+    end in a newline) by a reader thread that queues them; this works with
+    Windows pipes, which cannot be polled. expect() waits for patterns in
+    the output, send() answers; transcript holds everything read
+    '''
+    def __init__(self,argv):
+        self.argv = list(argv)
+        self.transcript = ''
+        self.__buffer = ''
+        self.__eof = False
+        self.__queue = queue.Queue()
+        self.process = subprocess.Popen(self.argv,
+                            stdin = subprocess.PIPE,
+                            stdout = subprocess.PIPE,
+                            stderr = subprocess.STDOUT,
+                            bufsize = 0)
+        self.__reader = threading.Thread(target=self.__read,name='pyjanssen-interactive',daemon=True)
+        self.__reader.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def __read(self):
+        while True:
+            try:
+                # unbuffered pipe: returns as soon as anything is available
+                chunk = self.process.stdout.read(4096)
+            except (OSError,ValueError):
+                chunk = b''
+            if not chunk:
+                self.__queue.put(None)
+                return
+            self.__queue.put(chunk.decode(errors='replace').replace('\r\n','\n'))
+
+    def read(self,timeout=None):
+        '''
+        arguments: *timeout
+        returns: next piece of output, '' at the end of the output, or None
+        if nothing arrived within timeout seconds
+        '''
+        if self.__buffer:
+            chunk,self.__buffer = self.__buffer,''
+            return chunk
+        if self.__eof:
+            return ''
+        try:
+            chunk = self.__queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if chunk is None:
+            self.__eof = True
+            return ''
+        self.transcript += chunk
+        return chunk
+
+    def expect(self,patterns,timeout=None):
+        '''
+        arguments: patterns, *timeout
+        returns: (index, match) of the earliest match in the unread output
+
+        patterns are regular expressions (strings or compiled) or EOF; the
+        output up to the end of the match is consumed. raises CacliTimeout
+        after timeout seconds and CacliError if the process exits first
+        (unless EOF is one of the patterns; its match is None)
+        '''
+        compiled = [pattern if pattern is EOF or hasattr(pattern,'search') else re.compile(pattern) for pattern in patterns]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            best = None
+            for i,pattern in enumerate(compiled):
+                if pattern is EOF:
+                    continue
+                match = pattern.search(self.__buffer)
+                if match is not None and (best is None or match.start() < best[1].start()):
+                    best = (i,match)
+            if best is not None:
+                self.__buffer = self.__buffer[best[1].end():]
+                return best
+            if self.__eof:
+                if EOF in compiled:
+                    return compiled.index(EOF),None
+                raise CacliError('{} exited while waiting for {}'.format(' '.join(self.argv[1:]),
+                        [getattr(pattern,'pattern',pattern) for pattern in compiled]))
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise CacliTimeout('{} gave no expected output within {:.3g} s'.format(' '.join(self.argv[1:]),timeout))
+            try:
+                chunk = self.__queue.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if chunk is None:
+                self.__eof = True
+            else:
+                self.transcript += chunk
+                self.__buffer += chunk
+
+    def send(self,text):
+        '''
+        arguments: text
+
+        writes text to the process's stdin
+        '''
+        try:
+            self.process.stdin.write(text.encode())
+            self.process.stdin.flush()
+        except (BrokenPipeError,OSError):
+            raise CacliError('{} is no longer accepting input'.format(' '.join(self.argv[1:])))
+
+    def wait(self,timeout=None):
+        '''
+        arguments: *timeout
+        returns: returncode, once the process has exited and its output is read
+        '''
+        try:
+            returncode = self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            raise CacliTimeout('{} did not exit within {:.3g} s'.format(' '.join(self.argv[1:]),timeout))
+        self.__reader.join(timeout)
+        while not self.__eof:
+            try:
+                chunk = self.__queue.get_nowait()
+            except queue.Empty:
+                break
+            if chunk is None:
+                self.__eof = True
+            else:
+                self.transcript += chunk
+                self.__buffer += chunk
+        return returncode
+
+    def close(self):
+        '''
+        kills the process if it is still running
+        '''
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        for pipe in (self.process.stdin,self.process.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
@@ -4,24 +4,50 @@
 # by Rob Heath, 2018-11-23
 #
 
-import subprocess
 import os
+import time
+import random
+import contextlib
+import contextvars
+import concurrent.futures
 
 import pyjanssen.response
+import pyjanssen.transport
+import pyjanssen.dispatcher
+import pyjanssen.batch
+import pyjanssen.cache
+import pyjanssen.calibration
+import pyjanssen.journal
+import pyjanssen.singleflight
+import pyjanssen.settle
+import pyjanssen.topology
+import pyjanssen.estimator
+import pyjanssen.interactive
+from pyjanssen.errors import CacliError, CacliTimeout, CacliCancelled
 
 FORWARD = 1
 CW = FORWARD
 BACKWARD = 0
 CCW = BACKWARD
 
-class Counter:
-    def __init__(self,value=0):
-        super().__init__()
-        self.value = value
-        
-    def get(self):
-        self.value += 1
-        return self.value-1
+# errors worth another attempt (besides a deadline that expired): the
+# controller busy with another program
+TRANSIENT_ERRORS = ('DEVICE NOT FOUND',)
+# errors about the whole controller or the link to it, not one module or
+# channel: discover() raises these (as it does timeouts) instead of
+# treating the module as absent
+CONTROLLER_ERRORS = TRANSIENT_ERRORS + ('cannot reach broker','connection to broker')
+
+# answers to the OEMC prompts (start the calibration, store its result)
+# and the pattern of its progress lines
+OEMC_PROMPTS = ((r'(?i)press ENTER[^\n]*','\n'),(r'(?i)\(y/n\)\??\s*','y\n'))
+OEMC_PROGRESS = r'(?i)PROGRESS\s*:\s*(\d+)'
+
+# largest factor by which one move_to burst may exceed the previous one
+MOVE_TO_GROWTH = 2
+
+# deadline and retry overrides set by MCM.deadline() for the current thread or task
+_POLICY = contextvars.ContextVar('pyjanssen_policy',default={})
 
 class MCM:
     def __init__(self,device=None,**kwargs):
@@ -30,6 +56,7 @@ class MCM:
         self.__server = kwargs.get('server',False)
         self.__verbose = kwargs.get('verbose',False)
         self._check_cacli()
+        self.__transport = pyjanssen.transport.make_transport(kwargs.get('transport','spawn'),self.__exe)
         self.__settings = {
             'frequency':{'1':100,'2':100},
             'step_size':{'1':100,'2':100},
@@ -37,11 +64,60 @@ class MCM:
             'steps':{'1':100,'2':100},
             'profile':{'1':'PROFILE1','2':'PROFILE1'},
             }
-        self.__command_log = {}
-        self.__counter = Counter()
+        journal = kwargs.get('journal',1024)
+        if not isinstance(journal,pyjanssen.journal.CommandJournal):
+            journal = pyjanssen.journal.CommandJournal(journal)
+        self.journal = journal
         self.__device = device
         self.__servodrive_enabled = False
+        self.__timeout = kwargs.get('timeout',None)
+        self.__retries = kwargs.get('retries',2)
+        self.__retry_writes = kwargs.get('retry_writes',False)
+        self.__backoff = kwargs.get('backoff',(0.05,1.0))
+        coalesce = kwargs.get('coalesce',False)
+        if coalesce is False or coalesce is None:
+            self.__singleflight = None
+        else:
+            self.__singleflight = pyjanssen.singleflight.SingleFlight(0.0 if coalesce is True else coalesce)
+        estimator = kwargs.get('estimator',False)
+        if estimator is True:
+            estimator = pyjanssen.estimator.PositionEstimator()
+        self.estimator = estimator or None
+        calibration = kwargs.get('calibration',None)
+        if calibration is None:
+            calibration = pyjanssen.calibration.CalibrationStore()
+        elif isinstance(calibration,str):
+            calibration = pyjanssen.calibration.CalibrationStore(calibration)
+        self.calibration = calibration
+        dispatcher = kwargs.get('dispatcher',False)
+        self.__own_dispatcher = dispatcher == True
+        if dispatcher == True:
+            dispatcher = pyjanssen.dispatcher.Dispatcher(poll_interval=kwargs.get('poll_interval',0.0))
+        self.__dispatcher = dispatcher or None
+        metadata_cache = kwargs.get('metadata_cache',False)
+        if metadata_cache is False or metadata_cache is None:
+            self.__metadata = None
+        elif metadata_cache is True:
+            self.__metadata = pyjanssen.cache.TTLCache()
+        else:
+            self.__metadata = pyjanssen.cache.TTLCache(ttl=metadata_cache)
         
+    def __enter__(self):
+        return self
+        
+    def __exit__(self,*exc):
+        self.close()
+        
+    def close(self):
+        '''
+        stops the dispatcher (if owned) and closes the transport (custom
+        transports need not have close())
+        '''
+        if self.__own_dispatcher:
+            self.__dispatcher.close()
+        close = getattr(self.__transport,'close',None)
+        if close is not None:
+            close()
         
     def _check_cacli(self):
         '''
@@ -53,6 +129,18 @@ class MCM:
             raise CacliError('could not find file at {}'.format(self.__exe))
 
             
+    def _target(self):
+        '''
+        returns: list of cacli arguments selecting the server and/or device
+        '''
+        if self.__server == True:
+            if self.__device == None:
+                return ['@SERV']
+            return ['@SERV:{}'.format(self.__device)]
+        elif self.__device != None:
+            return ['@{}'.format(self.__device)]
+        return []
+            
     def _run(self,*command_list):
         '''
         arguments: *command_list
@@ -62,29 +150,437 @@ class MCM:
         the device location and/or server
         
         will only output from functions with reply handler in response.py
+        
+        in dispatcher mode the command is queued and _run blocks on its result;
+        STP, FBES and FBXT go to the front of the queue and cancel queued
+        POS/FBST/STS reads for this controller (those raise CacliCancelled)
+        
+        with coalescing enabled, identical read-only commands (POS, STS, DESC,
+        INFO, FBST) share one execution; any other command starts a new
+        generation before and after it runs, so reads issued after it never
+        share a read that started before it finished
+        
+        transient failures (DEVICE NOT FOUND, timeout) are
+        retried with exponential backoff; see deadline()
+        '''
+        if self.__singleflight is not None:
+            if command_list and command_list[0] in pyjanssen.singleflight.READ_ONLY:
+                expires = _POLICY.get().get('expires')
+                timeout = None if expires is None else max(0.0,expires - time.monotonic())
+                return self.__singleflight.do(command_list,lambda: self.__send(command_list),timeout)
+            self.__singleflight.invalidate()
+            try:
+                return self.__send(command_list)
+            finally:
+                self.__singleflight.invalidate()
+        return self.__send(command_list)
+        
+    def __send(self,command_list):
+        expires,retries = self._retry_policy(command_list)
+        attempt = 0
+        while True:
+            try:
+                return self.__attempt(command_list,self._attempt_expiry(command_list,expires))
+            except CacliError as e:
+                attempt += 1
+                delay = self._retry_delay(e,attempt,retries,expires)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+        
+    def __attempt(self,command_list,expires):
+        if self.__dispatcher is None:
+            return self._execute(*command_list,expires=expires)
+        future = self.__schedule(command_list,expires)
+        try:
+            return future.result(None if expires is None else max(0.0,expires - time.monotonic()))
+        except concurrent.futures.TimeoutError:
+            # still queued (or about to be killed by its own deadline)
+            future.cancel()
+            raise CacliTimeout('{} did not finish before its deadline'.format(' '.join(command_list)))
+        except concurrent.futures.CancelledError:
+            raise CacliCancelled('{} was cancelled before it ran'.format(' '.join(command_list)))
+        
+    @contextlib.contextmanager
+    def deadline(self,seconds=None,retries=None,retry_writes=None):
+        '''
+        arguments: *seconds, *retries, *retry_writes
+        
+        context manager: every command sent inside the block, including
+        retries and time spent queued, must finish within seconds of entering
+        it (CacliTimeout otherwise); retries and retry_writes override the
+        instance settings. nested blocks keep the earliest deadline
+        '''
+        policy = dict(_POLICY.get())
+        if seconds is not None:
+            expires = time.monotonic() + seconds
+            policy['expires'] = min(expires,policy.get('expires',expires))
+        if retries is not None:
+            policy['retries'] = retries
+        if retry_writes is not None:
+            policy['retry_writes'] = retry_writes
+        token = _POLICY.set(policy)
+        try:
+            yield
+        finally:
+            _POLICY.reset(token)
+        
+    def _retry_policy(self,command_list):
         '''
-        subprocess_parameters = [self.__exe]
-        if self.__server == True:
-            if self.__device == None:
-                subprocess_parameters.append('@SERV')
-            elif self.__device != None:
-                subprocess_parameters.append('@SERV:{}'.format(self.__device))
-        elif self.__device != None:
-            subprocess_parameters.append('@{}'.format(self.__device))
-        subprocess_parameters += command_list
+        arguments: command_list
+        returns: expires (time.monotonic() value or None), retries
+        
+        read-only commands are retried (retries times) by default; others
+        only with retry_writes
+        '''
+        policy = _POLICY.get()
+        retries = policy.get('retries',self.__retries)
+        if not (command_list and command_list[0] in pyjanssen.singleflight.READ_ONLY):
+            if not policy.get('retry_writes',self.__retry_writes):
+                retries = 0
+        return policy.get('expires'),retries
+        
+    def _attempt_expiry(self,command_list,expires):
+        '''
+        arguments: command_list, expires
+        returns: expiry of the next attempt (time.monotonic() value or None)
+        
+        the earlier of the deadline and the per-command timeout
+        '''
+        now = time.monotonic()
+        if expires is not None and expires <= now:
+            raise CacliTimeout('deadline expired before {} was sent'.format(' '.join(command_list)))
+        if self.__timeout is None:
+            return expires
+        return now + self.__timeout if expires is None else min(expires,now + self.__timeout)
         
-        i = self.__counter.get()
-        self.__command_log[i] = {'parameters':subprocess_parameters, 'commands':command_list}
-        response = subprocess.run(subprocess_parameters,
-                            stdout = subprocess.PIPE,
-                            stderr = subprocess.PIPE,
-                            universal_newlines = True)
-        return self.__parse_reply(response,i)
+    def _retry_delay(self,error,attempt,retries,expires):
+        '''
+        arguments: error, attempt, retries, expires
+        returns: seconds to wait before retrying, or None to give up
         
+        exponential backoff with jitter, capped and kept inside the deadline
+        '''
+        if attempt > retries or not (isinstance(error,CacliTimeout)
+                or any(message in str(error) for message in TRANSIENT_ERRORS)):
+            return None
+        base,cap = self.__backoff
+        delay = random.uniform(0.5,1.0) * min(cap,base * 2 ** (attempt - 1))
+        if expires is not None and time.monotonic() + delay >= expires:
+            return None
+        return delay
         
-    def __parse_reply(self,response,i):
+    def scheduler_stats(self):
+        '''
+        returns: dictionary of queue depth, wait times and cancelled reads
+        per priority (None without a dispatcher)
         '''
-        arguments: response, i
+        if self.__dispatcher is None:
+            return None
+        return self.__dispatcher.stats()
+        
+    def coalesce_stats(self):
+        '''
+        returns: dictionary of executed, coalesced and reused read-only
+        queries (None if coalescing is disabled)
+        '''
+        if self.__singleflight is None:
+            return None
+        return self.__singleflight.stats()
+        
+    def submit(self,*command_list):
+        '''
+        arguments: *command_list
+        returns: concurrent.futures.Future of the parsed reply
+        
+        queues a raw cacli command on the dispatcher; without a dispatcher
+        the command runs immediately and a completed future is returned.
+        the timeout and any enclosing deadline() apply, but no retries
+        '''
+        expires = self._attempt_expiry(command_list,_POLICY.get().get('expires'))
+        if self.__dispatcher is not None:
+            return self.__schedule(command_list,expires)
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(self._execute(*command_list,expires=expires))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+        
+    def __schedule(self,command_list,expires):
+        return self.__dispatcher.schedule(self._execute,command_list,{'expires':expires},
+                priority=pyjanssen.dispatcher.command_priority(command_list),
+                controller=tuple(self._target()))
+        
+    def batch(self,max_workers=None):
+        '''
+        arguments: *max_workers
+        returns: pyjanssen.batch.Batch bound to this instance
+        
+        collects move/get_position/get_status/get_information/raw commands
+        and runs them together (on exit when used as a context manager)
+        '''
+        return pyjanssen.batch.Batch(self,max_workers)
+        
+    def run_many(self,command_lists,return_exceptions=False):
+        '''
+        arguments: command_lists, *return_exceptions (default False)
+        returns: list of parsed replies in submission order
+        
+        runs raw commands such as [('POS','1','1'),('STS','2')] as one batch
+        '''
+        batch = self.batch()
+        for command_list in command_lists:
+            batch.add(*command_list)
+        return batch.run(return_exceptions)
+        
+    def discover(self,addresses=range(1,7),channels=(1,2,3),path=None,refresh=False):
+        '''
+        arguments: *addresses (default 1-6), *channels (default 1-3), *path, *refresh
+        returns: pyjanssen.topology.Topology
+        
+        probes DESC on every address and INFO on every available channel of
+        the modules found, one command at a time (they all go to the one
+        controller, which serves a single client), treating module and channel errors
+        as "not present"; timeouts and CONTROLLER_ERRORS are raised. with
+        path, a saved topology is loaded instead of probing (unless refresh)
+        and each module is re-verified with one DESC the first time it is
+        looked up; a fresh probe is saved to path unless no module answered
+        '''
+        if path is not None and not refresh and os.path.isfile(path):
+            return pyjanssen.topology.Topology.load(path,self.__verify_topology(path,channels))
+        modules = self.__probe([str(address) for address in addresses],channels)
+        topology = pyjanssen.topology.Topology(modules,self.__verify_topology(path,channels))
+        topology.mark_verified()
+        if path is not None and modules:
+            topology.save(path)
+        return topology
+        
+    def __probe(self,addresses,channels):
+        # DESC on every address, then INFO on every channel of present modules
+        descriptions = {address:self.__try_run(('DESC',address)) for address in addresses}
+        modules = {}
+        requests = []
+        for address,description in descriptions.items():
+            if description is None:
+                continue
+            available = pyjanssen.topology.channels_from_description(description,channels)
+            modules[address] = {'version':description.get('Version'),'channels':available,'positioners':{}}
+            requests += [('INFO',address,str(channel)) for channel in available]
+        for request in requests:
+            information = self.__try_run(request)
+            if information is not None:
+                modules[request[1]]['positioners'][request[2]] = {'TYPE':information.get('TYPE'),'TAG':information.get('TAG')}
+        return modules
+        
+    def __try_run(self,command_list):
+        # parsed reply, or None if the module/channel is not present; fills the metadata cache
+        try:
+            reply = self._run(*command_list)
+        except CacliError as e:
+            if isinstance(e,CacliTimeout) or any(message in str(e) for message in CONTROLLER_ERRORS):
+                raise
+            return None
+        cache = self._metadata()
+        if cache is not None:
+            cache.put(tuple(command_list),reply)
+        return reply
+        
+    def __verify_topology(self,path,channels):
+        def verify(topology,address):
+            description = self.__try_run(('DESC',address))
+            module = topology.modules.get(address)
+            if description is None and module is None:
+                return
+            if (description is not None and module is not None and module['version'] == description.get('Version')
+                    and module['channels'] == pyjanssen.topology.channels_from_description(description,channels)):
+                return
+            # changed since the topology was saved: probe this module again
+            modules = self.__probe([address],channels)
+            if address in modules:
+                topology.modules[address] = modules[address]
+            else:
+                topology.modules.pop(address,None)
+            if path is not None:
+                topology.save(path)
+        return verify
+        
+    def _execute(self,*command_list,expires=None):
+        '''
+        arguments: *command_list, *expires
+        returns: parsed reply
+        
+        sends the command through the transport on the calling thread; with
+        expires (a time.monotonic() value) the child is killed at that time
+        '''
+        target,entry = self._begin(command_list)
+        start = time.perf_counter()
+        try:
+            if expires is None:
+                response = self.__transport.run(target,command_list)
+            else:
+                timeout = expires - time.monotonic()
+                if timeout <= 0:
+                    raise CacliTimeout('deadline expired before {} was sent'.format(' '.join(command_list)))
+                response = self.__transport.run(target,command_list,timeout=timeout)
+        except CacliError as e:
+            # a failure may mean the device was reconnected
+            self.invalidate_metadata()
+            self._fail(entry,e,start)
+            raise
+        except BaseException as e:
+            self._fail(entry,e,start)
+            raise
+        return self._finish(response,entry)
+        
+    def _cached(self,key,*command_list):
+        '''
+        arguments: key, *command_list
+        returns: parsed reply, from the metadata cache if enabled
+        '''
+        cache = self._metadata()
+        if cache is None:
+            return self._run(*command_list)
+        reply = cache.get(key)
+        if reply is None:
+            reply = self._run(*command_list)
+            cache.put(key,reply)
+        return reply
+        
+    def _metadata(self):
+        '''
+        returns: metadata TTLCache, or None if disabled
+        '''
+        return self.__metadata
+        
+    def invalidate_metadata(self,address=None):
+        '''
+        arguments: *address
+        
+        drops cached DESC/INFO replies for address, or for every address
+        '''
+        if self.__metadata is None:
+            return
+        if address is None:
+            self.__metadata.invalidate()
+        else:
+            self.__metadata.invalidate(('DESC',str(address)))
+            self.__metadata.invalidate(('INFO',str(address)))
+        
+    def metadata_cache_stats(self):
+        '''
+        returns: dictionary of hits, misses and entries (None if the cache is disabled)
+        '''
+        if self.__metadata is None:
+            return None
+        return self.__metadata.stats()
+        
+    def _begin(self,command_list):
+        '''
+        arguments: command_list
+        returns: target, entry
+        
+        starts a journal entry for the command before it is sent
+        '''
+        target = self._target()
+        subprocess_parameters = [self.__exe] + target + list(command_list)
+        return target,self.journal.begin(subprocess_parameters,command_list[0] if command_list else None)
+        
+    def _finish(self,response,entry):
+        '''
+        arguments: response, entry
+        returns: parsed response
+        '''
+        entry.spawn = getattr(response,'spawn_time',None)
+        entry.wait = getattr(response,'wait_time',None)
+        entry.returncode = response.returncode
+        start = time.perf_counter()
+        try:
+            reply = self.__parse_reply(response,entry)
+        except BaseException as e:
+            entry.parse = time.perf_counter() - start
+            self._fail(entry,e)
+            raise
+        entry.parse = time.perf_counter() - start
+        entry.outcome = 'ok'
+        self.journal.record(entry)
+        self._track(entry,reply)
+        return reply
+        
+    def _track(self,entry,reply):
+        '''
+        arguments: entry, reply
+        
+        feeds a successful command to the calibration store, which learns
+        counts per step from the displacement between POS reads, and to the
+        position estimator, which predicts positions from those fits
+        '''
+        arguments = entry.argv[entry.argv.index(entry.command,1) + 1:]
+        if entry.command == 'MOV':
+            address,channel,profile,temperature,direction,frequency,step_size,steps = arguments
+            axis = self._axis(address,channel)
+            settings = {'profile':profile,'temperature':temperature,'frequency':frequency,'step_size':step_size}
+            self.calibration.moved(axis,settings,direction,steps)
+            if self.estimator is not None:
+                self.estimator.moved((address,channel),direction,steps,self.calibration.model(axis,settings,direction))
+        elif entry.command == 'POS':
+            self.calibration.observed(self._axis(arguments[0],arguments[1]),reply['POS'])
+            if self.estimator is not None:
+                self.estimator.observed((arguments[0],arguments[1]),reply['POS'])
+        elif entry.command == 'RST':
+            # the counter jumped to 0: not motion to learn counts per step from
+            self.calibration.interrupted(self._axis(arguments[0],arguments[1]),0)
+            if self.estimator is not None:
+                self.estimator.reset((arguments[0],arguments[1]))
+        elif entry.command == 'STP':
+            # a move cut short did not cover its steps
+            self._untrack(entry)
+        elif entry.command in ('EXT','FBEN','FBCS','FBFE','FBXT','OEMC'):
+            # analogue input, servodrive or calibration: motion neither can follow
+            self.calibration.interrupted()
+            if self.estimator is not None:
+                self.estimator.forget()
+        
+    def _untrack(self,entry):
+        '''
+        arguments: entry
+        
+        drops the position estimates and the moves awaiting a POS read of the
+        axes a MOV or STP command addressed (STP: every channel of the
+        module), so nothing is predicted or learned from them
+        '''
+        arguments = entry.argv[entry.argv.index(entry.command,1) + 1:]
+        channels = arguments[1:2] if entry.command == 'MOV' else ('1','2','3')
+        for channel in channels:
+            self.calibration.interrupted(self._axis(arguments[0],channel))
+            if self.estimator is not None:
+                self.estimator.forget((arguments[0],channel))
+        
+    def _fail(self,entry,error,start=None):
+        '''
+        arguments: entry, error, *start
+        
+        records a command that raised error (or was cancelled) in the journal.
+        start is the time.perf_counter() value when the command was handed to
+        the transport: a command that never got a reply records the time since
+        then as its wait, so timeouts count in full in the latency histogram
+        '''
+        if start is not None and entry.spawn is None and entry.wait is None:
+            entry.wait = time.perf_counter() - start
+        if entry.command in ('MOV','STP'):
+            # the axis may or may not have moved
+            self._untrack(entry)
+        if not isinstance(error,Exception):
+            # CancelledError, KeyboardInterrupt, ...
+            entry.outcome = 'cancelled'
+        else:
+            entry.outcome = 'error'
+        entry.error = str(error)
+        self.journal.record(entry)
+        
+    def __parse_reply(self,response,entry):
+        '''
+        arguments: response, entry
         returns: parsed response
         
         designed to be used by other functions 
@@ -96,14 +592,11 @@ class MCM:
             print('args: {}\nstdout: {}\nstderr:{}'.format(response.args,response.stdout.strip(),response.stderr.strip()))
             
         self.__check_error(response,stdout)
-        this_command_log = self.__command_log.pop(i)
-
         
-        # check that the parameters from the log match the parameters from the response
-        assert this_command_log['parameters'] == response.args
+        # check that the parameters from the journal match the parameters from the response
+        assert entry.argv == response.args
         
-        request_type = this_command_log['commands'][0]
-        return pyjanssen.response.parse(request_type,stdout)
+        return pyjanssen.response.parse(entry.command,stdout)
 
         
     def __check_error(self,response,stdout):
@@ -114,6 +607,8 @@ class MCM:
         raises CacliError if device returned an error
         '''
         if stdout == "ERROR: DEVICE NOT FOUND":
+            # the device may have been reconnected: cached metadata is stale
+            self.invalidate_metadata()
             raise CacliError("Error: {}; has another program connected to the controller?".format(stdout))
         elif stdout == "Unable to comply":
             raise CacliError("Error: {}; is controller in external input mode?")
@@ -165,6 +660,13 @@ class MCM:
         self.__settings['profile'][str(address)] = profile
         
 
+    def settings(self,address):
+        '''
+        arguments: address
+        returns: dictionary of frequency, step_size, temperature, steps and profile for given address
+        '''
+        return {name:values[str(address)] for name,values in self.__settings.items()}
+        
     def frequency(self,address):
         '''
         arguments: address
@@ -252,19 +754,159 @@ class MCM:
         low-level move command requiring explicit channel
         '''
         self._is_servodrive(False,kwargs) #servodrive must be disabled
-        return self._run('MOV',str(address),str(channel),self.profile(address),
+        return self._run(*self._move_command(address,channel,direction))
+        
+    def _move_command(self,address,channel,direction,steps=None):
+        '''
+        arguments: address, channel, direction, *steps
+        returns: MOV command list using the current settings for address
+        
+        steps overrides the stored steps setting for this command only
+        '''
+        steps = self.steps(address) if steps is None else steps
+        return ('MOV',str(address),str(channel),self.profile(address),
                 str(self.temperature(address)),str(direction),str(self.frequency(address)),
-                str(self.step_size(address)),str(self.steps(address)))
+                str(self.step_size(address)),str(steps))
+    
+    def move_to(self,address,target,tolerance,channel=1,max_iterations=20,position=None,**kwargs):
+        '''
+        arguments: address, target, tolerance, *channel (default 1), *max_iterations (default 20), *position, **kwargs
+        returns: dictionary of POS, ERROR, CONVERGED, ITERATIONS, STEPS, TIME, ABORTED
+        
+        kwargs: frequency, step_size, temperature, profile, force
+        
+        closed-loop move to an encoder position (requires OEM2 module): issues
+        MOV bursts sized from the remaining error and the encoder counts per
+        step the calibration store has fitted for this axis and setting
+        (learned from earlier moves), reading POS after each, until
+        the position is within tolerance. a burst is at most MOVE_TO_GROWTH
+        times the previous one. it gives up early, with ABORTED saying why,
+        if the encoder moves against the commanded direction (FORWARD must
+        increase the count), if the error grows on two bursts in a row
+        (sized from a known counts per step), or if two bursts in a row do not move the
+        axis (stalled, e.g. at an end stop). ITERATIONS counts MOV/POS round
+        trips, TIME is in seconds. the stored steps setting is not changed.
+        position is the encoder position if the caller already knows it (the
+        POS of the previous move_to): the opening POS read is then skipped,
+        and an axis already within tolerance costs no round trip at all
+        '''
+        start = time.perf_counter()
+        self._parse_settings_kwargs(address,kwargs)
+        self._is_servodrive(False,kwargs) #servodrive must be disabled
+        if position is None:
+            position = self.get_position(address,channel,**kwargs)
+        iterations = 0
+        total_steps = 0
+        last = None
+        aborted = None
+        while abs(target - position) > tolerance and iterations < max_iterations and aborted is None:
+            direction,steps,rate = self._burst(address,channel,target - position,last)
+            self._run(*self._move_command(address,channel,direction,steps))
+            new_position = self.get_position(address,channel,**kwargs)
+            iterations += 1
+            total_steps += steps
+            aborted = self._burst_observed(direction,rate,new_position - position,target - position,last)
+            last = (steps,new_position - position,target - position)
+            position = new_position
+        return _move_to_result(target,position,tolerance,iterations,total_steps,start,aborted)
     
-    def get_position(self,address,channel=1,**kwargs):
+    def _burst(self,address,channel,error,last=None):
+        '''
+        arguments: address, channel, error, *last
+        returns: direction, steps, rate
+        
+        next move_to burst for the remaining error, sized from the counts per
+        step the calibration store has fitted for this axis and setting;
+        rate is that counts per step, None if unknown. last is (steps,
+        displacement, error before it) of the previous burst, which limits
+        how fast bursts grow
+        '''
+        direction = FORWARD if error > 0 else BACKWARD
+        model = self.calibration.model(self._axis(address,channel),self.settings(address),direction)
+        rate = None
+        if model is not None and model['COUNTS_PER_STEP'] != 0:
+            rate = abs(model['COUNTS_PER_STEP'])
+        if last is not None and last[1] == 0:
+            # too small to register: take a bigger burst
+            steps = MOVE_TO_GROWTH * last[0]
+        elif rate is None:
+            # setting never seen on this axis: probe with the stored steps setting
+            steps = self.steps(address)
+        else:
+            steps = int(round(abs(error) / rate))
+        steps = max(1,min(50000,steps))
+        if last is not None:
+            steps = min(steps,MOVE_TO_GROWTH * last[0])
+        return direction,steps,rate
+        
+    def _burst_observed(self,direction,rate,displacement,error,last=None):
+        '''
+        arguments: direction, rate, displacement, error, *last
+        returns: None, or the reason move_to should give up
+        
+        checks the encoder displacement of a move_to burst (the calibration
+        store has already learned from it); rate as returned by _burst,
+        error is the error before the burst, last as _burst
+        '''
+        if displacement * (1 if direction == FORWARD else -1) < 0:
+            return 'encoder moved against the commanded direction'
+        if displacement == 0:
+            if last is not None and last[1] == 0:
+                return 'stalled'
+            return None
+        if rate is not None and _grew(error,displacement) and last is not None and _grew(last[2],last[1]):
+            # twice in a row: a single overshoot can be noise
+            return 'error grew'
+        return None
+    
+    def _axis(self,address,channel):
         '''
-        arguments: address, *channel (default 1)
+        returns: (device, address, channel) identifying an axis in the calibration store
+        '''
+        return (self.__device,str(address),str(channel))
+        
+    def predict_steps(self,address,displacement,channel=1):
+        '''
+        arguments: address, displacement, *channel (default 1)
+        returns: (direction, steps) expected to move by displacement with the
+        current settings, or None if the axis is not calibrated
+        
+        predicted from the calibration store's fit for the axis
+        '''
+        direction = FORWARD if displacement > 0 else BACKWARD
+        steps = self.calibration.predict_steps(self._axis(address,channel),
+                self.settings(address),direction,displacement)
+        if steps is None:
+            return None
+        return direction,min(50000,steps)
+    
+    def get_position(self,address,channel=1,tolerance=None,**kwargs):
+        '''
+        arguments: address, *channel (default 1), *tolerance
         returns: position (integer)
         
         kwargs: force command to run ignoring servodrive
+        
+        with a position estimator (MCM(estimator=True)) and a tolerance in
+        encoder counts, the estimate is returned without reading POS while
+        its uncertainty is within tolerance
         '''
         self._is_servodrive(False,kwargs) #servodrive must be disabled
+        if tolerance is not None and self.estimator is not None:
+            position = self.estimator.within((str(address),str(channel)),tolerance)
+            if position is not None:
+                return position
         return self._run('POS',str(address),str(channel))['POS']
+        
+    def estimate_position(self,address,channel=1):
+        '''
+        arguments: address, *channel (default 1)
+        returns: (position, uncertainty) from the position estimator, or None
+        if the axis has not been read yet
+        '''
+        if self.estimator is None:
+            raise CacliError('no position estimator configured')
+        return self.estimator.estimate((str(address),str(channel)))
     
     def get_position_raw(self,address,channel=1,**kwargs):
         '''
@@ -300,7 +942,7 @@ class MCM:
         gets module information
         '''
         self._is_servodrive(False,kwargs) #servodrive must be disabled
-        return self._run('DESC',str(address))
+        return self._cached(('DESC',str(address)),'DESC',str(address))
         
     def get_information(self,address,channel='1',**kwargs):
         '''
@@ -312,7 +954,7 @@ class MCM:
         gets positioner information
         '''
         self._is_servodrive(False,kwargs) #servodrive must be disabled
-        return self._run('INFO',str(address),str(channel))
+        return self._cached(('INFO',str(address),str(channel)),'INFO',str(address),str(channel))
         
     def stop(self,address,**kwargs):
         '''
@@ -337,7 +979,14 @@ class MCM:
         The CADM2 module will perform an ‘automatic zero calibration’ upon power on to make sure the connected actuator will not move at an input voltage of o (zero) [V]14. However, this means that it is required to hold the input at 0 (zero) [V] during power on of the module (do not let the input float). 
         '''
         self._parse_settings_kwargs(address,kwargs)
-        self._run('EXT',str(address),str(channel),self.profile(address),
+        self._run(*self._analogue_command(address,channel,direction))
+        
+    def _analogue_command(self,address,channel,direction):
+        '''
+        arguments: address, channel, direction
+        returns: EXT command list using the current settings for address
+        '''
+        return ('EXT',str(address),str(channel),self.profile(address),
                 str(self.temperature(address)),str(direction),str(self.frequency(address)),
                 str(self.step_size(address)))
         
@@ -353,11 +1002,103 @@ class MCM:
         self._is_servodrive(False,kwargs) #servodrive must be disabled
         return self._run('RST',str(address),str(channel))
         
-    def autocalibrate(self,address,channel,**kwargs):
-        # this is interactive and must be handled using Popen separately
-        # OEMC encoder autocalibration command
+    def autocalibrate(self,address,channel,progress=None,prompts=None,timeout=600,**kwargs):
+        '''
+        arguments: address, channel, *progress, *prompts, *timeout (default 600)
+        returns: dictionary of the reply after the last prompt (e.g. STATUS)
+        
+        kwargs: force command to run ignoring servodrive
+        
+        runs the interactive OEMC encoder calibration in a cacli process of
+        its own, answering its prompts. progress(address, channel, percent)
+        is called as progress lines arrive. prompts replaces OEMC_PROMPTS: a
+        list of (pattern, answer), answer being text or a function of the
+        regular expression match returning text. the process is killed and
+        CacliTimeout raised after timeout seconds, or at the end of an
+        enclosing deadline() if that comes first. in dispatcher mode the
+        calibration is queued like any other command, so nothing else is
+        sent to the controller while it runs
+        '''
         self._is_servodrive(False,kwargs) #servodrive must be disabled
-        raise CacliError('command not implemented yet')
+        prompts = OEMC_PROMPTS if prompts is None else prompts
+        expires = time.monotonic() + timeout
+        expires = min(expires,_POLICY.get().get('expires',expires))
+        if expires <= time.monotonic():
+            raise CacliTimeout('deadline expired before OEMC {} {} was sent'.format(address,channel))
+        if self.__dispatcher is None:
+            return self._calibrate(address,channel,progress,prompts,expires)
+        future = self.__dispatcher.schedule(self._calibrate,(address,channel,progress,prompts,expires),
+                controller=tuple(self._target()))
+        try:
+            return future.result(max(0.0,expires - time.monotonic()))
+        except concurrent.futures.TimeoutError:
+            if future.cancel():
+                raise CacliTimeout('OEMC {} {} did not start before its deadline'.format(address,channel))
+        # started: the dialogue enforces the deadline itself
+        return future.result()
+        
+    def _calibrate(self,address,channel,progress,prompts,expires):
+        '''
+        arguments: address, channel, progress, prompts, expires
+        returns: dictionary of the reply after the last prompt
+        
+        the OEMC dialogue of autocalibrate, killed at expires (a
+        time.monotonic() value)
+        '''
+        patterns = [pattern for pattern,answer in prompts] + [OEMC_PROGRESS,pyjanssen.interactive.EOF]
+        target,entry = self._begin(('OEMC',str(address),str(channel)))
+        start = time.perf_counter()
+        deadline = expires
+        try:
+            with pyjanssen.interactive.InteractiveSession(entry.argv) as session:
+                spawned = time.perf_counter()
+                while True:
+                    i,match = session.expect(patterns,deadline - time.monotonic())
+                    if i < len(prompts):
+                        answer = prompts[i][1]
+                        session.send(answer(match) if callable(answer) else answer)
+                    elif i == len(prompts):
+                        if progress is not None:
+                            progress(address,channel,int(match.group(1)))
+                    else:
+                        break
+                returncode = session.wait(max(0.0,deadline - time.monotonic()) + 1)
+                stdout = session.read(0) or ''
+        except CacliTimeout:
+            error = CacliTimeout('OEMC {} {} did not finish within {:.3g} s'.format(address,channel,
+                    time.perf_counter() - start))
+            self._fail(entry,error,start)
+            raise error
+        except BaseException as e:
+            self._fail(entry,e,start)
+            raise
+        response = pyjanssen.transport.Reply(entry.argv,returncode,stdout,'',
+                spawned - start,time.perf_counter() - spawned)
+        return self._finish(response,entry)
+        
+    def autocalibrate_all(self,axes,progress=None,return_exceptions=False,**kwargs):
+        '''
+        arguments: axes, *progress, *return_exceptions (default False), **kwargs
+        returns: dictionary of (address, channel): autocalibrate reply
+        
+        calibrates the (address, channel) axes one after another: they all
+        belong to this controller, which serves one cacli process at a time
+        (Fleet.autocalibrate_all runs several controllers concurrently).
+        kwargs as autocalibrate. with return_exceptions an axis that failed
+        maps to its exception, otherwise the first failure is raised once
+        every calibration has been tried
+        '''
+        results = {}
+        for axis in axes:
+            axis = tuple(axis)
+            try:
+                results[axis] = self.autocalibrate(axis[0],axis[1],progress,**kwargs)
+            except Exception as e:
+                results[axis] = e
+        for reply in results.values():
+            if isinstance(reply,Exception) and not return_exceptions:
+                raise reply
+        return results
 
     def _is_servodrive(self,desired_state,kwargs):
         '''
@@ -375,6 +1116,20 @@ class MCM:
         else:
             raise CacliError('Servodrive is currently disabled and you sent a Servodrive command!')
         
+    def servodrive_enabled(self):
+        '''
+        returns: True if servodrive is enabled
+        '''
+        return self.__servodrive_enabled
+        
+    def _set_servodrive(self,state):
+        '''
+        arguments: state
+        
+        records whether servodrive is enabled
+        '''
+        self.__servodrive_enabled = state
+        
     def enable_servodrive(self,pgain=300,**kwargs):
         '''
         arguments: *pgain (default 300)
@@ -382,18 +1137,27 @@ class MCM:
         
         uses values from channel 1 when setting TEMP, TYPE
         '''
-        self.__servodrive_enabled = True
+        return self._run(*self._enable_servodrive_command(pgain,kwargs))
+        
+    def _enable_servodrive_command(self,pgain,kwargs):
+        '''
+        arguments: pgain, kwargs
+        returns: FBEN command list
+        
+        marks servodrive as enabled and applies temperature/profile kwargs to channel 1
+        '''
+        self._set_servodrive(True)
         if 'temperature' in kwargs:
             self.set_temperature('1',kwargs['temperature'])
         if 'profile' in kwargs:
             self.set_profile('1',kwargs['profile'])
-        return self._run('FBEN',str(pgain),str(self.profile('1')),str(self.temperature('1')))
+        return ('FBEN',str(pgain),str(self.profile('1')),str(self.temperature('1')))
         
     def disable_servodrive(self):
         '''
         returns: dictionary of STATUS
         '''
-        self.__servodrive_enabled = False
+        self._set_servodrive(False)
         return self._run('FBXT')
         
     def servodrive_go_to(self,pos1=0,pos2=0,pos3=0,**kwargs):
@@ -435,12 +1199,97 @@ class MCM:
         self._is_servodrive(True,kwargs)
         return self._run('FBST')
         
+    def wait_until_settled(self,tolerance=0,timeout=30,expected=None,min_interval=0.005,max_interval=0.25,**kwargs):
+        '''
+        arguments: *tolerance (default 0), *timeout (default 30), *expected, *min_interval, *max_interval
+        returns: dictionary of SETTLED, TIME, POLLS and STATUS (last FBST reply)
         
-class CacliError(Exception):
-    # Exception when returncode != 0
-    def __init__(self,error):
-        self.error = error
+        polls FBST after servodrive_go_to/servodrive_find_end_stops until BUSY
+        is 0 and every ERRx is within tolerance, or until timeout seconds.
+        the poll interval adapts between min_interval and max_interval: short
+        near the expected settle time (seconds, if given, otherwise
+        extrapolated from how fast the error shrinks), longer while far away
+        '''
+        self._is_servodrive(True,kwargs)
+        poller = pyjanssen.settle.AdaptivePoller(min_interval,max_interval,expected)
+        start = time.perf_counter()
+        polls = 0
+        while True:
+            status = self._run('FBST')
+            polls += 1
+            elapsed = time.perf_counter() - start
+            distance = _servo_distance(status,tolerance)
+            if distance == 0 or elapsed >= timeout:
+                return {'SETTLED':distance == 0,'TIME':elapsed,'POLLS':polls,'STATUS':status}
+            time.sleep(min(poller.next(distance,elapsed),timeout - elapsed))
+            
+    def wait_until_stopped(self,address,channel=1,tolerance=0,timeout=30,min_interval=0.005,max_interval=0.25,**kwargs):
+        '''
+        arguments: address, *channel (default 1), *tolerance (default 0), *timeout (default 30), *min_interval, *max_interval
+        returns: dictionary of STOPPED, TIME, POLLS and POS
         
-    def __str__(self):
-        return repr(self.error)
-    
+        plain-MOV equivalent of wait_until_settled: polls POS until it has
+        stayed within tolerance for at least one step period (1/frequency
+        of address, so a slow axis is not taken as stopped between two of
+        its steps), with the interval adapting to how fast the axis is
+        slowing down
+        '''
+        self._is_servodrive(False,kwargs) #servodrive must be disabled
+        poller = pyjanssen.settle.AdaptivePoller(min_interval,max_interval)
+        period = _step_period(self.frequency(address))
+        start = time.perf_counter()
+        previous = None
+        polls = 0
+        while True:
+            position = self._run('POS',str(address),str(channel))['POS']
+            polls += 1
+            elapsed = time.perf_counter() - start
+            delay,previous,stopped = _stop_check(poller,previous,position,elapsed,tolerance,period,min_interval)
+            if stopped or elapsed >= timeout:
+                return {'STOPPED':stopped,'TIME':elapsed,'POLLS':polls,'POS':position}
+            time.sleep(min(delay,timeout - elapsed))
+
+
+def _move_to_result(target,position,tolerance,iterations,steps,start,aborted):
+    # move_to reply
+    return {'POS':position,
+        'ERROR':target - position,
+        'CONVERGED':abs(target - position) <= tolerance,
+        'ITERATIONS':iterations,
+        'STEPS':steps,
+        'TIME':time.perf_counter() - start,
+        'ABORTED':aborted}
+
+def _grew(error,displacement):
+    # True if a burst that moved by displacement left a larger error than it started with
+    return abs(error - displacement) > abs(error)
+
+def _servo_distance(status,tolerance):
+    # how far an FBST reply is from settled: largest error beyond tolerance (at least 1 while BUSY)
+    distance = max(max(0,abs(status[key]) - tolerance) for key in ('ERR1','ERR2','ERR3'))
+    if status['BUSY'] and distance == 0:
+        return 1
+    return distance
+
+def _step_period(frequency):
+    # seconds between steps at frequency (Hz); 0 if not stepping
+    return 1 / frequency if frequency > 0 else 0.0
+
+def _stop_check(poller,previous,position,elapsed,tolerance,period,min_interval):
+    # wait_until_stopped: returns (delay before the next poll, reference
+    # (position, elapsed) reading, stopped). the reference is the first of
+    # the readings within tolerance of each other, and the axis counts as
+    # stopped once they span at least one step period
+    if previous is not None and abs(position - previous[0]) <= tolerance:
+        if elapsed - previous[1] >= period:
+            return 0.0,previous,True
+        # unchanged so far: look again once a whole step period has passed
+        return max(min_interval,previous[1] + period - elapsed),previous,False
+    speed = _speed(previous,position,elapsed)
+    return (poller.next(speed,elapsed) if speed else min_interval),(position,elapsed),False
+
+def _speed(previous,position,elapsed):
+    # counts per second since the previous (position, elapsed) reading
+    if previous is None:
+        return 0
+    return abs(position - previous[0]) / max(elapsed - previous[1],1e-9)
@@ -0,0 +1,177 @@
+#
+# Python library for Janssen MCM controller
+# Bounded command journal and latency histograms
+#
+
+import bisect
+import collections
+import itertools
+import threading
+import time
+
+
+class JournalEntry:
+    '''
+    one command: argv, phase durations (seconds), returncode and outcome
+
+    spawn: starting the process (or handing the command to the transport)
+    wait: waiting for the reply
+    parse: checking and parsing the reply
+    outcome: 'ok', 'error' or 'cancelled'; error holds the message
+    '''
+    __slots__ = ('id','command','argv','started','spawn','wait','parse','returncode','outcome','error')
+
+    def __init__(self,id,argv,command):
+        self.id = id
+        self.argv = argv
+        self.command = command
+        self.started = time.time()
+        self.spawn = None
+        self.wait = None
+        self.parse = None
+        self.returncode = None
+        self.outcome = None
+        self.error = None
+
+    def total(self):
+        '''
+        returns: sum of the recorded phase durations
+        '''
+        return sum(phase for phase in (self.spawn,self.wait,self.parse) if phase is not None)
+
+    def to_dict(self):
+        return {name:getattr(self,name) for name in self.__slots__}
+
+    def __repr__(self):
+        return 'JournalEntry({})'.format(', '.join('{}={!r}'.format(name,getattr(self,name)) for name in self.__slots__))
+
+
+def _bounds(low=1e-5,high=100.0,per_decade=8):
+    # logarithmic bucket upper bounds in seconds
+    bounds = []
+    value = low
+    while value < high:
+        bounds.append(value)
+        value *= 10 ** (1 / per_decade)
+    return bounds + [high]
+
+_BOUNDS = _bounds()
+
+
+class LatencyHistogram:
+    '''
+    latency histogram with logarithmic buckets from 10 us to 100 s
+    '''
+    def __init__(self,bounds=_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.errors = 0
+
+    def add(self,seconds,error=False):
+        self.counts[bisect.bisect_left(self.bounds,seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.min = seconds if self.min is None else min(self.min,seconds)
+        self.max = seconds if self.max is None else max(self.max,seconds)
+        if error:
+            self.errors += 1
+
+    def percentile(self,p):
+        '''
+        arguments: p (0-100)
+        returns: upper bound of the bucket holding the p-th percentile (seconds)
+        '''
+        if self.count == 0:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for i,count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.bounds[i],self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self):
+        '''
+        returns: dictionary of count, errors, mean, min, p50, p90, p99 and max (seconds)
+        '''
+        return {'count':self.count,
+            'errors':self.errors,
+            'mean':self.sum / self.count if self.count else None,
+            'min':self.min,
+            'p50':self.percentile(50),
+            'p90':self.percentile(90),
+            'p99':self.percentile(99),
+            'max':self.max}
+
+
+class CommandJournal:
+    '''
+    fixed-size ring of the most recent JournalEntry objects plus latency
+    histograms per command type (MOV, POS, FBST, ...)
+
+    maxlen: number of entries kept (default 1024)
+
+    hooks added with add_hook(fn) are called as fn(entry) after every
+    command, e.g. to export metrics; exceptions raised by hooks are ignored
+    '''
+    def __init__(self,maxlen=1024):
+        self.entries = collections.deque(maxlen=maxlen)
+        self.histograms = {}
+        self.__ids = itertools.count()
+        self.__hooks = []
+        self.__lock = threading.Lock()
+
+    def begin(self,argv,command):
+        '''
+        arguments: argv, command
+        returns: new JournalEntry (recorded once finished)
+        '''
+        return JournalEntry(next(self.__ids),argv,command)
+
+    def record(self,entry):
+        '''
+        arguments: entry
+
+        stores a finished entry, updates its histogram and calls the hooks
+        '''
+        with self.__lock:
+            self.entries.append(entry)
+            histogram = self.histograms.get(entry.command)
+            if histogram is None:
+                histogram = self.histograms[entry.command] = LatencyHistogram()
+            histogram.add(entry.total(),entry.outcome != 'ok')
+            hooks = list(self.__hooks)
+        for hook in hooks:
+            try:
+                hook(entry)
+            except Exception:
+                pass
+
+    def add_hook(self,hook):
+        with self.__lock:
+            self.__hooks.append(hook)
+
+    def remove_hook(self,hook):
+        with self.__lock:
+            self.__hooks.remove(hook)
+
+    def recent(self,n=None):
+        '''
+        arguments: *n
+        returns: list of the last n entries (default all kept)
+        '''
+        with self.__lock:
+            entries = list(self.entries)
+        return entries if n is None else entries[-n:]
+
+    def stats(self):
+        '''
+        returns: dictionary of command type: histogram summary
+        '''
+        with self.__lock:
+            return {command:histogram.summary() for command,histogram in self.histograms.items()}
@@ -0,0 +1,216 @@
+#
+# Python library for Janssen MCM controller
+# Chunked columnar position logs for long runs
+#
+# requires numpy
+#
+# a log is a directory of numbered .npy chunks of LOG_DTYPE rows. the writer
+# fills one preallocated chunk in memory and writes it out whole (to a
+# temporary file, then renamed), so a crash loses at most the chunk being
+# filled. the reader memory-maps the chunks and only touches the ones a
+# time range needs
+#
+
+import glob
+import os
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pyjanssen.errors import CacliError
+
+LOG_DTYPE = [('time','f8'),('device','i4'),('address','u1'),('channel','u1'),('POS','i8'),('RVL','i8'),('ERR','i8')]
+
+# device column value for an MCM without a device id
+NO_DEVICE = -1
+
+_CHUNK = 'chunk-{:08d}.npy'
+
+
+def _chunk_paths(path):
+    return sorted(glob.glob(os.path.join(path,'chunk-[0-9]*.npy')))
+
+
+def _device(device):
+    return NO_DEVICE if device is None else int(device)
+
+
+class PositionLogWriter:
+    '''
+    append-only position log in directory path
+
+    arguments: path, *chunk_rows (default 65536), *device
+
+    rows are (time, device, address, channel, POS, RVL, ERR); device
+    defaults to the writer's. a chunk is written out when chunk_rows rows
+    have been added, on flush() and on close(); an existing log is
+    continued. timestamps should not decrease, as the reader searches them
+    '''
+    def __init__(self,path,chunk_rows=65536,device=None):
+        if numpy is None:
+            raise CacliError('PositionLogWriter requires numpy')
+        assert chunk_rows > 0
+        self.path = path
+        self.device = _device(device)
+        os.makedirs(path,exist_ok=True)
+        for leftover in glob.glob(os.path.join(path,'*.tmp')):
+            # a chunk that was being written when the writer died
+            os.remove(leftover)
+        existing = _chunk_paths(path)
+        self.chunks = int(os.path.basename(existing[-1])[6:-4]) + 1 if existing else 0
+        self.rows = 0
+        self.__buffer = numpy.zeros(chunk_rows,dtype=LOG_DTYPE)
+        self.__filled = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def append(self,timestamp,address,channel,pos,rvl=0,err=0,device=None):
+        '''
+        arguments: timestamp, address, channel, pos, *rvl, *err, *device
+        '''
+        self.__buffer[self.__filled] = (timestamp,self.device if device is None else _device(device),
+                int(address),int(channel),pos,rvl,err)
+        self.__filled += 1
+        self.rows += 1
+        if self.__filled == len(self.__buffer):
+            self.flush()
+
+    def write_samples(self,rows):
+        '''
+        arguments: rows of (time, address, channel, POS, RVL)
+
+        usable as PositionSampler(..., callback=writer.write_samples)
+        '''
+        for timestamp,address,channel,pos,rvl in rows:
+            self.append(timestamp,address,channel,pos,rvl)
+
+    def log_position(self,mcm,address,channel=1):
+        '''
+        arguments: mcm, address, *channel (default 1)
+        returns: parsed POS reply
+
+        reads POS and RVL and appends them with the current time
+        '''
+        reply = mcm._run('POS',str(address),str(channel))
+        self.append(time.time(),address,channel,reply['POS'],reply['RVL'])
+        return reply
+
+    def log_servodrive(self,mcm,channels=(1,2,3)):
+        '''
+        arguments: mcm, *channels (default 1-3)
+        returns: parsed FBST reply
+
+        reads servodrive_status_position and appends one row per channel
+        with POSx and ERRx (address 1)
+        '''
+        status = mcm.servodrive_status_position()
+        now = time.time()
+        for channel in channels:
+            self.append(now,1,channel,status['POS{}'.format(channel)],0,status['ERR{}'.format(channel)])
+        return status
+
+    def flush(self):
+        '''
+        writes the rows added since the last chunk as a chunk of their own
+        '''
+        if self.__filled == 0:
+            return
+        final = os.path.join(self.path,_CHUNK.format(self.chunks))
+        temporary = final + '.tmp'
+        with open(temporary,'wb') as f:
+            numpy.save(f,self.__buffer[:self.__filled])
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary,final)
+        self.chunks += 1
+        self.__filled = 0
+
+    def close(self):
+        self.flush()
+
+
+class PositionLogReader:
+    '''
+    read-only view of a position log; chunks are memory-mapped on first
+    use, so opening a log of any size is cheap
+
+    arguments: path
+    '''
+    def __init__(self,path):
+        if numpy is None:
+            raise CacliError('PositionLogReader requires numpy')
+        self.path = path
+        self.__paths = []
+        self.__maps = {}
+        self.refresh()
+
+    def refresh(self):
+        '''
+        picks up chunks written since the log was opened
+        '''
+        self.__paths = _chunk_paths(self.path)
+
+    def chunk(self,i):
+        '''
+        arguments: i
+        returns: memory-mapped array of chunk i
+        '''
+        path = self.__paths[i]
+        data = self.__maps.get(path)
+        if data is None:
+            data = self.__maps[path] = numpy.load(path,mmap_mode='r')
+        return data
+
+    def __len__(self):
+        return sum(len(self.chunk(i)) for i in range(len(self.__paths)))
+
+    def time_range(self):
+        '''
+        returns: (first, last) timestamp, or None for an empty log
+        '''
+        if not self.__paths:
+            return None
+        return float(self.chunk(0)['time'][0]),float(self.chunk(len(self.__paths) - 1)['time'][-1])
+
+    def chunks(self,start=None,end=None):
+        '''
+        arguments: *start, *end (timestamps)
+        returns: generator of memory-mapped views of the rows with
+        start <= time < end, one per chunk, without copying
+        '''
+        for i in range(len(self.__paths)):
+            data = self.chunk(i)
+            times = data['time']
+            if start is not None and times[-1] < start:
+                continue
+            if end is not None and times[0] >= end:
+                break
+            first = 0 if start is None else numpy.searchsorted(times,start,'left')
+            last = len(data) if end is None else numpy.searchsorted(times,end,'left')
+            if first < last:
+                yield data[first:last]
+
+    def slice(self,start=None,end=None,device=None,address=None,channel=None):
+        '''
+        arguments: *start, *end, *device, *address, *channel
+        returns: numpy array (in memory) of the rows with start <= time < end,
+        optionally only for one device/address/channel
+        '''
+        parts = []
+        for rows in self.chunks(start,end):
+            mask = None
+            for name,value in (('device',None if device is None else _device(device)),('address',address),('channel',channel)):
+                if value is not None:
+                    match = rows[name] == int(value)
+                    mask = match if mask is None else mask & match
+            parts.append(numpy.array(rows if mask is None else rows[mask]))
+        if not parts:
+            return numpy.zeros(0,dtype=LOG_DTYPE)
+        return numpy.concatenate(parts)
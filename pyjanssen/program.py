@@ -0,0 +1,275 @@
+#
+# Python library for Janssen MCM controller
+# Compiled motion programs
+#
+# a MotionProgram is a recipe of steps built with chained calls:
+#
+#   program = MotionProgram().settings(1,frequency=200).move(1,FORWARD,steps=500).read(1).wait(0.1)
+#   program.save('recipe.json')
+#   compiled = MotionProgram.load('recipe.json').compile()
+#   compiled.run(m)
+#
+# compile() checks every step once and turns it into ready-made cacli
+# argument tuples (identical ones shared), so run() does no per-step
+# validation, settings lookups or formatting
+#
+
+import json
+import time
+
+from pyjanssen.errors import CacliError
+
+# same limits as MCM.set_frequency, set_step_size, set_temperature and set_steps
+LIMITS = {'frequency':(0,600),'step_size':(0,100),'temperature':(0,300),'steps':(0,50000)}
+DEFAULT_SETTINGS = {'frequency':100,'step_size':100,'temperature':293,'steps':100,'profile':'PROFILE1'}
+
+# compiled operations
+COMMAND = 0     # run argv, discard the reply
+RECORD = 1      # run argv, keep the reply
+WAIT = 2        # sleep
+SETTLE = 3      # MCM.wait_until_settled
+SERVO_ON = 4    # FBEN
+SERVO_OFF = 5   # FBXT
+
+
+class MotionProgram:
+    '''
+    editable list of steps; each builder method appends one step and
+    returns the program. move settings not given are inherited from the
+    previous settings/move step for that address (as MCM retains them)
+    '''
+    def __init__(self,steps=None):
+        self.steps = [dict(step) for step in steps or []]
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __add(self,op,**arguments):
+        self.steps.append(dict(arguments,op=op))
+        return self
+
+    def settings(self,address,**settings):
+        '''
+        arguments: address, **settings (frequency, step_size, temperature, steps, profile)
+        '''
+        return self.__add('settings',address=address,**settings)
+
+    def move(self,address,direction,channel=1,**settings):
+        return self.__add('move',address=address,direction=direction,channel=channel,**settings)
+
+    def read(self,address,channel=1):
+        '''
+        POS; the reply is kept in the results
+        '''
+        return self.__add('read',address=address,channel=channel)
+
+    def status(self,address):
+        '''
+        STS; the reply is kept in the results
+        '''
+        return self.__add('status',address=address)
+
+    def stop(self,address):
+        return self.__add('stop',address=address)
+
+    def wait(self,seconds):
+        return self.__add('wait',seconds=seconds)
+
+    def servodrive_enable(self,pgain=300,**settings):
+        '''
+        arguments: *pgain, **settings (temperature, profile of address 1)
+        '''
+        return self.__add('servodrive_enable',pgain=pgain,**settings)
+
+    def servodrive_go_to(self,pos1=0,pos2=0,pos3=0):
+        return self.__add('servodrive_go_to',pos1=pos1,pos2=pos2,pos3=pos3)
+
+    def servodrive_wait(self,tolerance=0,timeout=30):
+        '''
+        MCM.wait_until_settled; the result is kept in the results
+        '''
+        return self.__add('servodrive_wait',tolerance=tolerance,timeout=timeout)
+
+    def servodrive_status(self):
+        '''
+        FBST; the reply is kept in the results
+        '''
+        return self.__add('servodrive_status')
+
+    def servodrive_disable(self):
+        return self.__add('servodrive_disable')
+
+    def to_json(self):
+        return json.dumps({'version':1,'steps':self.steps},indent=1)
+
+    @classmethod
+    def from_json(cls,text):
+        data = json.loads(text)
+        if data.get('version') != 1:
+            raise CacliError('unsupported motion program version {}'.format(data.get('version')))
+        return cls(data['steps'])
+
+    def save(self,path):
+        with open(path,'w') as f:
+            f.write(self.to_json())
+
+    @classmethod
+    def load(cls,path):
+        with open(path) as f:
+            return cls.from_json(f.read())
+
+    def compile(self,mcm=None,servodrive=False):
+        '''
+        arguments: *mcm, *servodrive
+        returns: CompiledProgram
+
+        starting settings come from mcm (or MCM's defaults); servodrive is
+        the state the program expects at its start. raises CacliError naming
+        the first invalid step
+        '''
+        start_servodrive = servodrive
+        settings = {}
+        commands = {}
+        ops = []
+
+        def current(address):
+            if address not in settings:
+                if mcm is not None:
+                    try:
+                        settings[address] = mcm.settings(address)
+                    except KeyError:
+                        settings[address] = dict(DEFAULT_SETTINGS)
+                else:
+                    settings[address] = dict(DEFAULT_SETTINGS)
+            return settings[address]
+
+        def command(*argv):
+            # one shared tuple per distinct command
+            return commands.setdefault(argv,argv)
+
+        for i,step in enumerate(self.steps):
+            try:
+                op = step['op']
+                if op in ('move','stop','read','status') and servodrive:
+                    raise CacliError('servodrive is enabled')
+                if op in ('servodrive_go_to','servodrive_wait','servodrive_status') and not servodrive:
+                    raise CacliError('servodrive is disabled')
+                if op == 'settings':
+                    current(str(step['address'])).update(_settings(step))
+                elif op == 'move':
+                    address = str(step['address'])
+                    values = current(address)
+                    values.update(_settings(step))
+                    direction = int(step['direction'])
+                    if direction not in (0,1):
+                        raise CacliError('direction must be FORWARD or BACKWARD')
+                    ops.append((COMMAND,command('MOV',address,str(int(step.get('channel',1))),str(values['profile']),
+                            str(values['temperature']),str(direction),str(values['frequency']),
+                            str(values['step_size']),str(values['steps'])),i))
+                elif op == 'read':
+                    ops.append((RECORD,command('POS',str(int(step['address'])),str(int(step.get('channel',1)))),i))
+                elif op == 'status':
+                    ops.append((RECORD,command('STS',str(int(step['address']))),i))
+                elif op == 'stop':
+                    ops.append((COMMAND,command('STP',str(int(step['address']))),i))
+                elif op == 'wait':
+                    seconds = float(step['seconds'])
+                    if seconds < 0:
+                        raise CacliError('negative wait')
+                    ops.append((WAIT,seconds,i))
+                elif op == 'servodrive_enable':
+                    values = current('1')
+                    values.update(_settings({name:step[name] for name in ('temperature','profile') if name in step}))
+                    ops.append((SERVO_ON,command('FBEN',str(int(step.get('pgain',300))),str(values['profile']),str(values['temperature'])),i))
+                    servodrive = True
+                elif op == 'servodrive_go_to':
+                    ops.append((COMMAND,command('FBCS',*(str(int(step.get(name,0))) for name in ('pos1','pos2','pos3'))),i))
+                elif op == 'servodrive_wait':
+                    ops.append((SETTLE,(step.get('tolerance',0),step.get('timeout',30)),i))
+                elif op == 'servodrive_status':
+                    ops.append((RECORD,command('FBST'),i))
+                elif op == 'servodrive_disable':
+                    ops.append((SERVO_OFF,command('FBXT'),i))
+                    servodrive = False
+                else:
+                    raise CacliError('unknown step {!r}'.format(op))
+            except (KeyError,TypeError,ValueError) as e:
+                raise CacliError('step {} ({}): invalid arguments ({})'.format(i,step.get('op'),e))
+            except CacliError as e:
+                raise CacliError('step {} ({}): {}'.format(i,step.get('op'),e.error))
+        return CompiledProgram(ops,len(commands),start_servodrive,servodrive)
+
+
+def _settings(step):
+    # validated settings named in step
+    values = {}
+    for name in DEFAULT_SETTINGS:
+        if name not in step:
+            continue
+        if name == 'profile':
+            values[name] = str(step[name])
+            continue
+        value = step[name]
+        if isinstance(value,bool) or not isinstance(value,(int,float)):
+            raise CacliError('{} must be a number'.format(name))
+        low,high = LIMITS[name]
+        if not low <= value <= high:
+            raise CacliError('{} {} outside {}-{}'.format(name,value,low,high))
+        values[name] = value
+    return values
+
+
+class CompiledProgram:
+    '''
+    validated program: a list of (operation, argument, step) triples with
+    every cacli argument list already built; produced by MotionProgram.compile()
+
+    unique is the number of distinct command argument lists; servodrive and
+    end_servodrive the servodrive states the program starts in and leaves behind
+    '''
+    def __init__(self,ops,unique,servodrive,end_servodrive):
+        self.ops = ops
+        self.unique = unique
+        self.servodrive = servodrive
+        self.end_servodrive = end_servodrive
+
+    def __len__(self):
+        return len(self.ops)
+
+    def run(self,mcm):
+        '''
+        arguments: mcm
+        returns: dictionary of RESULTS (list of (step, reply) for read,
+        status and servodrive_wait/status steps, step indexing
+        MotionProgram.steps), STEPS, TIME and RATE (steps per second)
+
+        a failing step raises as the equivalent MCM call would; the steps
+        before it have run
+        '''
+        if mcm.servodrive_enabled() != self.servodrive:
+            raise CacliError('program compiled for servodrive {} but it is {}'.format(
+                    'enabled' if self.servodrive else 'disabled','enabled' if mcm.servodrive_enabled() else 'disabled'))
+        run = mcm._run
+        results = []
+        record = results.append
+        start = time.perf_counter()
+        for op,argument,step in self.ops:
+            if op == COMMAND:
+                run(*argument)
+            elif op == RECORD:
+                record((step,run(*argument)))
+            elif op == WAIT:
+                time.sleep(argument)
+            elif op == SETTLE:
+                record((step,mcm.wait_until_settled(*argument)))
+            elif op == SERVO_ON:
+                mcm._set_servodrive(True)
+                run(*argument)
+            elif op == SERVO_OFF:
+                mcm._set_servodrive(False)
+                run(*argument)
+        elapsed = time.perf_counter() - start
+        return {'RESULTS':results,
+            'STEPS':len(self.ops),
+            'TIME':elapsed,
+            'RATE':len(self.ops) / elapsed if elapsed > 0 else 0.0}
@@ -3,6 +3,13 @@
 # Response processors
 # By Rob Heath, 27/11/2018
 #
+# replies are parsed against per-command schemas built once at import;
+# each schema declares the expected fields and their conversions and
+# produces Record objects, dictionaries that also expose the fields as
+# attributes
+#
+
+from pyjanssen.errors import CacliError
 
 
 def parse(request_type,stdout):
@@ -17,107 +24,120 @@ def break_up(stdout,conversions={}):
     #  "thing : value\nthing2 : value2"
     # and returns
     # {"thing":"value","thing2":"value2"}
+    # values may contain ':'; lines without ':' are skipped
     data = {}
     for row in stdout.split('\n'):
-        items = row.split(':')
-        data[items[0].strip()] = items[1].strip() if items[0].strip() not in conversions else conversions[items[0].strip()](items[1].strip())
-        #print('{} in {}: {}'.format(items[0].strip(),conversions,items[0].strip() in conversions))
+        key,separator,value = row.partition(':')
+        if not separator:
+            continue
+        key = key.strip()
+        data[key] = _convert(conversions.get(key),value.strip(),key)
     return data
-    
-def _parse_mov(stdout):
-    # MOV Basedrive move command
-    b = break_up(stdout)
-    return b
-
-def _parse_ext(stdout):
-    # EXT Flexdrive external mode input command
-    b = break_up(stdout)
-    return b
-
-def _parse_stp(stdout):
-    # STP Basedrive stop command
-    b = break_up(stdout)
-    return b
-
-def _parse_sts(stdout):
-    # STS Basedrive status command
-    b = break_up(stdout)
-    return b
-
-def _parse_info(stdout):
-    # INFO information command
-    b = break_up(stdout)
-    return b
-
-def _parse_pos(stdout):
-    # POS encoder position command
-    b = break_up(stdout,{'POS':int,'RVL':int})
-    return b
+
+def _convert(conversion,value,key=None):
+    # applies conversion; a malformed value raises CacliError
+    if conversion is None:
+        return value
+    try:
+        return conversion(value)
+    except ValueError:
+        raise CacliError('malformed {} value in reply: {!r}'.format(key,value.strip()))
+
+
+class Record(dict):
+    '''
+    parsed reply: a dictionary of its fields, with the values converted as
+    the schema declares; declared fields can also be read as attributes
+    (record.POS, record.FAILSAFE_STATE; None if the reply lacked them)
+
+    records pickle and serialise to JSON like plain dictionaries
+    '''
+    __slots__ = ()
+    command = None
+    fields = ()
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__,dict.__repr__(self))
+
+    def __reduce__(self):
+        # record classes are built per schema, so they pickle by command
+        return _record,(self.command,dict(self))
+
+    def to_dict(self):
+        '''
+        returns: plain dictionary copy of the record
+        '''
+        return dict(self)
+
+
+def _record(command,data):
+    # unpickles a Record
+    return SCHEMAS[command].record(data)
+
+def _attribute(name):
+    # attribute name for a reply key, e.g. 'FAILSAFE STATE' -> 'FAILSAFE_STATE'
+    return ''.join(c if c.isalnum() else '_' for c in name)
+
+def _field_property(key):
+    return property(lambda self: self.get(key))
+
+
+class Schema:
+    '''
+    fields and conversions expected in the reply to one command
+
+    arguments: command, fields
+    fields is a sequence of (key, conversion) with conversion None for strings
+
+    a value that fails its conversion raises CacliError; undeclared fields
+    are kept as strings
+    '''
+    def __init__(self,command,fields):
+        self.command = command
+        self.fields = tuple(key for key,conversion in fields)
+        self.conversions = {key:conversion for key,conversion in fields if conversion is not None}
+        namespace = {'__slots__':(),'command':command,'fields':self.fields}
+        for key in self.fields:
+            namespace[_attribute(key)] = _field_property(key)
+        self.record = type('{}Record'.format(command.capitalize()),(Record,),namespace)
+
+    def __call__(self,stdout):
+        '''
+        arguments: stdout
+        returns: Record
+        '''
+        return self.record(break_up(stdout,self.conversions))
+
+    parse = __call__
 
 def _parse_rst(stdout):
     # RST reset encoder position command
     return stdout
 
-#def _parse_oemc(stdout): # this is interactive and must be handled using Popen separately
-#    # OEMC encoder autocalibration command
-#    return stdout
-
-def _parse_desc(stdout):
-    # DESC module description command
-    b = break_up(stdout)
-    return b
-
-def _parse_fben(stdout):
-    # FBEN Servodrive enable command
-    b = break_up(stdout)
-    return b
-
-def _parse_fbxt(stdout):
-    # FBXT Servodrive disable command
-    b = break_up(stdout)
-    return b
-
-def _parse_fbcs(stdout):
-    # FBCS Servodrive go to setpoint command
-    b = break_up(stdout)
-    return b
-
-def _parse_fbes(stdout):
-    # FBES Servodrive emergency stop command
-    b = break_up(stdout)
-    return b
-
-def _parse_fbfe(stdout):
-    # FBFE Servodrive find endstops command
-    b = break_up(stdout)
-    return b
-
-def _parse_fbst(stdout):
-    # FBST Servodrive get status position control command
-    b = break_up(stdout,{'ENABLED':int,
-        'BUSY':int,
-        'POS1':int,
-        'POS2':int,
-        'POS3':int,
-        'ERR1':int,
-        'ERR2':int,
-        'ERR3':int})
-    return b
-    
-LIBRARY = {
-    'MOV':_parse_mov,
-    'EXT':_parse_ext,
-    'STP':_parse_stp,
-    'STS':_parse_sts,
-    'INFO':_parse_info,
-    'POS':_parse_pos,
-    'RST':_parse_rst,
-    #'OEMC':_parse_oemc, #this is interactive and must be handled separately
-    'DESC':_parse_desc,
-    'FBEN':_parse_fben,
-    'FBXT':_parse_fbxt,
-    'FBCS':_parse_fbcs,
-    'FBES':_parse_fbes,
-    'FBFE':_parse_fbfe,
-    'FBST':_parse_fbst
-    }
\ No newline at end of file
+def _parse_oemc(stdout): # the dialogue is run by MCM.autocalibrate; this parses the output after the last prompt
+    # OEMC encoder autocalibration command
+    return break_up(stdout)
+
+_STATUS = (('STATUS',None),)
+
+SCHEMAS = {schema.command:schema for schema in (
+    Schema('MOV',_STATUS), # Basedrive move command
+    Schema('EXT',_STATUS), # Flexdrive external mode input command
+    Schema('STP',_STATUS), # Basedrive stop command
+    Schema('STS',(('FAILSAFE STATE',None),('STATUS',None))), # Basedrive status command
+    Schema('INFO',(('TYPE',None),('TAG',None))), # information command
+    Schema('POS',(('POS',int),('RVL',int))), # encoder position command
+    Schema('DESC',(('Version',None),('Available Channels',None))), # module description command
+    Schema('FBEN',_STATUS), # Servodrive enable command
+    Schema('FBXT',_STATUS), # Servodrive disable command
+    Schema('FBCS',_STATUS), # Servodrive go to setpoint command
+    Schema('FBES',_STATUS), # Servodrive emergency stop command
+    Schema('FBFE',_STATUS), # Servodrive find endstops command
+    Schema('FBST',(('STATUS',None),('ENABLED',int),('BUSY',int),
+        ('POS1',int),('POS2',int),('POS3',int),
+        ('ERR1',int),('ERR2',int),('ERR3',int))), # Servodrive get status position control command
+    )}
+
+LIBRARY = {command:schema.parse for command,schema in SCHEMAS.items()}
+LIBRARY['RST'] = _parse_rst
+LIBRARY['OEMC'] = _parse_oemc
@@ -0,0 +1,123 @@
+#
+# Python library for Janssen MCM controller
+# 2D raster scans
+#
+# requires numpy
+#
+
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pyjanssen.errors import CacliError
+
+
+def grid_order(nx,ny,snake=True):
+    '''
+    arguments: nx, ny, *snake (default True)
+    returns: list of (i, j) grid indices (row i, column j) in scan order
+
+    snake (boustrophedon) reverses every other row; otherwise every row
+    runs left to right and the axis returns to the start of each line
+    '''
+    order = []
+    for i in range(ny):
+        columns = range(nx - 1,-1,-1) if snake and i % 2 else range(nx)
+        order += [(i,j) for j in columns]
+    return order
+
+
+class RasterScan:
+    '''
+    2D scan over xs (columns) by ys (rows): move, then acquire with a user
+    callback, for every point
+
+    arguments: mcm, x_axis, y_axis, xs, ys, acquire, **kwargs
+
+    kwargs:
+        mode: 'move' (default) - x_axis/y_axis are (address, channel) and xs/ys
+              encoder targets reached with move_to; or 'servodrive' - x_axis/y_axis
+              are servodrive channels (1-3) and xs/ys FBCS setpoints
+        snake: boustrophedon ordering (default True); False returns each line
+        tolerance: encoder tolerance for move_to/wait_until_settled (default 0)
+        timeout: settle timeout per point for servodrive mode (default 10)
+        hold: setpoints of the servodrive channels not scanned (default 0)
+
+    acquire(i, j, x, y) is called once the axes are at point (i, j) and its
+    return value is stored in the result. the positions recorded for each
+    point are the final reads that move_to (POS) or wait_until_settled
+    (FBST) already made, so recording them costs no extra round trip. in
+    move mode each point starts from the positions reached at the previous
+    one instead of reading them again, and y is left alone while the row
+    does not change. moves are not overlapped with acquire: the stage must
+    stand still while it runs. a point whose axes did not converge
+    (move_to) or settle (wait_until_settled) is still acquired and is
+    marked False in CONVERGED
+    '''
+    def __init__(self,mcm,x_axis,y_axis,xs,ys,acquire,mode='move',snake=True,tolerance=0,timeout=10,hold=(0,0,0)):
+        if numpy is None:
+            raise CacliError('RasterScan requires numpy')
+        if mode not in ('move','servodrive'):
+            raise CacliError('unknown scan mode {}'.format(mode))
+        self.mcm = mcm
+        self.x_axis = x_axis
+        self.y_axis = y_axis
+        self.xs = list(xs)
+        self.ys = list(ys)
+        self.acquire = acquire
+        self.mode = mode
+        self.tolerance = tolerance
+        self.timeout = timeout
+        self.hold = list(hold)
+        self.order = grid_order(len(self.xs),len(self.ys),snake)
+        self.positions = numpy.full((len(self.ys),len(self.xs),2),numpy.nan)
+        self.converged = numpy.zeros((len(self.ys),len(self.xs)),dtype=bool)
+        self.data = [[None] * len(self.xs) for y in self.ys]
+
+    def _go(self,point,last):
+        # moves to a point; returns the (x, y) positions reached and
+        # whether the axes converged, from the reads the moves made.
+        # last is (row, x reply, y reply) of the previous point, or None
+        i,j = point
+        if self.mode == 'servodrive':
+            setpoint = list(self.hold)
+            setpoint[self.x_axis - 1] = self.xs[j]
+            setpoint[self.y_axis - 1] = self.ys[i]
+            self.mcm._run('FBCS',*(str(p) for p in setpoint))
+            settled = self.mcm.wait_until_settled(self.tolerance,self.timeout)
+            status = settled['STATUS']
+            return (status['POS{}'.format(self.x_axis)],status['POS{}'.format(self.y_axis)]),settled['SETTLED'],None
+        x_reply = self.mcm.move_to(self.x_axis[0],self.xs[j],self.tolerance,self.x_axis[1],
+                position=None if last is None else last[1]['POS'])
+        if last is not None and last[0] == i:
+            y_reply = last[2] # same row: y has not moved
+        else:
+            y_reply = self.mcm.move_to(self.y_axis[0],self.ys[i],self.tolerance,self.y_axis[1],
+                    position=None if last is None else last[2]['POS'])
+        return (x_reply['POS'],y_reply['POS']),x_reply['CONVERGED'] and y_reply['CONVERGED'],(i,x_reply,y_reply)
+
+    def run(self):
+        '''
+        returns: dictionary of POSITIONS (array rows x columns x (x, y) of
+        encoder positions reached at each point), CONVERGED (boolean array
+        rows x columns), DATA (acquire results, rows x columns), POINTS,
+        FAILED (points that did not converge), TIME and RATE (points per second)
+        '''
+        start = time.perf_counter()
+        last = None
+        for i,j in self.order:
+            position,converged,last = self._go((i,j),last)
+            self.positions[i,j] = position
+            self.converged[i,j] = converged
+            self.data[i][j] = self.acquire(i,j,self.xs[j],self.ys[i])
+        elapsed = time.perf_counter() - start
+        return {'POSITIONS':self.positions,
+            'CONVERGED':self.converged,
+            'DATA':self.data,
+            'POINTS':len(self.order),
+            'FAILED':int((~self.converged).sum()) if self.order else 0,
+            'TIME':elapsed,
+            'RATE':len(self.order) / elapsed if elapsed else 0.0}
@@ -0,0 +1,54 @@
+#
+# Python library for Janssen MCM controller
+# Adaptive polling intervals for settle/stop detection
+#
+
+
+class AdaptivePoller:
+    '''
+    chooses the delay before the next status poll from how far the system
+    still is from done: polls quickly close to the expected finish and
+    backs off while far away or while no progress is being made
+
+    arguments: *min_interval, *max_interval (seconds), *expected
+
+    expected is the expected time to finish (seconds from start), if known;
+    without it the finish is extrapolated from the rate at which the
+    distance reported to next() has been shrinking
+    '''
+    def __init__(self,min_interval=0.005,max_interval=0.25,expected=None):
+        assert 0 < min_interval <= max_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.expected = expected
+        self.polls = 0
+        self.__previous = None
+        self.__interval = min_interval
+
+    def next(self,distance,elapsed):
+        '''
+        arguments: distance, elapsed
+        returns: seconds to wait before the next poll
+
+        distance is any non-negative measure of how far from done (0 = done)
+        elapsed is the time since waiting started
+        '''
+        self.polls += 1
+        estimates = []
+        if self.expected is not None:
+            estimates.append(self.expected - elapsed)
+        if self.__previous is not None:
+            previous_distance,previous_elapsed = self.__previous
+            dt = elapsed - previous_elapsed
+            if distance < previous_distance and dt > 0:
+                rate = (previous_distance - distance) / dt
+                estimates.append(distance / rate)
+        self.__previous = (distance,elapsed)
+        if estimates:
+            # aim to land a poll just after the earliest expected finish
+            interval = min(estimates) / 2
+        else:
+            # no progress seen: back off
+            interval = self.__interval * 2
+        self.__interval = min(self.max_interval,max(self.min_interval,interval))
+        return self.__interval
@@ -0,0 +1,109 @@
+#
+# Python library for Janssen MCM controller
+# Single-flight coalescing of identical read-only queries
+#
+
+import concurrent.futures
+import threading
+import time
+
+from pyjanssen.errors import CacliTimeout
+
+# commands that only read state and may be shared between callers
+READ_ONLY = frozenset(('POS','STS','DESC','INFO','FBST'))
+
+
+class SingleFlight:
+    '''
+    lets concurrent callers of an identical query share one execution: the
+    first caller runs it and later callers wait for the same result
+
+    freshness: seconds for which a finished result is reused (default 0,
+    only in-flight queries are shared)
+
+    invalidate() starts a new generation: callers only join queries started
+    in the current generation, and results of older generations are not
+    kept for reuse, so nothing read before a change is handed out after it
+    '''
+    def __init__(self,freshness=0.0,clock=time.monotonic):
+        self.freshness = freshness
+        self.clock = clock
+        self.executed = 0
+        self.coalesced = 0
+        self.reused = 0
+        self.__generation = 0
+        self.__calls = {}
+        self.__recent = {}
+        self.__lock = threading.Lock()
+
+    def do(self,key,fn,timeout=None):
+        '''
+        arguments: key, fn, *timeout
+        returns: result of fn(), possibly shared with other callers of key
+
+        a caller joining a query in flight waits at most timeout seconds for
+        it (CacliTimeout); the query itself carries on for the others. the
+        leader's own timeout is not passed on: a joiner with time left runs
+        the query again
+        '''
+        expires = None if timeout is None else time.monotonic() + timeout
+        leader = False
+        with self.__lock:
+            generation = self.__generation
+            recent = self.__recent.get(key)
+            if recent is not None:
+                if self.clock() - recent[0] <= self.freshness:
+                    self.reused += 1
+                    return recent[1]
+                del self.__recent[key]
+            call = self.__calls.get(key)
+            if call is not None and call[0] == generation:
+                self.coalesced += 1
+            else:
+                # none in flight, or started before the last invalidate()
+                call = self.__calls[key] = (generation,concurrent.futures.Future())
+                self.executed += 1
+                leader = True
+        if not leader:
+            try:
+                return call[1].result(timeout)
+            except concurrent.futures.TimeoutError:
+                raise CacliTimeout('shared query {!r} did not finish within {:.3g} s'.format(key,timeout))
+            except CacliTimeout:
+                remaining = None if expires is None else expires - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise
+                return self.do(key,fn,remaining)
+        try:
+            result = fn()
+        except BaseException as e:
+            with self.__lock:
+                self.__forget(key,call)
+            call[1].set_exception(e)
+            raise
+        with self.__lock:
+            self.__forget(key,call)
+            if self.freshness > 0 and generation == self.__generation:
+                self.__recent[key] = (self.clock(),result)
+        call[1].set_result(result)
+        return result
+
+    def __forget(self,key,call):
+        # with the lock held; a newer generation may have replaced the call
+        if self.__calls.get(key) is call:
+            del self.__calls[key]
+
+    def invalidate(self):
+        '''
+        starts a new generation: forgets finished results and stops later
+        callers joining queries already in flight
+        '''
+        with self.__lock:
+            self.__generation += 1
+            self.__recent.clear()
+
+    def stats(self):
+        '''
+        returns: dictionary of executed, coalesced and reused queries
+        '''
+        return {'executed':self.executed,'coalesced':self.coalesced,'reused':self.reused}
@@ -0,0 +1,214 @@
+#
+# Python library for Janssen MCM controller
+# Position streaming into a preallocated ring buffer
+#
+# requires numpy
+#
+
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pyjanssen.errors import CacliError
+
+SAMPLE_DTYPE = [('time','f8'),('address','u1'),('channel','u1'),('POS','i8'),('RVL','i8')]
+
+
+class RingBuffer:
+    '''
+    fixed-size buffer of SAMPLE_DTYPE rows; old rows are overwritten once
+    capacity is reached, so memory use is bounded however long it runs
+    '''
+    def __init__(self,capacity):
+        if numpy is None:
+            raise CacliError('RingBuffer requires numpy')
+        assert capacity > 0
+        self.capacity = capacity
+        self.data = numpy.zeros(capacity,dtype=SAMPLE_DTYPE)
+        self.written = 0
+        self.condition = threading.Condition()
+
+    def append(self,row):
+        '''
+        arguments: row (tuple of time, address, channel, POS, RVL)
+        '''
+        with self.condition:
+            self.data[self.written % self.capacity] = row
+            self.written += 1
+            self.condition.notify_all()
+
+    def read(self,cursor):
+        '''
+        arguments: cursor (number of rows already read)
+        returns: rows, new cursor, dropped
+
+        returns a copy of all rows written since cursor; dropped is the
+        number of rows that were overwritten before they could be read.
+        the copy is taken with the lock held, so appends cannot overwrite
+        rows while they are being copied
+        '''
+        with self.condition:
+            written = self.written
+            dropped = max(0,written - cursor - self.capacity)
+            start = cursor + dropped
+            if start == written:
+                return self.data[:0].copy(),written,dropped
+            i,j = start % self.capacity,written % self.capacity
+            if i < j:
+                rows = self.data[i:j].copy()
+            else:
+                rows = numpy.concatenate((self.data[i:],self.data[:j]))
+        return rows,written,dropped
+
+    def latest(self,n=None):
+        '''
+        arguments: *n
+        returns: copy of the last n rows (default: everything still held)
+        '''
+        with self.condition:
+            written = self.written
+        n = min(written,self.capacity) if n is None else min(n,written,self.capacity)
+        return self.read(written - n)[0]
+
+
+class PositionSampler:
+    '''
+    polls POS for a set of (address, channel) pairs at a target rate on a
+    background thread and writes (time, address, channel, POS, RVL) rows
+    into a RingBuffer
+
+    ticks are scheduled against absolute deadlines, so timing does not
+    drift; a tick that starts after its deadline has passed is skipped and
+    counted in missed_deadlines. callback(rows) is called on the sampler
+    thread with the rows of every tick; samples() yields new rows to a reader.
+    CacliError on a read is counted in errors and sampling goes on; any
+    other error (e.g. from callback) stops the sampler and is kept in
+    last_error
+    '''
+    def __init__(self,mcm,axes,rate,capacity=65536,callback=None):
+        assert rate > 0
+        self.mcm = mcm
+        self.axes = [(str(address),str(channel)) for address,channel in axes]
+        self.rate = rate
+        self.buffer = RingBuffer(capacity)
+        self.callback = callback
+        self.missed_deadlines = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_error = None
+        self.ticks = 0
+        self.__stop = threading.Event()
+        self.__thread = None
+        self.__started = None
+        self.__finished = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self,*exc):
+        self.stop()
+
+    def start(self):
+        '''
+        starts the sampler thread
+        '''
+        assert self.__thread is None
+        self.__stop.clear()
+        self.__finished = None
+        self.__thread = threading.Thread(target=self.__sample,name='pyjanssen-sampler',daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        '''
+        stops the sampler thread and waits for the current tick to finish
+        '''
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+            self.__finished = time.perf_counter()
+        with self.buffer.condition:
+            self.buffer.condition.notify_all()
+
+    def running(self):
+        return self.__thread is not None and not self.__stop.is_set()
+
+    def samples(self,timeout=None):
+        '''
+        arguments: *timeout
+        returns: generator of numpy arrays of new rows
+
+        yields whenever new rows are available; rows overwritten before the
+        reader got to them are added to dropped. stops when the sampler
+        stops, or after timeout seconds without new rows
+        '''
+        cursor = self.buffer.written
+        while True:
+            with self.buffer.condition:
+                if self.buffer.written == cursor and self.running():
+                    self.buffer.condition.wait(timeout)
+            rows,cursor,dropped = self.buffer.read(cursor)
+            self.dropped += dropped
+            if len(rows):
+                yield rows
+            elif not self.running() or timeout is not None:
+                return
+
+    def stats(self):
+        '''
+        returns: dictionary of ticks, samples, achieved rate (Hz),
+        missed_deadlines, dropped and errors
+        '''
+        end = self.__finished or time.perf_counter()
+        elapsed = end - self.__started if self.__started else 0
+        return {'ticks':self.ticks,
+            'samples':self.buffer.written,
+            'rate':self.ticks / elapsed if elapsed else 0.0,
+            'missed_deadlines':self.missed_deadlines,
+            'dropped':self.dropped,
+            'errors':self.errors}
+
+    def __sample(self):
+        try:
+            self.__loop()
+        except BaseException as e:
+            self.last_error = e
+            raise
+        finally:
+            # running() is False from here on and samples() readers wake up
+            self.__stop.set()
+            with self.buffer.condition:
+                self.buffer.condition.notify_all()
+
+    def __loop(self):
+        period = 1 / self.rate
+        self.__started = start = time.perf_counter()
+        tick = 0
+        while not self.__stop.is_set():
+            rows = []
+            for address,channel in self.axes:
+                try:
+                    reply = self.mcm._run('POS',address,channel)
+                except CacliError as e:
+                    self.errors += 1
+                    self.last_error = e
+                    continue
+                row = (time.time(),int(address),int(channel),reply['POS'],reply['RVL'])
+                self.buffer.append(row)
+                rows.append(row)
+            self.ticks += 1
+            if self.callback is not None and rows:
+                self.callback(rows)
+            tick += 1
+            now = time.perf_counter()
+            late = int((now - start) / period) - tick + 1
+            if late > 0:
+                # skip the ticks whose deadlines have already passed
+                self.missed_deadlines += late
+                tick += late
+            self.__stop.wait(start + tick * period - now)
@@ -0,0 +1,81 @@
+#
+# Python library for Janssen MCM controller
+# Bus discovery results
+#
+
+import json
+import os
+import re
+import threading
+
+
+class Topology:
+    '''
+    what is plugged into a controller: per module address the version, the
+    available channels and the positioner TYPE/TAG on each channel
+
+    a topology loaded from a file is trusted until a module is first
+    looked up with module(); that module is then re-verified once with a
+    single DESC through the verify callback
+    '''
+    def __init__(self,modules=None,verify=None):
+        self.modules = modules or {}
+        self.verify = verify
+        self.__verified = set()
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def load(cls,path,verify=None):
+        '''
+        arguments: path, *verify
+        returns: Topology read from a JSON file written by save()
+        '''
+        with open(path) as f:
+            return cls(json.load(f)['modules'],verify)
+
+    def save(self,path):
+        '''
+        arguments: path
+
+        writes the topology to a JSON file (atomically)
+        '''
+        temporary = path + '.tmp'
+        with open(temporary,'w') as f:
+            json.dump({'modules':self.modules},f,indent=1)
+        os.replace(temporary,path)
+
+    def mark_verified(self,address=None):
+        '''
+        arguments: *address (default every module)
+        '''
+        with self.__lock:
+            self.__verified.update([str(address)] if address is not None else self.modules)
+
+    def module(self,address):
+        '''
+        arguments: address
+        returns: dictionary of version, channels and positioners, or None if absent
+        '''
+        address = str(address)
+        with self.__lock:
+            check = self.verify is not None and address not in self.__verified
+            self.__verified.add(address)
+        if check:
+            self.verify(self,address)
+        return self.modules.get(address)
+
+    def axes(self):
+        '''
+        returns: list of (address, channel) with a positioner reply
+        '''
+        return [(int(address),int(channel)) for address,module in sorted(self.modules.items(),key=lambda item: int(item[0]))
+            for channel in sorted(module['positioners'],key=int)]
+
+    def __repr__(self):
+        return 'Topology({!r})'.format(self.modules)
+
+
+def channels_from_description(description,default):
+    # 'Available Channels' as a list of ints, falling back to default
+    channels = [int(c) for c in re.findall(r'\d+',str(description.get('Available Channels','')))]
+    return channels or list(default)
@@ -0,0 +1,140 @@
+#
+# Python library for Janssen MCM controller
+# Servodrive setpoint streaming
+#
+# requires numpy
+#
+
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pyjanssen.errors import CacliError
+
+# wait this long before a deadline by spinning rather than sleeping, as
+# sleeps overshoot by around a millisecond
+SPIN = 0.001
+
+
+def wait_until(deadline,stop=None):
+    '''
+    arguments: deadline (time.perf_counter() value), *stop (threading.Event)
+    returns: False if stop was set while waiting
+
+    sleeps until shortly before deadline, then spins until it passes
+    '''
+    remaining = deadline - time.perf_counter()
+    if remaining > SPIN:
+        if stop is not None:
+            if stop.wait(remaining - SPIN):
+                return False
+        else:
+            time.sleep(remaining - SPIN)
+    while time.perf_counter() < deadline:
+        pass
+    return stop is None or not stop.is_set()
+
+
+class TrajectoryStreamer:
+    '''
+    feeds servodrive setpoints (FBCS) at a fixed rate
+
+    arguments: mcm, waypoints, rate, **kwargs
+
+    waypoints: array of shape (n, 3) or an iterable of (pos1, pos2, pos3)
+    rate: setpoints per second
+
+    kwargs:
+        readback_every: send FBST after every nth setpoint (default 10; 0 never)
+        skip_late: drop setpoints whose slot has passed instead of sending
+            them late (default False)
+        callback: called as callback(i, setpoint, status) after each readback
+
+    setpoint i is due at start + i / rate, so delays do not accumulate;
+    the readback and a late reply both eat into the following slots
+    '''
+    def __init__(self,mcm,waypoints,rate,readback_every=10,skip_late=False,callback=None):
+        if numpy is None:
+            raise CacliError('TrajectoryStreamer requires numpy')
+        assert rate > 0 and readback_every >= 0
+        self.mcm = mcm
+        self.waypoints = waypoints
+        self.rate = rate
+        self.readback_every = readback_every
+        self.skip_late = skip_late
+        self.callback = callback
+        self.__stop = threading.Event()
+
+    def stop(self):
+        '''
+        ends run() after the setpoint in progress (from another thread)
+        '''
+        self.__stop.set()
+
+    def run(self):
+        '''
+        returns: dictionary of
+            WAYPOINTS (setpoints sent), SKIPPED, LATE (sent after their slot ended)
+            TIME, RATE (achieved setpoints per second)
+            JITTER (mean, std, p99 and max of OFFSETS)
+            SETPOINTS (array n x 3 of the setpoints sent)
+            OFFSETS (array n of time FBCS was issued - deadline, seconds)
+            TRACKING (array n x 3 of FBST POSx - setpoint, NaN where not read back)
+            TRACKING_RMS (per axis, over the readbacks)
+        '''
+        if not self.mcm.servodrive_enabled():
+            raise CacliError('servodrive must be enabled to stream setpoints')
+        self.__stop.clear()
+        period = 1 / self.rate
+        setpoints = []
+        offsets = []
+        tracking = []
+        skipped = late = 0
+        start = time.perf_counter() + period # leave a slot to get going
+        slot = 0
+        for waypoint in self.waypoints:
+            deadline = start + slot * period
+            slot += 1
+            now = time.perf_counter()
+            if now >= deadline + period:
+                if self.skip_late:
+                    skipped += 1
+                    continue
+                late += 1
+            elif not wait_until(deadline,self.__stop):
+                break
+            setpoint = [int(round(p)) for p in waypoint]
+            issued = time.perf_counter()
+            self.mcm._run('FBCS',str(setpoint[0]),str(setpoint[1]),str(setpoint[2]))
+            setpoints.append(setpoint)
+            offsets.append(issued - deadline)
+            error = (numpy.nan,numpy.nan,numpy.nan)
+            if self.readback_every and len(setpoints) % self.readback_every == 0:
+                status = self.mcm._run('FBST')
+                error = tuple(status['POS{}'.format(c)] - setpoint[c - 1] for c in (1,2,3))
+                if self.callback is not None:
+                    self.callback(len(setpoints) - 1,setpoint,status)
+            tracking.append(error)
+            if self.__stop.is_set():
+                break
+        elapsed = time.perf_counter() - start
+        offsets = numpy.array(offsets)
+        tracking = numpy.array(tracking,dtype=float).reshape(-1,3)
+        read = ~numpy.isnan(tracking[:,0])
+        return {'WAYPOINTS':len(setpoints),
+            'SKIPPED':skipped,
+            'LATE':late,
+            'TIME':elapsed,
+            'RATE':len(setpoints) / elapsed if elapsed > 0 else 0.0,
+            'JITTER':{'mean':float(offsets.mean()) if len(offsets) else None,
+                'std':float(offsets.std()) if len(offsets) else None,
+                'p99':float(numpy.percentile(offsets,99)) if len(offsets) else None,
+                'max':float(offsets.max()) if len(offsets) else None},
+            'SETPOINTS':numpy.array(setpoints,dtype=numpy.int64).reshape(-1,3),
+            'OFFSETS':offsets,
+            'TRACKING':tracking,
+            'TRACKING_RMS':[float(numpy.sqrt(numpy.mean(tracking[read,c] ** 2))) if read.any() else None for c in range(3)]}
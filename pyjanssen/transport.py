@@ -0,0 +1,132 @@
+#
+# Python library for Janssen MCM controller
+# Command transports
+#
+# 'spawn' runs cacli.exe once per command, the only way stock cacli.exe can
+# be driven. any object with run(target,command_list) can be passed instead,
+# e.g. to forward commands elsewhere (see pyjanssen.broker)
+#
+
+import asyncio
+import subprocess
+import time
+
+from pyjanssen.errors import CacliError, CacliTimeout
+
+
+class Reply(subprocess.CompletedProcess):
+    '''
+    CompletedProcess with the time spent starting the command (spawn_time)
+    and waiting for its reply (wait_time), in seconds
+    '''
+    def __init__(self,args,returncode,stdout,stderr,spawn_time=None,wait_time=None):
+        super().__init__(args,returncode,stdout,stderr)
+        self.spawn_time = spawn_time
+        self.wait_time = wait_time
+
+
+class SpawnTransport:
+    '''
+    starts a fresh cacli process for every command (one subprocess.run per call)
+    '''
+    def __init__(self,exe):
+        self.exe = exe
+
+    def run(self,target,command_list,timeout=None):
+        '''
+        arguments: target, command_list, *timeout
+        returns: Reply
+
+        target is the list of device/server arguments (e.g. ['@SERV']);
+        a command still running after timeout seconds is killed and
+        CacliTimeout raised
+        '''
+        parameters = [self.exe] + list(target) + list(command_list)
+        start = time.perf_counter()
+        with subprocess.Popen(parameters,
+                            stdout = subprocess.PIPE,
+                            stderr = subprocess.PIPE,
+                            universal_newlines = True) as process:
+            spawned = time.perf_counter()
+            try:
+                stdout,stderr = process.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+                raise CacliTimeout('{} did not finish within {:.3g} s'.format(' '.join(command_list),timeout))
+            except BaseException:
+                process.kill()
+                raise
+        return Reply(parameters,process.returncode,stdout,stderr,
+                            spawned - start,time.perf_counter() - spawned)
+
+    def close(self):
+        pass
+
+
+def make_transport(transport,exe,**kwargs):
+    '''
+    arguments: transport, exe, **kwargs
+    returns: transport instance
+
+    transport is 'spawn' or an object with run(target,command_list)
+    (which is also passed timeout=seconds when the command has a deadline)
+    and optionally close()
+    '''
+    if transport == 'spawn':
+        return SpawnTransport(exe)
+    elif hasattr(transport,'run'):
+        return transport
+    raise CacliError('unknown transport {}'.format(transport))
+
+
+class AsyncSpawnTransport:
+    '''
+    asyncio version of SpawnTransport using asyncio.create_subprocess_exec
+    '''
+    def __init__(self,exe):
+        self.exe = exe
+
+    async def run(self,target,command_list,timeout=None):
+        '''
+        arguments: target, command_list, *timeout
+        returns: Reply
+
+        the child is killed if the awaiting task is cancelled or the command
+        takes longer than timeout seconds (CacliTimeout)
+        '''
+        parameters = [self.exe] + list(target) + list(command_list)
+        start = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(*parameters,
+                            stdout = subprocess.PIPE,
+                            stderr = subprocess.PIPE)
+        spawned = time.perf_counter()
+        try:
+            stdout,stderr = await asyncio.wait_for(process.communicate(),timeout)
+        except BaseException as e:
+            if process.returncode is None:
+                process.kill()
+                await asyncio.shield(process.wait())
+            if isinstance(e,asyncio.TimeoutError):
+                raise CacliTimeout('{} did not finish within {:.3g} s'.format(' '.join(command_list),timeout))
+            raise
+        return Reply(parameters,process.returncode,stdout.decode(),stderr.decode(),
+                            spawned - start,time.perf_counter() - spawned)
+
+    async def close(self):
+        pass
+
+
+def make_async_transport(transport,exe,**kwargs):
+    '''
+    arguments: transport, exe, **kwargs
+    returns: asyncio transport instance
+
+    transport is 'spawn' or an object with a coroutine run(target,command_list)
+    and optionally a coroutine close()
+    '''
+    if transport == 'spawn':
+        return AsyncSpawnTransport(exe)
+    elif hasattr(transport,'run'):
+        return transport
+    raise CacliError('unknown transport {}'.format(transport))
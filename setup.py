@@ -13,6 +13,7 @@ setuptools.setup(
 	long_description_content_type = "text/markdown",
 	url = "https://github.com/Laukei/pyjanssen",
 	packages = setuptools.find_packages(),
+	extras_require = {"numpy": ["numpy"]},
 	classifiers = [
 		"Programming Language :: Python :: 3",
 		"License :: OSI Approved :: MIT License",
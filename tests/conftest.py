@@ -0,0 +1,35 @@
+#
+# Python library for Janssen MCM controller
+# Test fixtures: every test runs against the emulated cacli
+#
+
+import sys
+
+import pytest
+
+if sys.platform == 'win32':
+    collect_ignore_glob = ['test_*.py'] # the emulator needs fcntl
+
+
+@pytest.fixture
+def fake(tmp_path):
+    '''
+    returns: function(**config) writing a fake cacli into tmp_path and returning its path
+
+    the controllers are exclusive (one cacli process at a time, the rest
+    get DEVICE NOT FOUND) unless exclusive=False is passed
+    '''
+    from pyjanssen.emulator import make_fake_cacli
+    count = iter(range(1000))
+    def make(**config):
+        config.setdefault('exclusive',True)
+        return make_fake_cacli(str(tmp_path / 'rig{}'.format(next(count))),**config)
+    return make
+
+
+@pytest.fixture
+def exe(fake):
+    '''
+    returns: path to a fake cacli with the default configuration
+    '''
+    return fake()
@@ -0,0 +1,35 @@
+#
+# Python library for Janssen MCM controller
+# Tests: asyncio client
+#
+
+import asyncio
+
+import pytest
+
+from pyjanssen.async_mcm import AsyncMCM
+from pyjanssen.errors import CacliError
+from pyjanssen.janssen_mcm import FORWARD
+
+
+def test_async(exe):
+    async def main():
+        async with AsyncMCM(exe=exe) as m:
+            await m.move(1,FORWARD,1,steps=10)
+            return await asyncio.gather(*(m.get_position(1,channel) for channel in (1,2)))
+    assert asyncio.run(main()) == [100,0]
+
+
+def test_async_rejects_thread_options(exe):
+    for option in ('dispatcher','coalesce'):
+        with pytest.raises(CacliError):
+            AsyncMCM(exe=exe,**{option:True})
+    async def main():
+        async with AsyncMCM(exe=exe) as m:
+            with pytest.raises(CacliError):
+                m.batch()
+            reply = await m.move_to(1,200,5)
+            return reply,await m.run_many([('POS','1','1'),('STS','1')])
+    reply,(position,status) = asyncio.run(main())
+    assert reply['CONVERGED'] and abs(position['POS'] - 200) <= 5
+    assert status['STATUS'] == 'OK'
@@ -0,0 +1,117 @@
+#
+# Python library for Janssen MCM controller
+# Tests: interactive OEMC calibration
+#
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from pyjanssen.async_mcm import AsyncMCM
+from pyjanssen.emulator import collisions
+from pyjanssen.errors import CacliError, CacliTimeout
+from pyjanssen.fleet import Fleet
+from pyjanssen.janssen_mcm import MCM
+
+REFUSE = ((r'(?i)press ENTER[^\n]*','\n'),(r'(?i)\(y/n\)\??\s*','n\n'))
+
+
+def test_dialogue(fake):
+    seen = []
+    with MCM(exe=fake(calibration_time=0.05)) as m:
+        reply = m.autocalibrate(1,1,progress=lambda address,channel,percent: seen.append((address,channel,percent)))
+        assert reply['STATUS'] == 'OK'
+        assert (reply['MIN'],reply['MAX']) == ('-1000','1000')
+        assert seen[-1] == (1,1,100)
+        assert [percent for _,_,percent in seen] == sorted(percent for _,_,percent in seen)
+        assert m.journal.recent(1)[0].command == 'OEMC'
+
+
+def test_refused(fake):
+    with MCM(exe=fake(calibration_time=0.05)) as m:
+        with pytest.raises(CacliError,match='ABORTED'):
+            m.autocalibrate(1,1,prompts=REFUSE)
+        assert m.journal.recent(1)[0].outcome == 'error'
+
+
+def test_answer_from_match(fake):
+    answers = []
+    def answer(match):
+        answers.append(match.group(0))
+        return 'y\n'
+    prompts = ((r'(?i)press ENTER[^\n]*','\n'),(r'(?i)\(y/n\)\??\s*',answer))
+    with MCM(exe=fake(calibration_time=0.05)) as m:
+        assert m.autocalibrate(1,1,prompts=prompts)['STATUS'] == 'OK'
+    assert answers == ['(y/n)? ']
+
+
+def test_timeout(fake):
+    with MCM(exe=fake(calibration_time=5)) as m:
+        with pytest.raises(CacliTimeout,match='OEMC 1 1'):
+            m.autocalibrate(1,1,timeout=0.2)
+
+
+def test_missing_module(fake):
+    with MCM(exe=fake(calibration_time=0.05)) as m:
+        with pytest.raises(CacliError):
+            m.autocalibrate(9,1,timeout=5)
+
+
+def test_deadline(fake):
+    with MCM(exe=fake(calibration_time=5)) as m:
+        start = time.monotonic()
+        with m.deadline(0.2):
+            with pytest.raises(CacliTimeout):
+                m.autocalibrate(1,1)
+        assert time.monotonic() - start < 2
+
+
+def test_dispatcher(fake):
+    # polls from another thread wait for the calibration instead of colliding with it
+    exe = fake(calibration_time=0.3)
+    with MCM(exe=exe,dispatcher=True,retries=0) as m:
+        positions = []
+        poller = threading.Thread(target=lambda: positions.extend(m.get_position(1,1) for _ in range(5)))
+        poller.start()
+        assert m.autocalibrate(1,1)['STATUS'] == 'OK'
+        poller.join()
+        assert len(positions) == 5
+    assert collisions(exe) == 0
+
+
+def test_all(fake):
+    seen = set()
+    exe = fake(calibration_time=0.05)
+    with MCM(exe=exe,retries=0) as m:
+        results = m.autocalibrate_all([(1,1),(1,2),(2,1),(9,1)],
+                progress=lambda address,channel,percent: seen.add((address,channel)),return_exceptions=True)
+        assert isinstance(results.pop((9,1)),CacliError)
+        assert {axis:reply['STATUS'] for axis,reply in results.items()} == {(1,1):'OK',(1,2):'OK',(2,1):'OK'}
+        assert {(1,1),(1,2),(2,1)} <= seen
+        with pytest.raises(CacliError):
+            m.autocalibrate_all([(1,1),(9,1)])
+    assert collisions(exe) == 0
+
+
+def test_fleet(fake):
+    exe = fake(calibration_time=0.3)
+    seen = set()
+    axes = [(1,1,1),(1,1,2),(2,1,1),(2,1,2)]
+    with Fleet([1,2],axes=axes,exe=exe,retries=0) as fleet:
+        start = time.monotonic()
+        results = fleet.autocalibrate_all(progress=lambda axis,percent: seen.add(axis))
+        elapsed = time.monotonic() - start
+    assert {axis:reply['STATUS'] for axis,reply in results.items()} == dict.fromkeys(axes,'OK')
+    assert seen == set(axes)
+    # two controllers side by side, two axes each in turn
+    assert 0.6 <= elapsed < 1.1
+    assert collisions(exe) == 0
+
+
+def test_async(fake):
+    async def main():
+        async with AsyncMCM(exe=fake(calibration_time=0.05)) as m:
+            return await m.autocalibrate_all([(1,1),(1,2)])
+    assert {axis:reply['STATUS'] for axis,reply in asyncio.run(main()).items()} == {(1,1):'OK',(1,2):'OK'}
@@ -0,0 +1,51 @@
+#
+# Python library for Janssen MCM controller
+# Tests: batched commands
+#
+
+import time
+
+import pytest
+
+from pyjanssen.batch import run_many
+from pyjanssen.emulator import collisions
+from pyjanssen.errors import CacliError
+from pyjanssen.janssen_mcm import MCM, FORWARD
+
+
+def test_batch_in_order(exe):
+    with MCM(exe=exe) as m:
+        with m.batch() as batch:
+            before = batch.get_position(1,1)
+            batch.move(1,FORWARD,1,steps=10)
+            after = batch.get_position(1,1)
+            status = batch.get_status(1)
+            assert len(batch) == 4 and not after.done()
+        assert (before.result(),after.result()) == (0,100)
+        assert status.result()['STATUS'] == 'OK'
+
+
+def test_run_many(exe):
+    with MCM(exe=exe) as m:
+        m.move(2,FORWARD,1,steps=3)
+        assert [reply['POS'] for reply in m.run_many([('POS','1','1'),('POS','2','1')])] == [0,30]
+
+
+def test_targets_run_concurrently(fake):
+    exe = fake(latency=0.2)
+    with MCM(device=1,exe=exe) as m1, MCM(device=2,exe=exe) as m2:
+        start = time.monotonic()
+        replies = run_many([(m1,'POS','1','1'),(m2,'POS','1','1'),(m1,'STS','1'),(m2,'STS','1')])
+        elapsed = time.monotonic() - start
+    assert [reply.command for reply in replies] == ['POS','POS','STS','STS']
+    # two controllers side by side, each one's commands in turn
+    assert 0.4 <= elapsed < 0.75
+    assert collisions(exe) == 0
+
+
+def test_errors(fake):
+    with MCM(exe=fake(fail={'STS':'ERROR: NO MODULE AT ADDRESS 1'}),retries=0) as m:
+        replies = m.run_many([('STS','1'),('POS','1','1')],return_exceptions=True)
+        assert isinstance(replies[0],CacliError) and replies[1]['POS'] == 0
+        with pytest.raises(CacliError):
+            m.run_many([('POS','1','1'),('STS','1')])
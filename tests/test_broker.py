@@ -0,0 +1,125 @@
+#
+# Python library for Janssen MCM controller
+# Tests: broker serving many clients through one transport
+#
+
+import os
+import socket
+import stat
+import threading
+import time
+
+import pytest
+
+import pyjanssen.emulator
+from pyjanssen.broker import Broker, BrokerMCM
+from pyjanssen.errors import CacliError, CacliTimeout
+from pyjanssen.janssen_mcm import FORWARD
+
+
+@pytest.fixture
+def broker(fake,tmp_path):
+    '''
+    returns: function(**config) starting a Broker on a fake cacli
+    '''
+    brokers = []
+    def start(mode=0o600,**config):
+        broker = Broker(fake(**config),str(tmp_path / 'broker{}.sock'.format(len(brokers))),
+                mode=mode).start()
+        brokers.append(broker)
+        return broker
+    yield start
+    for broker in brokers:
+        broker.close()
+
+
+def test_round_trip(broker):
+    server = broker()
+    with BrokerMCM(socket_path=server.socket_path) as m:
+        assert m.get_position(1,1) == 0
+        assert m.move(1,FORWARD,1,steps=10)['STATUS'] == 'OK'
+        assert m.get_position(1,1) == 100
+        with pytest.raises(CacliError,match='NO MODULE'):
+            m.get_position(9,1)
+    assert server.stats()['requests'] == 4
+
+
+def test_clients_share_reads(broker):
+    server = broker(latency=0.2)
+    clients = [BrokerMCM(socket_path=server.socket_path) for _ in range(4)]
+    results = []
+    threads = [threading.Thread(target=lambda m=m: results.append(m.get_position(1,1))) for m in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for m in clients:
+        m.close()
+    assert results == [0] * 4
+    assert server.stats()['coalescing']['coalesced'] >= 1
+
+
+def test_socket_mode(broker):
+    assert stat.S_IMODE(os.stat(broker().socket_path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(broker(mode=0o660).socket_path).st_mode) == 0o660
+
+
+def test_deadline_includes_queueing(broker):
+    server = broker(latency=0.3)
+    with BrokerMCM(socket_path=server.socket_path,retries=0) as m:
+        busy = m.submit('DESC','1')
+        with pytest.raises(CacliTimeout):
+            with m.deadline(0.2):
+                m.get_position(1,1)
+        busy.result(5)
+        assert m.get_position(1,1) == 0
+
+
+def test_unreachable_broker(tmp_path):
+    with BrokerMCM(socket_path=str(tmp_path / 'missing.sock'),retries=0) as m:
+        with pytest.raises(CacliError,match='cannot reach broker'):
+            m.get_position(1,1)
+
+
+def test_stop_skips_request_pool(fake,tmp_path):
+    exe = fake(latency=0.3)
+    with Broker(exe,str(tmp_path / 'stop.sock'),max_requests=1).start() as server:
+        with BrokerMCM(socket_path=server.socket_path) as m:
+            reads = [threading.Thread(target=m.get_description,args=(address,)) for address in (1,2,3,1)]
+            for read in reads:
+                read.start()
+            time.sleep(0.1)
+            start = time.monotonic()
+            assert m.stop(1)['STATUS'] == 'OK'
+            # behind the command in progress only, not the queued ones
+            assert time.monotonic() - start < 0.8
+            for read in reads:
+                read.join()
+    assert pyjanssen.emulator.collisions(exe) == 0
+
+
+def test_refuses_live_socket(broker):
+    server = broker()
+    with pytest.raises(CacliError,match='already serving'):
+        Broker(server.exe,server.socket_path)
+    with BrokerMCM(socket_path=server.socket_path) as m:
+        assert m.get_position(1,1) == 0
+
+
+def test_replaces_stale_socket(exe,tmp_path):
+    path = str(tmp_path / 'stale.sock')
+    sock = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.close()
+    with Broker(exe,path).start():
+        with BrokerMCM(socket_path=path) as m:
+            assert m.get_position(1,1) == 0
+    (tmp_path / 'file').write_text('')
+    with pytest.raises(CacliError,match='not a socket'):
+        Broker(exe,str(tmp_path / 'file'))
+
+
+def test_no_oemc_through_broker(broker):
+    with BrokerMCM(socket_path=broker().socket_path) as m:
+        with pytest.raises(CacliError,match='cannot run through the broker'):
+            m.autocalibrate(1,1)
@@ -0,0 +1,73 @@
+#
+# Python library for Janssen MCM controller
+# Tests: metadata cache
+#
+
+import pytest
+
+from pyjanssen.cache import TTLCache
+from pyjanssen.errors import CacliError
+from pyjanssen.janssen_mcm import MCM
+
+
+def commands(m,command):
+    return sum(1 for entry in m.journal.recent() if entry.command == command)
+
+
+def test_ttl_cache():
+    now = [0.0]
+    cache = TTLCache(ttl=10,clock=lambda: now[0])
+    cache.put(('DESC','1'),'one')
+    cache.put(('INFO','1','1'),'forever',ttl=1000)
+    assert cache.get(('DESC','1')) == 'one'
+    now[0] = 11
+    assert cache.get(('DESC','1')) is None
+    assert cache.get(('INFO','1','1')) == 'forever'
+    cache.invalidate(('INFO',))
+    assert len(cache) == 0
+    assert cache.stats() == {'hits':2,'misses':1,'entries':0}
+
+
+def test_metadata_cached(exe):
+    with MCM(exe=exe,metadata_cache=True) as m:
+        first = m.get_description(1)
+        assert m.get_description(1) == first
+        m.get_information(1,1)
+        m.get_information(1,1)
+        assert commands(m,'DESC') == 1 and commands(m,'INFO') == 1
+        assert m.metadata_cache_stats()['hits'] == 2
+        m.invalidate_metadata(1)
+        m.get_description(1)
+        assert commands(m,'DESC') == 2
+
+
+def test_discover_fills_cache(exe):
+    with MCM(exe=exe,metadata_cache=True) as m:
+        m.discover(addresses=[1])
+        m.get_description(1)
+        m.get_information(1,2)
+        assert commands(m,'DESC') == 1 and commands(m,'INFO') == 3
+
+
+def test_error_invalidates(fake):
+    exe = fake(devices=[1])
+    with MCM(device=1,exe=exe,metadata_cache=True,retries=0) as m:
+        m.get_description(1)
+        assert m.metadata_cache_stats()['entries'] == 1
+        with pytest.raises(CacliError):
+            m._run('POS','9','1')
+        # a failed command does not touch the cache unless the controller itself failed
+        assert m.metadata_cache_stats()['entries'] == 1
+    with MCM(device=2,exe=exe,metadata_cache=True,retries=0) as m:
+        m._metadata().put(('DESC','1'),'stale')
+        with pytest.raises(CacliError,match='DEVICE NOT FOUND'):
+            m.get_status(1)
+        assert m.metadata_cache_stats()['entries'] == 0
+
+
+def test_disabled(exe):
+    with MCM(exe=exe) as m:
+        m.get_description(1)
+        m.get_description(1)
+        assert commands(m,'DESC') == 2
+        assert m.metadata_cache_stats() is None
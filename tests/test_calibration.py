@@ -0,0 +1,95 @@
+#
+# Python library for Janssen MCM controller
+# Tests: step-response calibration store
+#
+
+import pytest
+
+from pyjanssen.calibration import CalibrationStore
+from pyjanssen.janssen_mcm import MCM, FORWARD, BACKWARD
+
+AXIS = (None,'1','1')
+
+
+def settings(temperature=293):
+    return {'profile':'PROFILE1','temperature':temperature,'frequency':100,'step_size':100}
+
+
+def test_fit_and_predict():
+    store = CalibrationStore()
+    assert store.model(AXIS,settings(),FORWARD) is None
+    store.record(AXIS,settings(),FORWARD,10,100)
+    store.record(AXIS,settings(),FORWARD,20,200)
+    model = store.model(AXIS,settings(),FORWARD)
+    assert model['COUNTS_PER_STEP'] == pytest.approx(10) and model['N'] == 2
+    assert model['RESIDUAL'] == pytest.approx(0) and not model['INTERPOLATED']
+    assert store.predict_steps(AXIS,settings(),FORWARD,500) == 50
+    assert store.predict_displacement(AXIS,settings(),FORWARD,3) == pytest.approx(30)
+    assert store.model(AXIS,settings(),BACKWARD) is None
+
+
+def test_interpolates_temperature():
+    store = CalibrationStore()
+    store.record(AXIS,settings(4),FORWARD,10,20)
+    store.record(AXIS,settings(293),FORWARD,10,100)
+    model = store.model(AXIS,settings(148.5),FORWARD)
+    assert model['INTERPOLATED'] and model['COUNTS_PER_STEP'] == pytest.approx(6)
+    assert store.model(AXIS,settings(300),FORWARD)['COUNTS_PER_STEP'] == pytest.approx(10)
+
+
+def test_persists(tmp_path):
+    path = str(tmp_path / 'calibration.sqlite')
+    store = CalibrationStore(path)
+    store.record(AXIS,settings(),FORWARD,10,100)
+    store.close()
+    store = CalibrationStore(path)
+    assert store.model(AXIS,settings(),FORWARD)['COUNTS_PER_STEP'] == pytest.approx(10)
+    store.forget(AXIS)
+    assert store.model(AXIS,settings(),FORWARD) is None
+
+
+def test_learns_between_reads():
+    store = CalibrationStore()
+    store.moved(AXIS,settings(),FORWARD,10) # no reading yet: nothing to measure from
+    store.observed(AXIS,0)
+    store.moved(AXIS,settings(),FORWARD,10)
+    store.moved(AXIS,settings(),FORWARD,10)
+    store.observed(AXIS,200)
+    assert store.model(AXIS,settings(),FORWARD)['N'] == 1
+    # mixed settings, an interrupted move and a counter reset teach nothing
+    store.moved(AXIS,settings(),FORWARD,10)
+    store.moved(AXIS,settings(4),FORWARD,10)
+    store.observed(AXIS,400)
+    store.moved(AXIS,settings(),FORWARD,10)
+    store.interrupted(AXIS)
+    store.observed(AXIS,450)
+    store.interrupted(AXIS,0)
+    store.moved(AXIS,settings(),BACKWARD,10)
+    store.observed(AXIS,-100)
+    assert store.model(AXIS,settings(),FORWARD)['N'] == 1
+    assert store.model(AXIS,settings(),BACKWARD)['COUNTS_PER_STEP'] == pytest.approx(-10)
+
+
+def test_mcm_learns_from_moves(exe):
+    with MCM(exe=exe,estimator=True) as m:
+        m.get_position(1,1)
+        m.move(1,FORWARD,1,steps=20)
+        m.get_position(1,1)
+        assert m.predict_steps(1,300) == (FORWARD,30)
+        # move_to and the estimator use the same fit
+        assert m.move_to(1,500,0)['ITERATIONS'] == 1
+        m.move(1,FORWARD,1,steps=10)
+        assert m.estimate_position(1,1)[0] == pytest.approx(600)
+        m.stop(1)
+        m.get_position(1,1)
+        assert m.calibration.model(m._axis(1,1),m.settings(1),FORWARD)['N'] == 2
+
+
+def test_shared_store(exe,tmp_path):
+    path = str(tmp_path / 'calibration.sqlite')
+    with MCM(exe=exe,calibration=path) as m:
+        m.get_position(1,1)
+        m.move(1,FORWARD,1,steps=20)
+        m.get_position(1,1)
+    with MCM(exe=exe,calibration=path) as m:
+        assert m.predict_steps(1,100) == (FORWARD,10)
@@ -0,0 +1,95 @@
+#
+# Python library for Janssen MCM controller
+# Tests: coalescing identical read-only queries
+#
+
+import threading
+
+import pytest
+
+from pyjanssen.errors import CacliTimeout
+from pyjanssen.janssen_mcm import MCM, FORWARD
+from pyjanssen.singleflight import SingleFlight
+
+
+def lead(singleflight,key,result):
+    '''
+    returns: (release Event, thread running the leading call of key)
+    '''
+    started,release = threading.Event(),threading.Event()
+    def fn():
+        started.set()
+        release.wait(5)
+        return result
+    thread = threading.Thread(target=singleflight.do,args=(key,fn))
+    thread.start()
+    assert started.wait(5)
+    return release,thread
+
+
+def test_joiners_share_one_execution():
+    singleflight = SingleFlight()
+    release,thread = lead(singleflight,'POS',1)
+    results = []
+    joiners = [threading.Thread(target=lambda: results.append(singleflight.do('POS',lambda: 2))) for _ in range(4)]
+    for joiner in joiners:
+        joiner.start()
+    while singleflight.coalesced < 4:
+        threading.Event().wait(0.001)
+    release.set()
+    for joiner in joiners + [thread]:
+        joiner.join()
+    assert results == [1] * 4
+    assert singleflight.stats()['executed'] == 1
+
+
+def test_invalidate_starts_new_generation():
+    singleflight = SingleFlight(freshness=60)
+    release,thread = lead(singleflight,'POS',1)
+    singleflight.invalidate()
+    # started after the change: must not join the read in flight
+    assert singleflight.do('POS',lambda: 2) == 2
+    release.set()
+    thread.join()
+    # the stale result is not kept for reuse either
+    assert singleflight.do('POS',lambda: 3) == 2
+    assert singleflight.reused == 1
+
+
+def test_joiner_timeout():
+    singleflight = SingleFlight()
+    release,thread = lead(singleflight,'POS',1)
+    with pytest.raises(CacliTimeout,match='shared query'):
+        singleflight.do('POS',lambda: 2,timeout=0.05)
+    release.set()
+    thread.join()
+
+
+def test_mcm_coalesces_concurrent_reads(fake):
+    with MCM(exe=fake(latency=0.2),coalesce=True) as m:
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(m.get_position(1,1))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [0] * 5
+        stats = m.coalesce_stats()
+        assert stats['coalesced'] >= 1
+        assert stats['executed'] + stats['coalesced'] == 5
+
+
+def test_read_after_move_is_fresh(fake):
+    with MCM(exe=fake(latency=0.1),coalesce=10.0) as m:
+        assert m.get_position(1,1) == 0
+        m.move(1,FORWARD,1,steps=10)
+        assert m.get_position(1,1) == 100
+
+
+def test_read_during_move_not_reused(fake):
+    with MCM(exe=fake(latency=0.2),coalesce=10.0,dispatcher=True) as m:
+        before = threading.Thread(target=m.get_position,args=(1,1))
+        before.start()
+        m.move(1,FORWARD,1,steps=10)
+        before.join()
+        assert m.get_position(1,1) == 100
@@ -0,0 +1,116 @@
+#
+# Python library for Janssen MCM controller
+# Tests: timeouts, deadlines and retries
+#
+
+import threading
+import time
+
+import pytest
+
+from pyjanssen.errors import CacliError, CacliTimeout
+from pyjanssen.janssen_mcm import MCM, FORWARD
+from pyjanssen.singleflight import SingleFlight
+
+FAST = (0.001,0.01)
+
+
+def commands(m,command):
+    return [entry for entry in m.journal.recent() if entry.command == command]
+
+
+def test_timeout(fake):
+    with MCM(exe=fake(latency=0.5),timeout=0.1,retries=0) as m:
+        start = time.monotonic()
+        with pytest.raises(CacliTimeout):
+            m.get_position(1,1)
+        assert time.monotonic() - start < 0.4
+
+
+def test_deadline_covers_retries(fake):
+    with MCM(exe=fake(latency=0.1),retries=10,backoff=FAST) as m:
+        start = time.monotonic()
+        with pytest.raises(CacliTimeout):
+            with m.deadline(0.25):
+                while True:
+                    m.get_position(1,1)
+        assert time.monotonic() - start < 0.4
+
+
+def test_nested_deadline_keeps_earliest(fake):
+    with MCM(exe=fake(latency=0.2),retries=0) as m:
+        with m.deadline(0.1):
+            with m.deadline(10):
+                with pytest.raises(CacliTimeout):
+                    m.get_position(1,1)
+
+
+def test_expired_deadline_sends_nothing(exe):
+    with MCM(exe=exe) as m:
+        with m.deadline(0):
+            with pytest.raises(CacliTimeout,match='deadline expired'):
+                m.get_position(1,1)
+        assert m.journal.recent() == []
+
+
+def test_reads_are_retried(fake):
+    with MCM(exe=fake(fail={'POS':'ERROR: DEVICE NOT FOUND'}),retries=2,backoff=FAST) as m:
+        with pytest.raises(CacliError,match='DEVICE NOT FOUND'):
+            m.get_position(1,1)
+        assert len(commands(m,'POS')) == 3
+        with m.deadline(retries=0):
+            with pytest.raises(CacliError):
+                m.get_position(1,1)
+        assert len(commands(m,'POS')) == 4
+
+
+def test_transient_errors_recover(fake):
+    with MCM(exe=fake(error_rate=0.3),retries=20,backoff=FAST) as m:
+        for _ in range(10):
+            assert m.get_position(1,1) == 0
+
+
+def test_writes_not_retried_by_default(fake):
+    with MCM(exe=fake(fail={'MOV':'ERROR: DEVICE NOT FOUND'}),retries=2,backoff=FAST) as m:
+        with pytest.raises(CacliError):
+            m.move(1,FORWARD,1)
+        assert len(commands(m,'MOV')) == 1
+        with m.deadline(retry_writes=True):
+            with pytest.raises(CacliError):
+                m.move(1,FORWARD,1)
+        assert len(commands(m,'MOV')) == 4
+
+
+def test_permanent_errors_not_retried(exe):
+    with MCM(exe=exe,retries=2,backoff=FAST) as m:
+        with pytest.raises(CacliError,match='NO MODULE'):
+            m.get_position(9,1)
+        assert len(commands(m,'POS')) == 1
+
+
+def test_leader_timeout_not_shared():
+    singleflight = SingleFlight()
+    started,release = threading.Event(),threading.Event()
+    def fn():
+        started.set()
+        release.wait(5)
+        raise CacliTimeout('POS 1 1 did not finish within 0.1 s')
+    errors = []
+    def leader():
+        try:
+            singleflight.do('POS',fn)
+        except CacliTimeout as e:
+            errors.append(e)
+    thread = threading.Thread(target=leader)
+    thread.start()
+    assert started.wait(5)
+    results = []
+    joiner = threading.Thread(target=lambda: results.append(singleflight.do('POS',lambda: 1)))
+    joiner.start()
+    while singleflight.coalesced < 1:
+        threading.Event().wait(0.001)
+    release.set()
+    for t in (thread,joiner):
+        t.join()
+    # the joiner had no deadline of its own: it runs the query again
+    assert len(errors) == 1 and results == [1]
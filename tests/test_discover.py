@@ -0,0 +1,27 @@
+#
+# Python library for Janssen MCM controller
+# Tests: bus discovery
+#
+
+import pytest
+
+from pyjanssen.emulator import collisions
+from pyjanssen.errors import CacliError
+from pyjanssen.janssen_mcm import MCM
+
+
+def test_discover(fake):
+    exe = fake(latency=0.02)
+    with MCM(exe=exe,retries=0) as m:
+        topology = m.discover()
+    assert sorted(address for address,channel in topology.axes()) == [1,1,1,2,2,2,3,3,3]
+    # the controller was never asked two things at once
+    assert collisions(exe) == 0
+
+
+def test_discover_unreachable_controller(fake,tmp_path):
+    path = str(tmp_path / 'topology.json')
+    with MCM(device=2,exe=fake(devices=[1]),retries=0) as m:
+        with pytest.raises(CacliError,match='DEVICE NOT FOUND'):
+            m.discover(path=path)
+    assert not (tmp_path / 'topology.json').exists()
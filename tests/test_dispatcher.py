@@ -0,0 +1,104 @@
+#
+# Python library for Janssen MCM controller
+# Tests: priority dispatcher
+#
+
+import threading
+import time
+
+import pytest
+
+from pyjanssen.dispatcher import Dispatcher, SAFETY, NORMAL, POLL, command_priority
+from pyjanssen.errors import CacliCancelled
+from pyjanssen.janssen_mcm import MCM
+
+
+@pytest.fixture
+def dispatcher():
+    dispatcher = Dispatcher()
+    yield dispatcher
+    dispatcher.close()
+
+
+def block(dispatcher):
+    '''
+    returns: Event releasing a NORMAL item that occupies the worker
+    '''
+    started,release = threading.Event(),threading.Event()
+    dispatcher.submit(lambda: started.set() or release.wait(5))
+    assert started.wait(5)
+    return release
+
+
+def test_command_priority():
+    assert command_priority(('STP','1')) == SAFETY
+    assert command_priority(('FBES',)) == SAFETY
+    assert command_priority(('MOV','1','1','1')) == NORMAL
+    assert command_priority(('POS','1','1')) == POLL
+    assert command_priority(()) == NORMAL
+
+
+def test_priority_order(dispatcher):
+    release = block(dispatcher)
+    order = []
+    futures = [dispatcher.schedule(order.append,(name,),priority=priority,controller=controller)
+            for name,priority,controller in (('poll',POLL,'b'),('normal 1',NORMAL,'a'),
+                ('safety',SAFETY,'a'),('normal 2',NORMAL,'a'))]
+    release.set()
+    for future in futures:
+        future.result(5)
+    assert order == ['safety','normal 1','normal 2','poll']
+
+
+def test_safety_cancels_polls_of_its_controller(dispatcher):
+    release = block(dispatcher)
+    mine = dispatcher.schedule(time.sleep,(0,),priority=POLL,controller='a')
+    other = dispatcher.schedule(time.sleep,(0,),priority=POLL,controller='b')
+    stop = dispatcher.schedule(time.sleep,(0,),priority=SAFETY,controller='a')
+    release.set()
+    with pytest.raises(CacliCancelled):
+        mine.result(5)
+    other.result(5)
+    stop.result(5)
+    assert dispatcher.stats()['cancelled'] == 1
+
+
+def test_cancel_polls_disabled():
+    dispatcher = Dispatcher(cancel_polls=False)
+    try:
+        release = block(dispatcher)
+        poll = dispatcher.schedule(time.sleep,(0,),priority=POLL,controller='a')
+        dispatcher.schedule(time.sleep,(0,),priority=SAFETY,controller='a')
+        release.set()
+        poll.result(5)
+    finally:
+        dispatcher.close()
+
+
+def test_inline_from_worker(dispatcher):
+    assert dispatcher.submit(lambda: dispatcher.submit(lambda: 42).result(0)).result(5) == 42
+
+
+def test_stop_cancels_queued_reads(fake):
+    with MCM(exe=fake(latency=0.2),dispatcher=True) as m:
+        busy = m.submit('DESC','1')
+        time.sleep(0.05)
+        reads = [m.submit('POS','1',str(channel)) for channel in (1,2)]
+        assert m.stop(1)['STATUS'] == 'OK'
+        for read in reads:
+            with pytest.raises(CacliCancelled,match='cancelled by a stop command'):
+                read.result(5)
+        busy.result(5)
+        assert m.scheduler_stats()['cancelled'] == 2
+
+
+def test_threads_share_controller(fake):
+    with MCM(exe=fake(latency=0.01),dispatcher=True) as m:
+        results = []
+        threads = [threading.Thread(target=lambda channel=channel: results.append(m.get_position(1,channel)))
+                for channel in (1,2,3,1,2,3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [0] * 6
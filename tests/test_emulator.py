@@ -0,0 +1,47 @@
+#
+# Python library for Janssen MCM controller
+# Tests: the emulated cacli itself
+#
+
+import subprocess
+import threading
+
+import pyjanssen.emulator
+from pyjanssen.janssen_mcm import MCM, FORWARD
+
+
+def test_state_persists_across_processes(exe):
+    with MCM(exe=exe) as m:
+        m.move(1,FORWARD,2,steps=5)
+    with MCM(exe=exe) as m:
+        assert m.get_position(1,2) == 50
+    pyjanssen.emulator.reset(exe)
+    with MCM(exe=exe) as m:
+        assert m.get_position(1,2) == 0
+
+
+def test_exclusive_controller(fake):
+    exe = fake(latency=0.6)
+    busy = threading.Thread(target=subprocess.run,args=([exe,'@1','DESC','1'],),kwargs={'capture_output':True})
+    busy.start()
+    try:
+        threading.Event().wait(0.3)
+        refused = subprocess.run([exe,'@1','DESC','1'],capture_output=True,universal_newlines=True)
+        other = subprocess.run([exe,'@2','DESC','1'],capture_output=True,universal_newlines=True)
+    finally:
+        busy.join()
+    assert other.returncode == 0
+    assert (refused.returncode,refused.stdout.strip()) == (1,'ERROR: DEVICE NOT FOUND')
+    assert pyjanssen.emulator.collisions(exe) == 1
+
+
+def test_shared_controller(fake):
+    exe = fake(latency=0.6,exclusive=False)
+    busy = threading.Thread(target=subprocess.run,args=([exe,'DESC','1'],),kwargs={'capture_output':True})
+    busy.start()
+    try:
+        threading.Event().wait(0.3)
+        assert subprocess.run([exe,'DESC','1'],capture_output=True).returncode == 0
+    finally:
+        busy.join()
+    assert pyjanssen.emulator.collisions(exe) == 0
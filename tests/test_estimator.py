@@ -0,0 +1,64 @@
+#
+# Python library for Janssen MCM controller
+# Tests: dead-reckoning position estimator
+#
+
+import math
+
+import pytest
+
+from pyjanssen.errors import CacliError
+from pyjanssen.estimator import PositionEstimator
+from pyjanssen.janssen_mcm import MCM, FORWARD
+
+
+def test_estimator_after_reset(exe):
+    with MCM(exe=exe,estimator=True) as m:
+        m.get_position(1,1)
+        m.move(1,FORWARD,1,steps=20)
+        assert m.get_position(1,1) == 200
+        m.reset_position(1,1)
+        position,uncertainty = m.estimate_position(1,1)
+        assert position == 0 and uncertainty < 1
+        m.move(1,FORWARD,1,steps=10)
+        position,uncertainty = m.estimate_position(1,1)
+        assert position == pytest.approx(100) and uncertainty < 100
+        assert m.get_position(1,1) == 100
+
+
+def learned(m):
+    m.get_position(1,1)
+    m.move(1,FORWARD,1,steps=10)
+    m.get_position(1,1)
+    m.move(1,FORWARD,1,steps=10)
+    m.get_position(1,1)
+
+
+def test_stop_forgets(exe):
+    with MCM(exe=exe,estimator=True) as m:
+        learned(m)
+        m.move(1,FORWARD,1,steps=10)
+        assert m.estimate_position(1,1)[1] < 100
+        m.stop(1)
+        assert m.estimate_position(1,1) is None
+        assert m.get_position(1,1,tolerance=1000) == 300
+
+
+def test_failed_move_forgets(fake):
+    with MCM(exe=fake(fail={'MOV':'ERROR: NO MODULE AT ADDRESS 1'}),estimator=True,retries=0) as m:
+        m.get_position(1,1)
+        with pytest.raises(CacliError):
+            m.move(1,FORWARD,1,steps=10)
+        assert m.estimate_position(1,1) is None
+
+
+def test_drift():
+    now = [0.0]
+    estimator = PositionEstimator(clock=lambda: now[0])
+    estimator.observed(('1','1'),100)
+    assert estimator.estimate(('1','1')) == (100,0)
+    now[0] = 4.0
+    assert estimator.estimate(('1','1'))[1] == pytest.approx(2.0)
+    assert estimator.within(('1','1'),1) is None
+    estimator.moved(('1','1'),1,10,None)
+    assert estimator.estimate(('1','1'))[1] == math.inf
@@ -0,0 +1,47 @@
+#
+# Python library for Janssen MCM controller
+# Tests: multi-controller fleet
+#
+
+import time
+
+import pytest
+
+import pyjanssen.emulator
+from pyjanssen.errors import CacliError
+from pyjanssen.fleet import Fleet
+from pyjanssen.janssen_mcm import FORWARD
+
+
+def test_routes_by_axis(exe):
+    with Fleet([1,2],axes=[(1,1,1),(2,1,1)],exe=exe) as fleet:
+        fleet.move((1,1,1),FORWARD,steps=10)
+        assert fleet.read_all_positions() == {(1,1,1):100,(2,1,1):0}
+        assert fleet.map(lambda mcm: mcm.get_status(1)['STATUS']) == {1:'OK',2:'OK'}
+
+
+def test_stop_all_overtakes_queued_work(fake):
+    exe = fake(latency=0.2)
+    with Fleet([1,2],axes=[(1,1,1),(2,1,1)],exe=exe) as fleet:
+        busy = [fleet.submit(1,'get_status',1) for _ in range(4)]
+        time.sleep(0.05)
+        start = time.monotonic()
+        stops = fleet.stop_all()
+        # after the command in progress, not after the whole queue
+        assert time.monotonic() - start < 0.6
+        assert {device:[reply['STATUS'] for reply in replies] for device,replies in stops.items()} == {1:['OK'],2:['OK']}
+        assert not all(future.done() for future in busy)
+        for future in busy:
+            future.result(5)
+    assert pyjanssen.emulator.collisions(exe) == 0
+
+
+def test_stop_all_raises_failures(fake):
+    exe = fake(fail={'STP':'ERROR: NO MODULE AT ADDRESS 1'})
+    with Fleet([1],exe=exe) as fleet:
+        with pytest.raises(CacliError,match='NO MODULE'):
+            fleet.stop_all([1,2])
+        # every address was still tried
+        assert [entry.command for entry in fleet[1].journal.recent()] == ['STP','STP']
+        replies = fleet.stop_all([1],return_exceptions=True)
+        assert isinstance(replies[1][0],CacliError)
@@ -0,0 +1,87 @@
+#
+# Python library for Janssen MCM controller
+# Tests: command journal and latency histograms
+#
+
+import asyncio
+
+import pytest
+
+from pyjanssen.async_mcm import AsyncMCM
+from pyjanssen.errors import CacliError, CacliTimeout
+from pyjanssen.janssen_mcm import MCM
+from pyjanssen.journal import CommandJournal, LatencyHistogram
+
+
+def test_entries_and_stats(exe):
+    with MCM(exe=exe) as m:
+        for i in range(3):
+            m.get_position(1,1)
+        entries = m.journal.recent()
+        assert [entry.command for entry in entries] == ['POS'] * 3
+        assert all(entry.outcome == 'ok' and entry.returncode == 0 for entry in entries)
+        assert all(entry.wait is not None and entry.parse is not None for entry in entries)
+        stats = m.journal.stats()['POS']
+        assert stats['count'] == 3 and stats['errors'] == 0
+
+
+def test_timeout_counts_in_full(fake):
+    # a command that never replied is recorded with the time it took to give up
+    with MCM(exe=fake(latency=0.5),timeout=0.2,retries=0) as m:
+        with pytest.raises(CacliTimeout):
+            m.get_position(1,1)
+        entry = m.journal.recent(1)[0]
+        assert entry.outcome == 'error'
+        assert entry.total() >= 0.2
+        stats = m.journal.stats()['POS']
+        assert stats['errors'] == 1
+        assert stats['p99'] >= 0.2
+
+
+def test_async_timeout_counts_in_full(fake):
+    async def main():
+        async with AsyncMCM(exe=fake(latency=0.5),timeout=0.2,retries=0) as m:
+            with pytest.raises(CacliTimeout):
+                await m.get_position(1,1)
+            return m.journal.recent(1)[0]
+    entry = asyncio.run(main())
+    assert entry.outcome == 'error'
+    assert entry.total() >= 0.2
+
+
+def test_error_reply(fake):
+    with MCM(exe=fake(fail={'POS':'ERROR: UNKNOWN COMMAND'}),retries=0) as m:
+        with pytest.raises(CacliError):
+            m.get_position(1,1)
+        entry = m.journal.recent(1)[0]
+        assert entry.outcome == 'error' and entry.returncode != 0
+
+
+def test_ring_and_hooks(exe):
+    seen = []
+    def broken(entry):
+        raise ValueError('ignored')
+    journal = CommandJournal(2)
+    journal.add_hook(seen.append)
+    journal.add_hook(broken)
+    with MCM(exe=exe,journal=journal) as m:
+        m.get_position(1,1)
+        m.get_position(1,2)
+        m.get_status(1)
+        assert m.journal is journal
+    assert [entry.command for entry in journal.recent()] == ['POS','STS']
+    assert len(seen) == 3
+    assert journal.stats()['POS']['count'] == 2
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for i in range(99):
+        histogram.add(0.001)
+    histogram.add(1.0,error=True)
+    summary = histogram.summary()
+    assert summary['count'] == 100 and summary['errors'] == 1
+    assert summary['p50'] <= 0.0015
+    assert summary['p99'] <= 0.0015
+    assert summary['max'] == 1.0
+    assert LatencyHistogram().percentile(50) is None
@@ -0,0 +1,29 @@
+#
+# Python library for Janssen MCM controller
+# Tests: closed-loop move_to
+#
+
+import pytest
+
+from pyjanssen.janssen_mcm import MCM
+
+
+@pytest.mark.parametrize('target',[370,-240])
+def test_move_to(exe,target):
+    with MCM(exe=exe) as m:
+        reply = m.move_to(1,target,5)
+        assert reply['CONVERGED'] and reply['ABORTED'] is None
+        assert abs(m.get_position(1,1) - target) <= 5
+
+
+def test_move_to_noisy(fake):
+    with MCM(exe=fake(noise=0.2)) as m:
+        assert m.move_to(1,500,10,max_iterations=40)['CONVERGED']
+
+
+@pytest.mark.parametrize('counts_per_step,reason',[(-10.0,'encoder moved against the commanded direction'),(0.0,'stalled')])
+def test_move_to_aborts(fake,counts_per_step,reason):
+    with MCM(exe=fake(counts_per_step=counts_per_step)) as m:
+        reply = m.move_to(1,500,5)
+        assert not reply['CONVERGED']
+        assert reply['ABORTED'] == reason
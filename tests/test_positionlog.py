@@ -0,0 +1,56 @@
+#
+# Python library for Janssen MCM controller
+# Tests: chunked position logs
+#
+
+import os
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from pyjanssen.janssen_mcm import MCM, FORWARD
+from pyjanssen.positionlog import NO_DEVICE, PositionLogReader, PositionLogWriter
+
+
+def test_chunks_and_slices(tmp_path):
+    path = str(tmp_path / 'log')
+    with PositionLogWriter(path,chunk_rows=4,device=3) as writer:
+        for i in range(10):
+            writer.append(float(i),1,1 + i % 2,i * 10)
+        assert writer.chunks == 2 # the last two rows are still in memory
+    reader = PositionLogReader(path)
+    assert len(reader) == 10 and reader.time_range() == (0.0,9.0)
+    assert sorted(os.listdir(path)) == ['chunk-00000000.npy','chunk-00000001.npy','chunk-00000002.npy']
+    rows = reader.slice(3,7)
+    assert list(rows['time']) == [3.0,4.0,5.0,6.0] and set(rows['device']) == {3}
+    assert list(reader.slice(channel=2)['POS']) == [10,30,50,70,90]
+    assert len(reader.slice(20)) == 0
+    # chunks outside the range are not touched
+    assert [len(rows) for rows in reader.chunks(5,6)] == [1]
+
+
+def test_continues_and_cleans_up(tmp_path):
+    path = str(tmp_path / 'log')
+    with PositionLogWriter(path) as writer:
+        writer.append(1.0,1,1,10)
+    open(os.path.join(path,'chunk-00000001.npy.tmp'),'wb').close()
+    reader = PositionLogReader(path)
+    with PositionLogWriter(path) as writer:
+        assert not any(name.endswith('.tmp') for name in os.listdir(path))
+        writer.append(2.0,1,1,20)
+    assert len(reader) == 1
+    reader.refresh()
+    assert list(reader.slice()['POS']) == [10,20]
+    assert set(reader.slice()['device']) == {NO_DEVICE}
+
+
+def test_logs_from_controller(exe,tmp_path):
+    path = str(tmp_path / 'log')
+    with MCM(exe=exe) as m, PositionLogWriter(path,device=1) as writer:
+        writer.log_position(m,1,1)
+        m.move(1,FORWARD,1,steps=5)
+        assert writer.log_position(m,1,1)['POS'] == 50
+        writer.write_samples([(1e10,1,2,7,8)])
+    rows = PositionLogReader(path).slice()
+    assert list(rows['POS']) == [0,50,7] and rows['RVL'][-1] == 8
@@ -0,0 +1,72 @@
+#
+# Python library for Janssen MCM controller
+# Tests: compiled motion programs
+#
+
+import pytest
+
+from pyjanssen.errors import CacliError
+from pyjanssen.janssen_mcm import MCM, FORWARD, BACKWARD
+from pyjanssen.program import MotionProgram
+
+
+def test_compile_and_run(exe):
+    program = (MotionProgram().settings(1,step_size=50,steps=4)
+        .move(1,FORWARD).move(1,FORWARD).read(1)
+        .move(1,BACKWARD,steps=2).read(1).status(1))
+    compiled = program.compile()
+    # identical moves and reads share one argument tuple
+    assert len(compiled) == 6 and compiled.unique == 4
+    assert compiled.ops[0][1] == ('MOV','1','1','PROFILE1','293','1','100','50','4')
+    assert compiled.ops[0][1] is compiled.ops[1][1]
+    with MCM(exe=exe) as m:
+        result = compiled.run(m)
+        # the program does not touch the MCM's own settings
+        assert m.step_size(1) == 100
+    assert [step for step,reply in result['RESULTS']] == [3,5,6]
+    assert [reply['POS'] for step,reply in result['RESULTS'][:2]] == [40,30]
+    assert result['STEPS'] == 6
+
+
+def test_settings_from_mcm(exe):
+    with MCM(exe=exe) as m:
+        m.set_frequency(1,300)
+        compiled = MotionProgram().move(1,FORWARD).compile(m)
+    assert compiled.ops[0][1][6] == '300'
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'recipe.json')
+    program = MotionProgram().move(2,BACKWARD,channel=3,steps=10).wait(0.01).read(2,3)
+    program.save(path)
+    loaded = MotionProgram.load(path)
+    assert loaded.steps == program.steps
+    assert loaded.compile().ops == program.compile().ops
+
+
+@pytest.mark.parametrize('program,message',[
+    (MotionProgram().move(1,FORWARD,frequency=1000),'step 0 \\(move\\): frequency 1000 outside'),
+    (MotionProgram().read(1).move(1,2),'step 1 \\(move\\): direction'),
+    (MotionProgram().servodrive_go_to(1,2,3),'servodrive is disabled'),
+    (MotionProgram().servodrive_enable().read(1),'servodrive is enabled'),
+    (MotionProgram().wait(-1),'negative wait'),
+    (MotionProgram([{'op':'jump'}]),'unknown step'),
+    ])
+def test_invalid(program,message):
+    with pytest.raises(CacliError,match=message):
+        program.compile()
+
+
+def test_servodrive_program(fake):
+    program = (MotionProgram().servodrive_enable().servodrive_go_to(100,0,0)
+        .servodrive_wait(tolerance=1,timeout=5).servodrive_disable())
+    compiled = program.compile()
+    assert not compiled.servodrive and not compiled.end_servodrive
+    with MCM(exe=fake(settle_time=0.1)) as m:
+        result = compiled.run(m)
+        assert not m.servodrive_enabled()
+        m.enable_servodrive()
+        with pytest.raises(CacliError,match='compiled for servodrive disabled'):
+            compiled.run(m)
+    step,settled = result['RESULTS'][0]
+    assert step == 2 and settled['SETTLED']
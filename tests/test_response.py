@@ -0,0 +1,42 @@
+#
+# Python library for Janssen MCM controller
+# Tests: reply parsing
+#
+
+import json
+import pickle
+
+import pytest
+
+import pyjanssen.response
+from pyjanssen.errors import CacliError
+from pyjanssen.janssen_mcm import MCM
+
+
+def test_parse_replies(exe):
+    with MCM(exe=exe) as m:
+        status = m.get_status(1)
+        assert status['STATUS'] == 'OK'
+        assert status == dict(status)
+        assert 'STATUS' in status and 'MISSING' not in status
+        assert m.get_information(1,'1')['TYPE'] == 'CLA2201'
+
+
+def test_record_attributes():
+    status = pyjanssen.response.parse('STS','FAILSAFE STATE : 0x0\nSTATUS : OK\nEXTRA : a:b')
+    assert (status.FAILSAFE_STATE,status.STATUS) == ('0x0','OK')
+    assert status['EXTRA'] == 'a:b'
+    assert pyjanssen.response.parse('STS','STATUS : OK').FAILSAFE_STATE is None
+
+
+def test_records_serialise(exe):
+    with MCM(exe=exe) as m:
+        replies = [m.get_status(1),m.submit('POS','1','1').result()]
+    assert pickle.loads(pickle.dumps(replies)) == replies
+    assert type(pickle.loads(pickle.dumps(replies[1]))) is type(replies[1])
+    assert json.loads(json.dumps(replies)) == [{'FAILSAFE STATE':'0x0','STATUS':'OK'},{'POS':0,'RVL':0}]
+
+
+def test_malformed_value():
+    with pytest.raises(CacliError,match='malformed'):
+        pyjanssen.response.parse('POS','POS : twelve\n')
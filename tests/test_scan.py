@@ -0,0 +1,47 @@
+#
+# Python library for Janssen MCM controller
+# Tests: raster scans
+#
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from pyjanssen.janssen_mcm import MCM
+from pyjanssen.scan import RasterScan, grid_order
+
+
+def test_grid_order():
+    assert grid_order(3,2) == [(0,0),(0,1),(0,2),(1,2),(1,1),(1,0)]
+    assert grid_order(3,2,snake=False) == [(0,0),(0,1),(0,2),(1,0),(1,1),(1,2)]
+
+
+def test_scan(exe):
+    xs,ys = range(0,500,100),range(0,300,100)
+    seen = []
+    def acquire(i,j,x,y):
+        seen.append((i,j))
+        return x + y
+    with MCM(exe=exe) as m:
+        result = RasterScan(m,(1,1),(2,1),xs,ys,acquire,tolerance=5).run()
+        assert result['POINTS'] == 15 and result['FAILED'] == 0
+        assert seen == grid_order(5,3)
+        assert result['DATA'][2][4] == 600
+        assert numpy.all(numpy.abs(result['POSITIONS'][:,:,0] - numpy.array(xs)) <= 5)
+        assert numpy.all(numpy.abs(result['POSITIONS'][:,:,1] - numpy.array(ys)[:,None]) <= 5)
+        # the last reads match where the stages are
+        assert abs(m.get_position(1,1) - 400) <= 5 and abs(m.get_position(2,1) - 200) <= 5
+
+
+def test_scan_round_trips(exe):
+    with MCM(exe=exe) as m:
+        RasterScan(m,(1,1),(2,1),range(0,500,100),range(0,300,100),lambda i,j,x,y: None,tolerance=5).run()
+        entries = m.journal.recent()
+    def count(command,address):
+        return sum(1 for entry in entries if entry.command == command and entry.argv[entry.argv.index(command,1) + 1] == address)
+    # positions are carried from point to point: only the first point reads
+    # before moving, every other POS follows a MOV
+    assert count('POS','1') == count('MOV','1') + 1
+    assert count('POS','2') == count('MOV','2') + 1
+    # y only moves on the two row changes (plus probing bursts)
+    assert 2 <= count('MOV','2') <= 4
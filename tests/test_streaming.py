@@ -0,0 +1,61 @@
+#
+# Python library for Janssen MCM controller
+# Tests: position streaming
+#
+
+import time
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from pyjanssen.janssen_mcm import MCM, FORWARD
+from pyjanssen.streaming import PositionSampler, RingBuffer
+
+
+def test_ring_buffer():
+    buffer = RingBuffer(4)
+    for i in range(6):
+        buffer.append((i,1,1,i,i))
+    rows,cursor,dropped = buffer.read(0)
+    assert list(rows['POS']) == [2,3,4,5] and cursor == 6 and dropped == 2
+    assert list(buffer.latest(2)['POS']) == [4,5]
+    rows,cursor,dropped = buffer.read(6)
+    assert len(rows) == 0 and dropped == 0
+
+
+def test_sampler(exe):
+    seen = []
+    with MCM(exe=exe) as m:
+        m.move(1,FORWARD,2,steps=5)
+        with PositionSampler(m,[(1,1),(1,2)],rate=50,callback=seen.append) as sampler:
+            rows = next(sampler.samples(timeout=5))
+            time.sleep(0.2)
+        stats = sampler.stats()
+    assert set(rows['channel']) <= {1,2} and len(rows)
+    latest = sampler.buffer.latest()
+    assert set(latest[latest['channel'] == 2]['POS']) == {50}
+    assert set(latest[latest['channel'] == 1]['POS']) == {0}
+    assert stats['ticks'] >= 2 and stats['samples'] == 2 * stats['ticks']
+    assert stats['errors'] == 0 and len(seen) == stats['ticks']
+    assert not sampler.running()
+
+
+def test_sampler_counts_errors(fake):
+    with MCM(exe=fake(fail={'POS':'ERROR: NO MODULE AT ADDRESS 1'}),retries=0) as m:
+        with PositionSampler(m,[(1,1)],rate=50) as sampler:
+            time.sleep(0.2)
+    assert sampler.errors >= 1 and sampler.buffer.written == 0
+    assert sampler.last_error is not None
+
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_callback_error_stops(exe):
+    def broken(rows):
+        raise ValueError('broken callback')
+    with MCM(exe=exe) as m:
+        sampler = PositionSampler(m,[(1,1)],rate=50,callback=broken)
+        sampler.start()
+        assert list(sampler.samples(timeout=5))
+        sampler.stop()
+    assert isinstance(sampler.last_error,ValueError)
@@ -0,0 +1,53 @@
+#
+# Python library for Janssen MCM controller
+# Tests: servodrive setpoint streaming
+#
+
+import threading
+
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from pyjanssen.errors import CacliError
+from pyjanssen.janssen_mcm import MCM
+from pyjanssen.trajectory import TrajectoryStreamer
+
+
+def test_stream(fake):
+    readbacks = []
+    with MCM(exe=fake(settle_time=0.0)) as m:
+        m.enable_servodrive()
+        waypoints = numpy.column_stack([numpy.arange(6) * 100,numpy.zeros(6),numpy.zeros(6)])
+        result = TrajectoryStreamer(m,waypoints,rate=10,readback_every=2,
+                callback=lambda i,setpoint,status: readbacks.append(i)).run()
+        m.disable_servodrive()
+    assert result['WAYPOINTS'] == 6 and result['SKIPPED'] == 0
+    assert result['SETPOINTS'][:,0].tolist() == [0,100,200,300,400,500]
+    assert readbacks == [1,3,5]
+    # read back after every second setpoint only
+    assert numpy.isnan(result['TRACKING'][0,0]) and not numpy.isnan(result['TRACKING'][1,0])
+    assert result['JITTER']['max'] < 0.1 and 0.5 <= result['TIME']
+
+
+def test_skip_late(fake):
+    with MCM(exe=fake(latency=0.1,settle_time=0.0)) as m:
+        m.enable_servodrive()
+        result = TrajectoryStreamer(m,[(i,0,0) for i in range(5)],rate=50,readback_every=0,skip_late=True).run()
+    # each FBCS takes longer than several slots, so waypoints are dropped
+    assert result['SKIPPED'] > 0 and result['WAYPOINTS'] + result['SKIPPED'] == 5
+    assert result['TRACKING_RMS'] == [None,None,None]
+
+
+def test_stop_from_another_thread(fake):
+    with MCM(exe=fake(settle_time=0.0)) as m:
+        m.enable_servodrive()
+        streamer = TrajectoryStreamer(m,((i,0,0) for i in range(1000)),rate=50,readback_every=0)
+        threading.Timer(0.2,streamer.stop).start()
+        assert streamer.run()['WAYPOINTS'] < 100
+
+
+def test_requires_servodrive(exe):
+    with MCM(exe=exe) as m:
+        with pytest.raises(CacliError):
+            TrajectoryStreamer(m,[(0,0,0)],rate=10).run()
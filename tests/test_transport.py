@@ -0,0 +1,53 @@
+#
+# Python library for Janssen MCM controller
+# Tests: command transports
+#
+
+import pytest
+
+import pyjanssen.transport
+from pyjanssen.errors import CacliError, CacliTimeout
+from pyjanssen.janssen_mcm import MCM, FORWARD
+
+
+def test_round_trip(exe):
+    with MCM(exe=exe) as m:
+        assert m.get_position(1,1) == 0
+        assert m.move(1,FORWARD,1,steps=10)['STATUS'] == 'OK'
+        assert m.get_position(1,1) == 100
+        assert m.get_status(1)['STATUS'] == 'OK'
+
+
+def test_error_reply(exe):
+    with MCM(exe=exe) as m:
+        with pytest.raises(CacliError,match='NO MODULE'):
+            m.get_position(9,1)
+
+
+def test_spawn_timeout_kills(fake):
+    transport = pyjanssen.transport.SpawnTransport(fake(latency=0.5))
+    with pytest.raises(CacliTimeout):
+        transport.run(['@1'],['POS','1','1'],timeout=0.1)
+    # the killed process no longer holds the controller
+    assert transport.run(['@1'],['STS','1'],timeout=5).returncode == 0
+
+
+def test_unknown_transport(exe):
+    with pytest.raises(CacliError,match='unknown transport'):
+        MCM(exe=exe,transport='session')
+
+
+def test_custom_transport_without_close(exe):
+    class Transport:
+        def __init__(self,exe):
+            self.spawn = pyjanssen.transport.SpawnTransport(exe)
+            self.commands = []
+
+        def run(self,target,command_list,timeout=None):
+            self.commands.append(list(command_list))
+            return self.spawn.run(target,command_list,timeout)
+
+    transport = Transport(exe)
+    with MCM(exe=exe,transport=transport) as m:
+        assert m.get_position(1,1) == 0
+    assert transport.commands == [['POS','1','1']]
@@ -0,0 +1,15 @@
+#
+# Python library for Janssen MCM controller
+# Tests: waiting for motion to end
+#
+
+from pyjanssen.janssen_mcm import MCM
+
+
+def test_wait_until_stopped(exe):
+    with MCM(exe=exe) as m:
+        m.set_frequency(1,10)
+        reply = m.wait_until_stopped(1,1,timeout=5)
+        assert reply['STOPPED'] and reply['POS'] == 0
+        # POS must hold for a whole step period (0.1 s at 10 Hz)
+        assert reply['TIME'] >= 0.1